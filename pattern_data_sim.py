@@ -9,13 +9,20 @@
 
 """
 import argparse
+import copy
+import json
 import sys
 import shutil
+import time
 from pathlib import Path
 
 # My modules
 import pygarment.data_config as data_config
 import pygarment.meshgen.datasim_utils as sim
+from pygarment.meshgen.simulation import warm_up
+from pygarment.meshgen.sharding import ShardManifest
+from pygarment.data_index import DatasetIndex
+from pygarment.meshgen.render.contact_sheet import paged_contact_sheets
 
 
 def get_command_args():
@@ -29,29 +36,167 @@ def get_command_args():
     parser.add_argument('--default_body', action='store_true', help='run dataset on default body')
     parser.add_argument('--caching', action='store_true', help='cache intermediate simulation')
     parser.add_argument('--rewrite_config', action='store_true', help='cache intermediate simulation')
+    parser.add_argument(
+        '--warm_up', action='store_true', 
+        help='only compile simulation kernels into the warp kernel cache and exit')
+    parser.add_argument(
+        '--num_shards', type=int, default=None, 
+        help='split the dataset into shards to be processed by several nodes sharing the output folder')
+    parser.add_argument(
+        '--shard', type=int, default=None, 
+        help='process only the given shard (by default, any shard available is taken)')
+    parser.add_argument(
+        '--lease_timeout', type=float, default=900., 
+        help='seconds without a heartbeat after which the shard of a node is considered abandoned')
+    parser.add_argument(
+        '--merge_shards', action='store_true', 
+        help='merge the dataset properties of the processed shards and exit')
 
     args = parser.parse_args()
     print(args)
 
     return args
 
-def gather_renders(out_data_path: Path, verbose=False):
+def gather_renders(out_data_path: Path, verbose=False, incremental=True, sheets_view=None, sheets_grid=(8, 6)):
+    """Copy the renders of all the samples to the 'renders' folder
+        * incremental -- only copy the renders that are new or changed since the last gathering. 
+            Gathered renders are tracked in renders/gathered_renders.json
+        * sheets_view -- if given, also create paged contact sheets of the renders of this view (e.g. 'front')
+            with sheets_grid (columns, rows) samples per page in renders/contact_sheets
+    """
     renders_path = out_data_path / 'renders'
     renders_path.mkdir(exist_ok=True)
 
-    render_files = list(out_data_path.glob('**/*render*.png'))
+    manifest_path = renders_path / 'gathered_renders.json'
+    gathered = {}
+    if incremental and manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            gathered = json.load(f)
+
+    index = DatasetIndex.find(out_data_path)
+    if index is not None:
+        with index:
+            render_files = [path for _, _, path, _ in index.artifacts(kind_pattern='%render%.png')]
+    else:
+        render_files = list(out_data_path.glob('**/*render*.png'))
+
+    copied = 0
     for file in render_files:
+        file = Path(file)
+        if file.parent == renders_path:
+            continue
+        stat = file.stat()
+        signature = [stat.st_mtime_ns, stat.st_size]
+        if gathered.get(file.name) == signature and (renders_path / file.name).exists():
+            continue
         try: 
             shutil.copy(str(file), str(renders_path))
+            copied += 1
         except shutil.SameFileError:
             if verbose:
                 print(f'File {file} already exists')
             pass
+        # NOTE: new renders are added to the end, s.t. contact sheet pages of the earlier ones stay the same
+        gathered[file.name] = signature
+
+    with open(manifest_path, 'w') as f:
+        json.dump(gathered, f)
+    if verbose:
+        print(f'Gathered {copied} new or updated renders ({len(gathered)} in total)')
+
+    if sheets_view is not None:
+        suffix = f'_render_{sheets_view}.png'
+        images = [
+            (name[:-len(suffix)], renders_path / name) 
+            for name in gathered if name.endswith(suffix) and (renders_path / name).exists()]
+        pages = paged_contact_sheets(
+            images, renders_path / 'contact_sheets', grid=sheets_grid, prefix=f'sheet_{sheets_view}')
+        if verbose:
+            print(f'Updated {len(pages)} contact sheet pages')
+
+
+def sim_shards(datapath, output_path, props, command_args):
+    """Process the shards of the dataset until none is left available for this node
+
+        Returns True if all the shards are finished
+    """
+    body_type = 'default_body' if command_args.default_body else 'random_body'
+    predict_costs = None
+    if 'sim' in props and sim.get_dict_default_value(props['sim']['config'], 'longest_first', False):
+        # Balance the shards by the predicted cost (used only by the node creating the manifest)
+        predict_costs = lambda names: sim._predict_costs(datapath, output_path, props, names)
+    manifest = ShardManifest.load_or_create(
+        output_path, body_type, sim._get_pattern_names(datapath), command_args.num_shards, 
+        predict_costs=predict_costs)
+
+    while True:
+        lease = manifest.acquire(command_args.shard, lease_timeout=command_args.lease_timeout)
+        if lease is None:
+            if command_args.shard is not None or manifest.all_done():
+                break
+            # Wait for the stragglers: their shards are picked up if their nodes die
+            time.sleep(command_args.lease_timeout / 10)
+            continue
+
+        with lease:
+            print(f'Processing shard {lease.shard_id} of {manifest.num_shards}')
+            shard_props_file = manifest.props_path(lease.shard_id)
+            if shard_props_file.exists():
+                shard_props = data_config.Properties(shard_props_file)
+            else:
+                shard_props = copy.deepcopy(props)   # With the requested config
+            # Costs predicted for the manifest are reused
+            pattern_costs = manifest.costs or sim._pattern_costs(
+                datapath, output_path, shard_props, manifest.shards[lease.shard_id])
+            finished = sim.batch_sim(
+                datapath, 
+                output_path, 
+                shard_props,
+                run_default_body=command_args.default_body,
+                num_samples=command_args.minibatch,
+                caching=command_args.caching, 
+                force_restart=False,
+                pattern_names=manifest.shards[lease.shard_id], 
+                props_file=shard_props_file,
+                index_file=manifest.index_path(lease.shard_id),
+                lease=lease,
+                pattern_costs=pattern_costs)
+            if finished:
+                finished = sim.resim_fails(
+                    datapath, 
+                    output_path, 
+                    shard_props,
+                    run_default_body=command_args.default_body,
+                    caching=command_args.caching,
+                    pattern_names=manifest.shards[lease.shard_id], 
+                    props_file=shard_props_file,
+                    index_file=manifest.index_path(lease.shard_id),
+                    lease=lease,
+                    pattern_costs=pattern_costs)
+
+            if lease.lost.is_set():
+                # The shard is continued by another node
+                continue
+            shard_props.add_sys_info()
+            if not sim._serialize_props_with_sim_stats(shard_props, shard_props_file, lease):
+                continue
+            if finished and lease.is_owned():
+                manifest.mark_done(lease.shard_id)
+
+        if command_args.minibatch is not None or command_args.shard is not None:
+            break
+    
+    return manifest.all_done()
 
 
 if __name__ == "__main__":
 
     command_args = get_command_args()
+
+    if command_args.warm_up:
+        warm_up()
+        sys.exit(0)
+
     system_config = data_config.Properties('./system.json') 
 
     # ------ Dataset ------
@@ -83,14 +228,36 @@ if __name__ == "__main__":
             Path(system_config['sim_configs_path']) / command_args.config, 
             re_write=command_args.rewrite_config)    # Re-write sim config only explicitly 
 
+    # ----- Sharded processing ----------
+    if command_args.merge_shards:
+        manifest = ShardManifest.load_or_create(output_path, body_type, [])
+        merged = manifest.merge()
+        if merged is None:
+            print('No processed shards found')
+            sys.exit(1)
+        merged.serialize(dataset_file)
+        manifest.merge_index()
+        gather_renders(output_path)
+        print(f'Merged {merged["shards"]["started"]} shards into {dataset_file}')
+        sys.exit(0 if merged['frozen'] else 1)
+
+    if command_args.num_shards is not None or command_args.shard is not None:
+        finished = sim_shards(datapath, output_path, props, command_args)
+        if finished:
+            print('All shards are processed. Run with --merge_shards to merge the dataset properties')
+            sys.exit(0)
+        sys.exit(1)
+
     # ----- Main loop ----------
+    pattern_costs = sim._pattern_costs(datapath, output_path, props)   # Once for all the passes
     finished = sim.batch_sim(
         datapath, 
         output_path, 
         props,
         run_default_body=command_args.default_body,
         num_samples=command_args.minibatch,  # run in mini-batch if requested
-        caching=command_args.caching, force_restart=False)
+        caching=command_args.caching, force_restart=False,
+        pattern_costs=pattern_costs)
 
     # ----- Try and resim fails once -----
     if finished:
@@ -100,7 +267,8 @@ if __name__ == "__main__":
             output_path, 
             props,
             run_default_body=command_args.default_body,
-            caching=command_args.caching)
+            caching=command_args.caching,
+            pattern_costs=pattern_costs)
 
     props.add_sys_info()   # Save system information
     props.serialize(dataset_file)
@@ -12,6 +12,7 @@ import argparse
 
 # Custom
 from pygarment.data_config import Properties
+from pygarment.data_index import DatasetIndex, design_hash
 from assets.garment_programs.meta_garment import MetaGarment
 from assets.bodies.body_params import BodyParameters
 
@@ -91,7 +92,7 @@ def body_sample(idx, bodies: dict, path: Path, straight=True):
     return body
 
 
-def _save_sample(piece, body, new_design, folder, verbose=False):
+def _save_sample(piece, body, new_design, folder, verbose=False, index=None):
 
     pattern = piece.assembly()
     # Save as json file
@@ -109,6 +110,10 @@ def _save_sample(piece, body, new_design, folder, verbose=False):
             default_flow_style=False,
             sort_keys=False
         )
+    if index is not None:
+        index.add_sample_folder(
+            piece.name, folder, design_hash=design_hash(new_design), body_id=body.params.get('body_sample'))
+        index.set_stage(piece.name, 'sampling', 'done')
     if verbose:
         print(f'Saved {piece.name}')
 
@@ -131,6 +136,8 @@ def generate(path, properties, sys_paths, verbose=False):
     data_folder, default_path, body_sample_path = _create_data_folder(properties, path)
     default_sample_data = default_path / 'data'
     body_sample_data = body_sample_path / 'data'
+    default_index = DatasetIndex(default_path / DatasetIndex.file_name)
+    body_sample_index = DatasetIndex(body_sample_path / DatasetIndex.file_name)
 
     # generate data
     start_time = time.time()
@@ -142,7 +149,7 @@ def generate(path, properties, sys_paths, verbose=False):
     # On default body
     default_body = BodyParameters(Path(sys_paths['bodies_default_path']) / (properties['body_default'] + '.yaml'))
     piece_default = MetaGarment(properties['body_default'], default_body, design) 
-    _save_sample(piece_default, default_body, design, default_sample_data, verbose=verbose)
+    _save_sample(piece_default, default_body, design, default_sample_data, verbose=verbose, index=default_index)
                 
     
     for i in range(properties['size']):
@@ -161,7 +168,7 @@ def generate(path, properties, sys_paths, verbose=False):
             piece_shaped = MetaGarment(name, rand_body, design) 
             
             # Save samples
-            _save_sample(piece_shaped, rand_body, design, body_sample_data, verbose=verbose)
+            _save_sample(piece_shaped, rand_body, design, body_sample_data, verbose=verbose, index=body_sample_index)
         except KeyboardInterrupt:  # Return immediately with whatever is ready
             return default_path, body_sample_path
         except BaseException as e:
@@ -15,6 +15,7 @@ import argparse
 
 # Custom
 from pygarment.data_config import Properties
+from pygarment.data_index import DatasetIndex, design_hash
 from assets.garment_programs.meta_garment import MetaGarment, IncorrectElementConfiguration
 from assets.bodies.body_params import BodyParameters
 import pygarment as pyg
@@ -99,7 +100,7 @@ def body_sample(bodies: dict, path: Path, straight=True):
 
     return body
 
-def _save_sample(piece, body, new_design, folder, verbose=False):
+def _save_sample(piece, body, new_design, folder, verbose=False, index=None):
 
     pattern = piece.assembly()
     # Save as json file
@@ -117,6 +118,10 @@ def _save_sample(piece, body, new_design, folder, verbose=False):
             default_flow_style=False,
             sort_keys=False
         )
+    if index is not None:
+        index.add_sample_folder(
+            piece.name, folder, design_hash=design_hash(new_design), body_id=body.params.get('body_sample'))
+        index.set_stage(piece.name, 'sampling', 'done')
     if verbose:
         print(f'Saved {piece.name}')
 
@@ -202,6 +207,8 @@ def generate(path, properties, sys_paths, verbose=False):
     data_folder, default_path, body_sample_path = _create_data_folder(properties, path)
     default_sample_data = default_path / 'data'
     body_sample_data = body_sample_path / 'data'
+    default_index = DatasetIndex(default_path / DatasetIndex.file_name)
+    body_sample_index = DatasetIndex(body_sample_path / DatasetIndex.file_name)
 
     # init random seed
     if 'random_seed' not in gen_config or gen_config['random_seed'] is None:
@@ -260,8 +267,10 @@ def generate(path, properties, sys_paths, verbose=False):
                     continue  # Redo the randomization
                 
                 # Save samples
-                pattern = _save_sample(piece_default, default_body, new_design, default_sample_data, verbose=verbose)
-                _save_sample(piece_shaped, rand_body, new_design, body_sample_data, verbose=verbose)
+                pattern = _save_sample(
+                    piece_default, default_body, new_design, default_sample_data, verbose=verbose, index=default_index)
+                _save_sample(
+                    piece_shaped, rand_body, new_design, body_sample_data, verbose=verbose, index=body_sample_index)
                 
                 stats_utils.count_panels(pattern, props)
                 stats_utils.garment_type(name, new_design, props)
@@ -279,10 +288,12 @@ def generate(path, properties, sys_paths, verbose=False):
                 if (default_sample_data / name).exists():
                     print('Generate::Info::Removed empty folder after unsuccessful sampling attempt', default_sample_data / name)
                     shutil.rmtree(default_sample_data / name, ignore_errors=True)
+                    default_index.remove_sample(name)
                 
                 if (body_sample_data / name).exists():
                     print('Generate::Info::Removed empty folder after unsuccessful sampling attempt', body_sample_data / name)
                     shutil.rmtree(body_sample_data / name, ignore_errors=True)
+                    body_sample_index.remove_sample(name)
 
                 continue
 
@@ -0,0 +1,115 @@
+"""Cost of cloth-body collision queries against the full-resolution body vs. the body collision proxy (body LOD)
+
+    Particles are sampled around the body surface (within the contact margin, as the particles of a draped garment),
+    and the closest point queries of the collision detection are timed against the BVH of each body mesh.
+    The simulation with body LOD on and off can be compared with
+        python ./post_processing_scripts/sim_variants_benchmark.py body_lod
+
+    How to use:
+        python ./post_processing_scripts/body_lod_benchmark.py [--body ./assets/bodies/mean_all.obj] [--particles 20000] [--max_error 0.5]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import warp as wp
+
+from pygarment.meshgen.body_lod import build_body_lods, select_lod
+from pygarment.meshgen.mesh_qa import load_body
+
+
+@wp.kernel
+def count_body_contacts(
+        mesh: wp.uint64,
+        particle_q: wp.array(dtype=wp.vec3),
+        margin: float,
+        contact_count: wp.array(dtype=wp.int32)):
+    """Closest point query of the particle-shape contact generation"""
+    tid = wp.tid()
+    query = wp.mesh_query_point_no_sign(mesh, particle_q[tid], margin)
+    if query.result:
+        wp.atomic_add(contact_count, 0, 1)
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body', type=str, default='./assets/bodies/mean_all.obj', help='body mesh')
+    parser.add_argument(
+        '--segmentation', type=str, default='./assets/bodies/ggg_body_segmentation.json', help='body segmentation')
+    parser.add_argument('--particles', type=int, default=20000, help='number of cloth particles')
+    parser.add_argument('--margin', type=float, default=2., help='contact margin (cm)')
+    parser.add_argument('--max_error', type=float, nargs='+', default=[0.25, 0.5, 1.], help='LOD error bounds (cm)')
+    parser.add_argument(
+        '--face_ratios', type=float, nargs='+', default=[0.05, 0.1, 0.25, 0.5], help='LOD face ratios')
+    parser.add_argument('--frames', type=int, default=100, help='number of timed collision passes')
+    parser.add_argument('--device', type=str, default=None)
+
+    args = parser.parse_args()
+    return args
+
+
+def sample_particles(vertices, faces, num, margin, seed=0):
+    """Points around the body surface, up to margin away from it"""
+    rng = np.random.default_rng(seed)
+    tri = vertices[faces]
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    face_ids = rng.choice(len(faces), size=num, p=areas / areas.sum())
+    bary = rng.dirichlet([1., 1., 1.], size=num)
+    points = np.einsum('ij,ijk->ik', bary, tri[face_ids])
+    offsets = rng.uniform(0., margin, size=(num, 1)) * normals[face_ids] / areas[face_ids, None]
+    return (points + offsets).astype(np.float32)
+
+
+def time_queries(vertices, faces, particles, margin, frames, device):
+    """Mean time of the collision pass (ms) and the number of contacts"""
+    mesh = wp.Mesh(
+        points=wp.array(vertices, dtype=wp.vec3, device=device),
+        indices=wp.array(np.asarray(faces, dtype=np.int32).flatten(), dtype=wp.int32, device=device))
+    counts = wp.zeros(1, dtype=wp.int32, device=device)
+
+    def collide():
+        counts.zero_()
+        wp.launch(count_body_contacts, dim=len(particles), inputs=[mesh.id, particles, margin, counts], device=device)
+
+    collide()   # Compilation
+    wp.synchronize_device(device)
+    start = time.perf_counter()
+    for _ in range(frames):
+        collide()
+    wp.synchronize_device(device)
+    return 1000 * (time.perf_counter() - start) / frames, int(counts.numpy()[0])
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    wp.init()
+    device = args.device or wp.get_device()
+
+    vertices, faces = load_body(Path(args.body))
+    with open(args.segmentation, 'r') as f:
+        segmentation = json.load(f)
+
+    start = time.perf_counter()
+    part_lods = build_body_lods(vertices, faces, segmentation, args.face_ratios)
+    print(f'Body LODs of {len(faces)} faces built in {time.perf_counter() - start:.1f}s')
+
+    particles = wp.array(
+        sample_particles(vertices, faces, args.particles, args.margin), dtype=wp.vec3, device=device)
+
+    full_time, full_contacts = time_queries(vertices, faces, particles, args.margin, args.frames, device)
+    print(f'{args.particles} particles, {args.frames} collision passes on {device}')
+    print(f'{"body":>14} {"faces":>8} {"error, cm":>10} {"ms/pass":>8} {"speedup":>8} {"contacts":>9}')
+    print(f'{"full":>14} {len(faces):8d} {0.:10.3f} {full_time:8.3f} {1.:8.2f} {full_contacts:9d}')
+    for max_error in args.max_error:
+        lod = select_lod(part_lods, max_error)
+        if lod is None:
+            print(f'{f"LOD {max_error}":>14}   no part could be coarsened')
+            continue
+        lod_time, lod_contacts = time_queries(lod.vertices, lod.faces, particles, args.margin, args.frames, device)
+        print(f'{f"LOD {max_error}":>14} {len(lod.faces):8d} {lod.error:10.3f} {lod_time:8.3f} '
+              f'{full_time / lod_time:8.2f} {lod_contacts:9d}')
@@ -0,0 +1,29 @@
+"""Create the sample index (dataset_index.sqlite) for a dataset generated before the index was introduced
+
+    How to use:
+        Sewing pattern dataset:
+        python ./post_processing_scripts/build_dataset_index.py <path to dataset>/<default_body or random_body> --data_subfolder data --stage sampling
+        Simulated dataset:
+        python ./post_processing_scripts/build_dataset_index.py <path to simulated dataset>/<default_body or random_body> --stage sim
+"""
+import argparse
+
+from pygarment.data_index import build_index
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='folder to create the index in')
+    parser.add_argument('--data_subfolder', type=str, default=None, help='subfolder with the sample folders')
+    parser.add_argument('--stage', type=str, default=None, help='processing stage to mark as done for all the samples')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    with build_index(args.dataset, args.data_subfolder, args.stage) as index:
+        print(f'Indexed {len(index.names())} samples in {index.path}')
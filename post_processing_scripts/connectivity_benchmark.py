@@ -0,0 +1,72 @@
+"""Time and memory of building the vertex connectivity of cloth meshes:
+    per-face loop with python lists vs. CSR arrays (see pygarment/meshgen/mesh_connectivity.py)
+
+    How to use:
+        python ./post_processing_scripts/connectivity_benchmark.py
+        python ./post_processing_scripts/connectivity_benchmark.py --box_meshes <path>_boxmesh.obj ...
+
+    Without box meshes, triangulated grids of the sizes of box meshes at different resolution scales are used
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from pygarment.meshgen.mesh_connectivity import vertex_vertex_csr, vertex_vertex_lists, CSRAdjacency
+from pygarment.meshgen.mesh_storage import read_obj_topology
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--box_meshes', type=str, nargs='*', default=[], help='box meshes (.obj) to benchmark on')
+    parser.add_argument(
+        '--vertices', type=int, nargs='*', default=[5000, 20000, 50000, 100000, 200000],
+        help='vertex counts of the grid meshes')
+
+    args = parser.parse_args()
+    return args
+
+
+def grid_mesh(num_verts):
+    """Triangulated square grid with about num_verts vertices"""
+    side = max(int(np.sqrt(num_verts)), 2)
+    ids = np.arange(side * side).reshape(side, side)
+    a, b, c, d = ids[:-1, :-1].ravel(), ids[:-1, 1:].ravel(), ids[1:, :-1].ravel(), ids[1:, 1:].ravel()
+    faces = np.concatenate([np.stack([a, b, c], axis=1), np.stack([b, d, c], axis=1)])
+    return side * side, faces
+
+
+def _measure(build_fn):
+    """Time (s) and peak memory (MB) of the build"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build_fn()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return duration, peak / 2**20
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+
+    meshes = [(f'grid {n}', *grid_mesh(n)) for n in args.vertices]
+    for path in args.box_meshes:
+        topology = read_obj_topology(path)
+        meshes.append((path, len(topology['vertices']), topology['faces']))
+
+    print(f'{"mesh":>30} {"vertices":>9} | {"lists, s":>9} {"MB":>7} | {"CSR, s":>8} {"MB":>7} | {"CSR + all lists, s":>18}')
+    for label, num_verts, faces in meshes:
+        indices = faces.ravel()   # As stored in Cloth
+        lists_time, lists_mem = _measure(lambda: vertex_vertex_lists(indices, num_verts))
+        csr_time, csr_mem = _measure(
+            lambda: CSRAdjacency(*vertex_vertex_csr(indices, num_verts, unique=False)))
+        # Worst case of the view: every vertex is accessed
+        all_time, _ = _measure(
+            lambda: list(CSRAdjacency(*vertex_vertex_csr(indices, num_verts, unique=False))))
+        print(f'{label[-30:]:>30} {num_verts:9d} | {lists_time:9.3f} {lists_mem:7.1f} | '
+              f'{csr_time:8.3f} {csr_mem:7.1f} | {all_time:18.3f}')
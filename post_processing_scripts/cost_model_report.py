@@ -0,0 +1,78 @@
+"""Evaluate the processing cost model and longest-first scheduling on a recorded run
+
+    The cost model is fitted on a part of the recorded samples and evaluated on the rest.
+    Makespans of processing the evaluation samples with a pool of workers are reported for
+    the recorded order, longest-first order by predicted cost and by the actual cost (best case).
+    Makespans of the static split into one shard per worker are reported for the name hash and 
+    for the shards balanced by the predicted cost
+
+    How to use:
+        python ./post_processing_scripts/cost_model_report.py <path to simulated dataset>/<default_body or random_body> [--workers 8 32]
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+
+import pygarment.data_config as data_config
+from pygarment.meshgen.cost_model import CostModel, recorded_samples, order_longest_first, makespan, balance_shards
+from pygarment.meshgen.sharding import shard_of
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='path to the simulated dataset (default_body or random_body folder)')
+    parser.add_argument('--workers', '-w', type=int, nargs='+', default=[4, 16, 64], help='worker pool sizes to evaluate')
+    parser.add_argument('--train_fraction', type=float, default=0.5, help='fraction of samples to fit the model on')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    dataset_path = Path(args.dataset)
+    props = data_config.Properties(sorted(dataset_path.glob('dataset_properties*.yaml'))[0])
+    resolution_scale = props['sim']['config'].get('resolution_scale', 1.0)
+
+    # NOTE: Stats are recorded in the processing order
+    names, features, costs = recorded_samples(dataset_path, props)
+    costs = np.array(costs)
+    print(f'{len(names)} samples with recorded stats. Cost: median {np.median(costs):.1f}s, '
+          f'p95 {np.percentile(costs, 95):.1f}s, max {costs.max():.1f}s')
+
+    # Train / test split
+    rng = np.random.default_rng(args.seed)
+    is_train = rng.random(len(names)) < args.train_fraction
+    train_ids, test_ids = np.nonzero(is_train)[0], np.nonzero(~is_train)[0]
+
+    model = CostModel(resolution_scale=resolution_scale).fit([features[i] for i in train_ids], costs[train_ids])
+    predicted = model.predict([features[i] for i in test_ids])
+    test_costs = costs[test_ids]
+
+    log_error = np.abs(np.log(predicted) - np.log(test_costs))
+    rank_corr = np.corrcoef(np.argsort(np.argsort(predicted)), np.argsort(np.argsort(test_costs)))[0, 1]
+    print(f'Fitted on {len(train_ids)}, evaluated on {len(test_ids)} samples. '
+          f'Median prediction error x{np.exp(np.median(log_error)):.2f}, rank correlation {rank_corr:.3f}')
+
+    test_names = [names[i] for i in test_ids]
+    cost_by_name = dict(zip(test_names, test_costs))
+    predicted_order = order_longest_first(test_names, predicted)
+    best_order = order_longest_first(test_names, test_costs)
+
+    for num_workers in args.workers:
+        recorded = makespan(test_costs, num_workers)
+        longest_first = makespan([cost_by_name[n] for n in predicted_order], num_workers)
+        best = makespan([cost_by_name[n] for n in best_order], num_workers)
+        print(f'{num_workers} workers: makespan recorded order {recorded:.0f}s, '
+              f'longest-first {longest_first:.0f}s ({100 * (1 - longest_first / recorded):.1f}% less), '
+              f'with exact costs {best:.0f}s')
+
+        # Static split: one shard per worker
+        hashed = [0.] * num_workers
+        for name in test_names:
+            hashed[shard_of(name, num_workers)] += cost_by_name[name]
+        balanced = [sum(cost_by_name[n] for n in shard) for shard in balance_shards(test_names, predicted, num_workers)]
+        print(f'    shards by name hash {max(hashed):.0f}s, balanced by predicted cost {max(balanced):.0f}s')
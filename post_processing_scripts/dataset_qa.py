@@ -0,0 +1,88 @@
+"""Re-evaluate cloth self-intersections and cloth-body intersections of a simulated dataset
+    from the stored meshes, without re-running the simulation
+
+    How to use:
+        python ./post_processing_scripts/dataset_qa.py <path to simulated dataset>/<default_body or random_body> [--processes 8]
+
+    Writes qa_report.csv with intersection counts of every sample to the dataset folder
+"""
+import argparse
+import csv
+import multiprocessing
+from pathlib import Path
+
+import pygarment.data_config as data_config
+from pygarment.meshgen.mesh_qa import sample_qa, simulated_samples
+from pygarment.data_index import DatasetIndex
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='path to the simulated dataset (default_body or random_body folder)')
+    parser.add_argument('--processes', '-p', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    parser.add_argument('--output', '-o', type=str, default=None, help='path to the report. Defaults to <dataset>/qa_report.csv')
+    parser.add_argument(
+        '--max_body_collisions', type=int, default=None,
+        help='report samples above the threshold as fails. Defaults to the value in the dataset properties')
+    parser.add_argument(
+        '--max_self_collisions', type=int, default=None,
+        help='report samples above the threshold as fails. Defaults to the value in the dataset properties')
+
+    args = parser.parse_args()
+    return args
+
+
+def _sample_qa(task):
+    name, sample_path, body_path = task
+    try:
+        return name, sample_qa(sample_path, body_path, name), None
+    except BaseException as e:
+        return name, None, f'{type(e).__name__}: {e}'
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    system = data_config.Properties('./system.json')
+    dataset_path = Path(args.dataset)
+
+    props_files = sorted(dataset_path.glob('dataset_properties*.yaml'))
+    if not props_files:
+        print(f'No dataset properties found in {dataset_path}')
+        exit(1)
+    dataset_props = data_config.Properties(props_files[0])
+    sim_config = dataset_props['sim']['config']
+    max_body = args.max_body_collisions if args.max_body_collisions is not None else sim_config.get('max_body_collisions', 0)
+    max_self = args.max_self_collisions if args.max_self_collisions is not None else sim_config.get('max_self_collisions', 0)
+
+    index = DatasetIndex.find(dataset_path)
+    if index is not None:
+        with index:
+            tasks = simulated_samples(dataset_path, dataset_props, system, index)
+    else:
+        tasks = simulated_samples(dataset_path, dataset_props, system)
+    print(f'Evaluating {len(tasks)} samples with {args.processes} processes')
+
+    output = Path(args.output) if args.output else dataset_path / 'qa_report.csv'
+    body_fails, self_fails, errors = 0, 0, 0
+    with multiprocessing.Pool(args.processes) as pool, open(output, 'w', newline='') as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(['name', 'vertices', 'faces', 'body_collisions', 'self_collisions',
+                         'body_collision_fail', 'self_collision_fail', 'error'])
+        for name, result, error in pool.imap_unordered(_sample_qa, tasks, chunksize=4):
+            if error is not None:
+                errors += 1
+                writer.writerow([name, '', '', '', '', '', '', error])
+                continue
+            body_fail = result['body_collisions'] > max_body
+            self_fail = result['self_collisions'] > max_self
+            body_fails += body_fail
+            self_fails += self_fail
+            writer.writerow([
+                name, result['vertices'], result['faces'],
+                result['body_collisions'], result['self_collisions'],
+                int(body_fail), int(self_fail), ''])
+
+    print(f'Body intersection fails: {body_fails}, self-intersection fails: {self_fails}, errors: {errors}')
+    print(f'Report saved to {output}')
@@ -1,25 +1,55 @@
-"""In simulated dataset, gather all the scene images in one folder"""
+"""In simulated dataset, gather all the scene images in one folder
 
-import pygarment.data_config as config
+    Only the renders that are new or updated since the last gathering are copied, unless --full is given.
+    Optionally, paged contact sheets (grids of labelled thumbnails) are created for visual QA.
+
+    How to use:
+        python ./post_processing_scripts/gather_renders.py <dataset name> [--sheets front --grid 8 6]
+"""
+import argparse
 from pathlib import Path
 import shutil
 
+import pygarment.data_config as config
 from pattern_data_sim import gather_renders
 
 
-system_props = config.Properties('./system.json')
-dataset = 'unpacking_test'
-datapaths = [
-    Path(system_props['output']) / dataset / 'default_body', 
-    Path(system_props['output']) / dataset / 'random_body'
-]
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='name of the simulated dataset folder in the output folder')
+    parser.add_argument('--full', action='store_true', help='re-copy all the renders')
+    parser.add_argument(
+        '--sheets', type=str, default=None, 
+        help='create paged contact sheets of the renders of the given view (e.g. front)')
+    parser.add_argument(
+        '--grid', type=int, nargs=2, default=[8, 6], metavar=('COLUMNS', 'ROWS'), 
+        help='number of thumbnails on a contact sheet page')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+
+    system_props = config.Properties('./system.json')
+    datapaths = [
+        Path(system_props['output']) / args.dataset / 'default_body', 
+        Path(system_props['output']) / args.dataset / 'random_body'
+    ]
 
-for datapath in datapaths:
-    # Check packing
-    tar_path = datapath / 'data.tar.gz'
-    if tar_path.exists():
-        shutil.unpack_archive(tar_path, datapath)
-        # Finally -- clean up
-        tar_path.unlink()
+    for datapath in datapaths:
+        if not datapath.exists():
+            continue
+        # Check packing
+        tar_path = datapath / 'data.tar.gz'
+        if tar_path.exists():
+            shutil.unpack_archive(tar_path, datapath)
+            # Finally -- clean up
+            tar_path.unlink()
 
-    gather_renders(datapath)
+        gather_renders(
+            datapath, verbose=True, incremental=not args.full, 
+            sheets_view=args.sheets, sheets_grid=tuple(args.grid))
@@ -0,0 +1,87 @@
+"""Per-garment render latency: new renderer and body mesh for every garment vs. the persistent renderer
+
+    The garments are rendered from the copies of their sample folders, s.t. the renders of the dataset stay intact
+
+    How to use:
+        python ./post_processing_scripts/render_benchmark.py <path to simulated dataset>/<default_body or random_body> <body>.obj -n 20
+
+    Requires system.json with the paths to the default bodies
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pygarment.data_config import Properties
+from pygarment.meshgen.mesh_qa import load_body
+from pygarment.meshgen.render import pythonrender
+from pygarment.meshgen.sim_config import PathCofig
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='simulated dataset folder')
+    parser.add_argument('body', type=str, help='body mesh (.obj) to render the garments with')
+    parser.add_argument('-n', type=int, default=20, help='number of garments to render')
+    parser.add_argument(
+        '--config', type=str, default='./assets/Sim_props/default_sim_props.yaml', 
+        help='simulation config with render settings')
+    parser.add_argument(
+        '--body_name', type=str, default='mean_all', 
+        help='default body with measurements in the bodies folder of system.json (only used to resolve the sample paths)')
+
+    args = parser.parse_args()
+    return args
+
+
+def _latency(render_fn, paths_list):
+    times = []
+    for paths in paths_list:
+        start = time.perf_counter()
+        render_fn(paths)
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def _is_simulated(sample_path: Path):
+    name = sample_path.name
+    return any((sample_path / f'{name}_sim{suffix}').exists() for suffix in ['.obj', '.ply', '_positions.npy'])
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    render_props = Properties(args.config)['render']['config']
+    body_v, body_f = load_body(args.body)   # In simulation units and placement, as in Cloth
+
+    samples = [p for p in sorted(Path(args.dataset).iterdir()) if p.is_dir() and _is_simulated(p)][:args.n]
+    if not samples:
+        raise ValueError(f'No simulated garments found in {args.dataset}')
+
+    with tempfile.TemporaryDirectory() as out_path:
+        paths_list = []
+        for sample_path in samples:
+            shutil.copytree(sample_path, Path(out_path) / sample_path.name)
+            paths_list.append(PathCofig(
+                Path(out_path) / sample_path.name, out_path, sample_path.name, body_name=args.body_name))
+
+        def per_call(paths):
+            pythonrender._body_mesh_cache.clear()   # The body mesh is prepared for every garment
+            garm_mesh, body_mesh = pythonrender.load_meshes(paths, body_v, body_f)
+            for side in render_props['sides']:
+                pythonrender.render(garm_mesh, body_mesh, side, paths, render_props)
+
+        renderer = pythonrender.GarmentRenderer(render_props)
+        def persistent(paths):
+            renderer.render_garment(paths, body_v, body_f, render_props)
+
+        for label, render_fn in [('New renderer per garment', per_call), ('Persistent renderer', persistent)]:
+            times = _latency(render_fn, paths_list)
+            print(f'{label}: first {times[0] * 1000:.0f} ms, '
+                  f'mean of the rest {times[1:].mean() * 1000 if len(times) > 1 else float("nan"):.0f} ms '
+                  f'({len(times)} garments, {len(render_props["sides"])} sides)')
+        renderer.delete()
@@ -0,0 +1,191 @@
+"""Render a simulated dataset separately from the simulation, with a pool of renderer processes.
+    E.g. to simulate on GPU machines with 'inline_render: false' in render config,
+    and render on CPU-only machines, where pyrender falls back to software rendering (OSMesa)
+
+    How to use:
+        python ./post_processing_scripts/render_dataset.py <path to simulated dataset>/<default_body or random_body> --workers 8
+
+    Throughput (images per second) vs. the number of workers could be measured on the first N samples with
+        python ./post_processing_scripts/render_dataset.py <path to simulated dataset>/default_body --benchmark 1 2 4 8 -n 32
+    NOTE: Renders are not saved in the benchmark (only encoded to PNG in memory)
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import pygarment.data_config as data_config
+from pygarment.data_index import DatasetIndex
+from pygarment.meshgen.mesh_qa import simulated_samples
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='path to the simulated dataset (default_body or random_body folder)')
+    parser.add_argument('--workers', '-w', type=int, default=multiprocessing.cpu_count(), help='number of renderer processes')
+    parser.add_argument(
+        '--platform', type=str, default='osmesa', choices=['osmesa', 'egl'],
+        help='OpenGL platform of pyrender: osmesa for software rendering, egl for GPU')
+    parser.add_argument(
+        '--profile', type=str, default=None, choices=['full', 'preview'],
+        help='render profile. Defaults to the one in the dataset properties')
+    parser.add_argument('--redo', action='store_true', help='re-render the samples that already have renders')
+    parser.add_argument(
+        '--benchmark', type=int, nargs='+', default=None,
+        help='measure throughput with the given numbers of workers instead of rendering the dataset')
+    parser.add_argument('-n', type=int, default=32, help='number of samples to render in the benchmark')
+
+    args = parser.parse_args()
+    return args
+
+
+# ---- Worker process ----
+_worker = {}
+
+def _init_worker(dataset_path, render_props, body_default, profile, save, ready=None):
+    # NOTE: Platform is set in the environment before the first import of pyrender (in the parent process)
+    from pygarment.meshgen.render import pythonrender
+
+    _worker.update(
+        dataset_path=dataset_path, render_props=render_props, body_default=body_default,
+        profile=profile, save=save, body=(None, None, None))
+    _worker['renderer'] = pythonrender.GarmentRenderer(render_props)
+    if ready is not None:
+        ready.wait()
+
+
+def _body(body_path):
+    """Body of the last sample is kept, as samples are ordered by body"""
+    if _worker['body'][0] != body_path:
+        from pygarment.meshgen.mesh_qa import load_body
+        # NOTE: The renderer expects the body in simulation units and placement, as in Cloth
+        _worker['body'] = (body_path, *load_body(body_path))
+    return _worker['body'][1:]
+
+
+def _render_sample(task):
+    from PIL import Image
+    from pygarment.meshgen.sim_config import PathCofig
+
+    name, sample_path, body_path = task
+    start = time.perf_counter()
+    try:
+        # NOTE: Only the sample output paths are used
+        paths = PathCofig(sample_path, _worker['dataset_path'], name, body_name=_worker['body_default'])
+        body_v, body_f = _body(body_path)
+        images = _worker['renderer'].render_garment(
+            paths, body_v, body_f, _worker['render_props'],
+            save=_worker['save'], profile=_worker['profile'])
+        if not _worker['save']:
+            for image in images.values():
+                Image.fromarray(image).save(io.BytesIO(), 'PNG')
+        return name, len(images), time.perf_counter() - start, None
+    except BaseException as e:
+        return name, 0, time.perf_counter() - start, f'{type(e).__name__}: {e}'
+
+
+# ---- Main process ----
+def _is_rendered(name, sample_path: Path, profile):
+    return any(sample_path.glob(f'{name}_{"preview" if profile == "preview" else "render"}_*.png'))
+
+
+def _render_pool(tasks, workers, initargs, wait_ready=False):
+    """Render the tasks with the pool of workers.
+        Yields results of the samples as they are finished, and the wall time at the end.
+        If wait_ready, time is measured after all the workers have initialized their renderers
+    """
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(workers + 1) if wait_ready else None
+    with context.Pool(workers, initializer=_init_worker, initargs=(*initargs, ready)) as pool:
+        if ready is not None:
+            ready.wait()
+        start = time.perf_counter()
+        # NOTE: Chunks of consecutive samples keep the same body in the worker
+        for result in pool.imap_unordered(_render_sample, tasks, chunksize=4):
+            yield result
+        yield time.perf_counter() - start
+
+
+def _benchmark(tasks, worker_counts, initargs):
+    """Images per second vs. the number of workers"""
+    base_rate = None
+    for workers in worker_counts:
+        *results, wall_time = _render_pool(tasks, workers, initargs, wait_ready=True)
+        images = sum(n_images for _, n_images, _, _ in results)
+        errors = [(name, error) for name, _, _, error in results if error is not None]
+        rate = images / wall_time
+        base_rate = base_rate or rate / workers
+        print(f'Workers: {workers:3d}  images: {images:5d}  time: {wall_time:7.2f}s  '
+              f'images/s: {rate:7.2f}  per worker: {rate / workers:6.2f}  '
+              f'scaling efficiency: {rate / (base_rate * workers) * 100:5.1f}%'
+              + (f'  errors: {len(errors)}' if errors else ''))
+        for name, error in errors[:3]:
+            print(f'    {name}: {error}')
+
+
+def _render_dataset(tasks, workers, initargs, index=None):
+    """Render and save all the tasks, recording the 'render' stage in the dataset index"""
+    images, errors, render_time = 0, 0, 0.
+    for i, result in enumerate(_render_pool(tasks, workers, initargs)):
+        if not isinstance(result, tuple):
+            wall_time = result
+            continue
+        name, n_images, sample_time, error = result
+        images += n_images
+        render_time += sample_time
+        if error is not None:
+            errors += 1
+            print(f'{name}: {error}')
+        if index is not None:
+            index.set_stage(name, 'render', 'failed' if error else 'done', error)
+            if error is None:
+                index.add_sample_folder(name, initargs[0] / name)   # Add the renders to the sample files
+        if (i + 1) % 100 == 0:
+            print(f'Rendered {i + 1}/{len(tasks)}')
+
+    print(f'Rendered {images} images of {len(tasks) - errors} samples in {wall_time:.1f}s '
+          f'({images / wall_time:.2f} images/s, {render_time / len(tasks):.2f}s per sample in a worker). '
+          f'Errors: {errors}')
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    os.environ['PYOPENGL_PLATFORM'] = args.platform   # Inherited by the workers
+    system = data_config.Properties('./system.json')
+    dataset_path = Path(args.dataset)
+
+    props_files = sorted(dataset_path.glob('dataset_properties*.yaml'))
+    if not props_files:
+        print(f'No dataset properties found in {dataset_path}')
+        exit(1)
+    dataset_props = data_config.Properties(props_files[0])
+    render_props = dataset_props['render']['config']
+    profile = args.profile or (render_props['profile'] if 'profile' in render_props else 'full')
+
+    index = DatasetIndex.find(dataset_path)
+    try:
+        tasks = simulated_samples(dataset_path, dataset_props, system, index)
+        if not tasks:
+            print(f'No simulated samples found in {dataset_path}')
+            exit(1)
+
+        if args.benchmark:
+            tasks = tasks[:args.n]
+            print(f'Rendering {len(tasks)} samples with {args.platform}, {profile} profile')
+            _benchmark(tasks, args.benchmark, (dataset_path, render_props, dataset_props['body_default'], profile, False))
+        else:
+            if not args.redo:
+                tasks = [task for task in tasks if not _is_rendered(task[0], task[1], profile)]
+            print(f'Rendering {len(tasks)} samples with {args.workers} {args.platform} workers, {profile} profile')
+            if tasks:
+                _render_dataset(
+                    tasks, args.workers, 
+                    (dataset_path, render_props, dataset_props['body_default'], profile, True), 
+                    index=index)
+    finally:
+        if index is not None:
+            index.close()
@@ -0,0 +1,44 @@
+"""Replay or export frames of a captured garment simulation
+
+    Frames are captured when 'frame_capture_rate' is set in the sim config.
+
+    How to use:
+        python ./post_processing_scripts/replay_sim_capture.py <garment>_sim_capture.npz [--fps 30]
+        python ./post_processing_scripts/replay_sim_capture.py <garment>_sim_capture.npz --export_frame -1
+"""
+import argparse
+from pathlib import Path
+
+from pygarment.meshgen.frame_capture import CapturedAnimation, replay
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str, help='path to the capture file')
+    parser.add_argument('--fps', type=float, default=30, help='playback speed')
+    parser.add_argument('--loop', action='store_true', help='replay the animation in a loop')
+    parser.add_argument(
+        '--export_frame', type=int, default=None,
+        help='instead of replaying, save the garment (and body) of the given captured frame as .ply files')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    path = Path(args.path)
+
+    if args.export_frame is None:
+        replay(path, fps=args.fps, loop=args.loop)
+    else:
+        animation = CapturedAnimation(path)
+        i = args.export_frame
+        print(f'{len(animation)} frames captured. Exporting sim frame {animation.frames[i]}')
+
+        animation.mesh(i).export(path.parent / f'{path.stem}_{animation.frames[i]}.ply')
+        body = animation.body_mesh(i)
+        if body is not None:
+            body.export(path.parent / f'{path.stem}_{animation.frames[i]}_body.ply')
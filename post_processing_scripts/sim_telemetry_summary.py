@@ -0,0 +1,72 @@
+"""Summarize per-frame simulation telemetry of one or many simulated garments
+
+    Telemetry is recorded when 'record_telemetry: true' is set in the sim config.
+
+    How to use:
+        python ./post_processing_scripts/sim_telemetry_summary.py <telemetry.npz or dataset folder> [...]
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+
+from pygarment.meshgen.sim_telemetry import load_telemetry, summarize
+from pygarment.data_index import DatasetIndex
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'paths', nargs='+', type=str,
+        help='telemetry .npz files or folders to search for them (recursively)')
+    parser.add_argument(
+        '--velocity_threshold', '-v', type=float, default=None,
+        help='report the first frame when max garment velocity drops below this value')
+
+    args = parser.parse_args()
+    return args
+
+
+def _collect_files(paths):
+    files = []
+    for path in paths:
+        path = Path(path)
+        index = DatasetIndex.find(path) if path.is_dir() else None
+        if index is not None:
+            with index:
+                files += list(index.artifact_paths('sim_telemetry.npz').values())
+        elif path.is_dir():
+            files += sorted(path.glob('**/*_sim_telemetry.npz'))
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+
+    summaries = {}
+    for file in _collect_files(args.paths):
+        name = file.stem.replace('_sim_telemetry', '')
+        summaries[name] = summarize(load_telemetry(file), velocity_threshold=args.velocity_threshold)
+
+    if not summaries:
+        print('No telemetry files found')
+        exit(1)
+
+    # Per-garment info
+    for name, summary in summaries.items():
+        print(f'{name}:')
+        for key, value in summary.items():
+            print(f'    {key}: {value:.4g}' if isinstance(value, float) else f'    {key}: {value}')
+
+    # Dataset-level info
+    if len(summaries) > 1:
+        print(f'\nTotal: {len(summaries)} garments')
+        for key in ['frames', 'sim_time', 'frame_time_avg', 'max_velocity_final', 'calm_frame']:
+            values = [s[key] for s in summaries.values() if s.get(key) is not None]
+            if values:
+                print(f'    {key}: avg {np.mean(values):.4g}, '
+                      f'median {np.percentile(values, 50):.4g}, '
+                      f'p95 {np.percentile(values, 95):.4g}, max {np.max(values):.4g}')
@@ -0,0 +1,119 @@
+"""Simulate a reference set of garments with variants of the sim config and compare them:
+    total number of substeps, failure rate, simulation time and time of collision detection per frame
+
+    Variants:
+        * substeps -- fixed vs adaptive substep schedule (enable_adaptive_substeps)
+        * body_lod -- full-resolution body vs body collision proxy (enable_body_lod).
+            Collision time is only reported on CPU: on GPU, collisions are captured in the frame graph
+
+    How to use:
+        python ./post_processing_scripts/sim_variants_benchmark.py substeps
+        python ./post_processing_scripts/sim_variants_benchmark.py body_lod
+        python ./post_processing_scripts/sim_variants_benchmark.py substeps --patterns <path>/<name>_specification.json ... --sim_config <sim props>.yaml
+
+    Requires system.json with the paths to the default bodies. By default, the patterns from assets/Patterns are simulated
+"""
+import argparse
+import copy
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import pygarment.data_config as data_config
+from pygarment.meshgen.boxmeshgen import BoxMesh
+from pygarment.meshgen.sim_config import PathCofig
+from pygarment.meshgen.simulation import run_sim
+
+# Variant name -> sim config options to set
+_variants = {
+    'substeps': {
+        'fixed': {'enable_adaptive_substeps': False},
+        'adaptive': {'enable_adaptive_substeps': True},
+    },
+    'body_lod': {
+        'full body': {'enable_body_lod': False},
+        'body LOD': {'enable_body_lod': True},
+    },
+}
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('variants', type=str, choices=list(_variants.keys()), help='variants of the sim config to compare')
+    parser.add_argument(
+        '--patterns', '-p', type=str, nargs='*',
+        default=[str(p) for p in sorted(Path('./assets/Patterns').glob('*_specification.json'))],
+        help='pattern specification files of the reference garment set')
+    parser.add_argument('--sim_config', '-s', type=str, default='./assets/Sim_props/default_sim_props.yaml')
+    parser.add_argument('--body', type=str, default='mean_all', help='default body to simulate on')
+    parser.add_argument('--output', '-o', type=str, default=None, help='folder for the simulated garments. Temporary by default')
+
+    args = parser.parse_args()
+    return args
+
+
+def simulate_variant(spec_paths, props, out_path: Path, body_name):
+    """Simulate the garments with the given props. Returns props with the sim stats"""
+    props = copy.deepcopy(props)
+    props['render']['config']['inline_render'] = False
+    props.set_section_stats(
+        'sim', fails={}, sim_time={}, spf={}, fin_frame={}, body_collisions={}, self_collisions={})
+    props.set_section_stats('render', render_time={})
+
+    for spec_path in spec_paths:
+        spec_path = Path(spec_path)
+        name, _, _ = spec_path.stem.rpartition('_')  # assuming ending in '_specification'
+        paths = PathCofig(spec_path.parent, out_path, name, body_name=body_name)
+
+        box_mesh = BoxMesh(paths.in_g_spec, props['sim']['config']['resolution_scale'])
+        box_mesh.load()
+        box_mesh.serialize(paths, store_panels=False, uv_config=props['render']['config']['uv_texture'])
+
+        run_sim(name, props, paths)
+    return props
+
+
+def variant_summary(props, num_garments):
+    stats = props['sim']['stats']
+    failed = set(name for names in stats['fails'].values() for name in names)
+    stage_time = stats.get('stage_time', {})
+    frames = sum(stats['fin_frame'].values()) + len(stats['fin_frame'])
+    frames_time = sum(times.get('sim.frames', 0.) for times in stage_time.values())
+    collide_time = sum(times.get('sim.frames.collide', 0.) for times in stage_time.values())
+    return {
+        'total substeps': sum(stats.get('total_substeps', {}).values()),
+        'failure rate': len(failed) / num_garments,
+        'sim time, s': sum(stats['sim_time'].values()),
+        'frames': frames,
+        'ms per frame': 1000 * frames_time / max(frames, 1),
+        'collide ms/frame': 1000 * collide_time / max(frames, 1),
+    }
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    base_props = data_config.Properties(args.sim_config)
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        out_path = Path(args.output or tmp_path)
+        summaries = {}
+        for label, options in _variants[args.variants].items():
+            print(f'\n------ {label}: {options} ------')
+            props = copy.deepcopy(base_props)
+            props['sim']['config']['options'].update(options)
+            props = simulate_variant(args.patterns, props, out_path / label, args.body)
+            summaries[label] = variant_summary(props, len(args.patterns))
+
+    labels = list(summaries.keys())
+    print(f'\n{len(args.patterns)} garments, {args.sim_config}')
+    print(f'{"":>16}' + ''.join(f'{label:>14}' for label in labels))
+    for key in summaries[labels[0]]:
+        values = [summaries[label][key] for label in labels]
+        print(f'{key:>16}' + ''.join(f'{v:14.3f}' if isinstance(v, float) else f'{v:14d}' for v in values))
+    base = np.array([summaries[labels[0]]['total substeps'], summaries[labels[0]]['sim time, s']], dtype=float)
+    for label in labels[1:]:
+        ratio = np.array([summaries[label]['total substeps'], summaries[label]['sim time, s']]) / np.maximum(base, 1e-9)
+        print(f'{label} vs {labels[0]}: substeps x{ratio[0]:.2f}, sim time x{ratio[1]:.2f}')
@@ -0,0 +1,150 @@
+"""Start-up latency of a simulation worker process: import time and time to the first simulated frame,
+    with a cold warp kernel cache and after 'pattern_data_sim.py --warm_up'
+
+    Every measurement runs in a new process, as a new worker would:
+        * import -- 'python -X importtime -c "import pygarment.meshgen.simulation"'
+            total import time and the slowest modules (cumulative)
+        * first frame -- imports, warp initialization, Cloth setup and the first frame of a garment,
+            with an empty kernel cache (every kernel is compiled) and with the cache filled by warm_up()
+
+    How to use:
+        python ./post_processing_scripts/startup_benchmark.py
+        python ./post_processing_scripts/startup_benchmark.py --pattern <path>/<name>_specification.json --repeats 3
+
+    Requires the warp fork with warp.sim and system.json with the paths to the default bodies
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--pattern', '-p', type=str, default='./assets/Patterns/shirt_mean_specification.json',
+        help='pattern specification of the garment to simulate')
+    parser.add_argument('--sim_config', '-s', type=str, default='./assets/Sim_props/default_sim_props.yaml')
+    parser.add_argument('--body', type=str, default='mean_all', help='default body to simulate on')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='number of processes per measurement')
+    parser.add_argument('--top', type=int, default=10, help='number of the slowest imports to report')
+    # Stages run in the child processes
+    parser.add_argument('--stage', type=str, choices=['warm_up', 'first_frame'], default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--kernel_cache', type=str, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    return args
+
+
+def import_times(module='pygarment.meshgen.simulation'):
+    """Cumulative import times (s) of the modules imported by a new process, slowest first"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        times[name] = max(times.get(name, 0.), int(cumulative) / 1e6)
+    return dict(sorted(times.items(), key=lambda item: -item[1]))
+
+
+def run_stage(stage, args, kernel_cache):
+    """Run a stage in a new process. Returns the dict of timings it reports"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, __file__, '--stage', stage, '--kernel_cache', kernel_cache,
+         '--pattern', args.pattern, '--sim_config', args.sim_config, '--body', args.body],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Stage {stage} failed:\n{result.stderr}')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def stage_main(args):
+    """Child process: time the start-up steps and print them as json"""
+    timings = {}
+    start = time.perf_counter()
+    import warp as wp
+    wp.config.kernel_cache_dir = args.kernel_cache
+    import pygarment.data_config as data_config
+    from pygarment.meshgen.boxmeshgen import BoxMesh
+    from pygarment.meshgen.garment import Cloth
+    from pygarment.meshgen.sim_config import PathCofig, SimConfig
+    from pygarment.meshgen.simulation import init_warp, warm_up
+    timings['import'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    init_warp()
+    timings['init_warp'] = time.perf_counter() - start
+
+    if args.stage == 'warm_up':
+        start = time.perf_counter()
+        warm_up()
+        timings['warm_up'] = time.perf_counter() - start
+        print(json.dumps(timings))
+        return
+
+    props = data_config.Properties(args.sim_config)
+    spec_path = Path(args.pattern)
+    name, _, _ = spec_path.stem.rpartition('_')  # assuming ending in '_specification'
+    with tempfile.TemporaryDirectory() as out_path:
+        paths = PathCofig(spec_path.parent, out_path, name, body_name=args.body)
+        box_mesh = BoxMesh(paths.in_g_spec, props['sim']['config']['resolution_scale'])
+        box_mesh.load()
+        box_mesh.serialize(paths, store_panels=False, uv_config=props['render']['config']['uv_texture'])
+
+        start = time.perf_counter()
+        garment = Cloth(name, SimConfig(props['sim']['config']), paths)
+        wp.synchronize()
+        timings['setup'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        garment.run_frame()
+        wp.synchronize()
+        timings['first_frame'] = time.perf_counter() - start
+
+    print(json.dumps(timings))
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    if args.stage is not None:
+        stage_main(args)
+        exit(0)
+
+    # Import time
+    runs = [import_times() for _ in range(args.repeats)]
+    total = np.median([run.get('pygarment.meshgen.simulation', 0.) for run in runs])
+    print(f'import pygarment.meshgen.simulation: {total:.3f}s (median of {args.repeats})')
+    for module, cumulative in list(runs[0].items())[:args.top]:
+        print(f'    {module:<50} {cumulative:8.3f}s')
+
+    # First frame: cold kernel cache vs. the cache filled by warm-up
+    summary = {}
+    for label in ['cold cache', 'warm_up']:
+        runs = []
+        for _ in range(args.repeats):
+            with tempfile.TemporaryDirectory() as kernel_cache:
+                if label == 'warm_up':
+                    warm_up_time = run_stage('warm_up', args, kernel_cache)['warm_up']
+                runs.append(run_stage('first_frame', args, kernel_cache))
+        summary[label] = {key: np.median([run[key] for run in runs]) for key in runs[0]}
+    print(f'\nWarm-up (once per machine): {warm_up_time:.2f}s')
+
+    keys = ['import', 'init_warp', 'setup', 'first_frame', 'process']
+    print(f'{"":>14}' + ''.join(f'{key:>12}' for key in keys))
+    for label, timings in summary.items():
+        print(f'{label:>14}' + ''.join(f'{timings[key]:12.3f}' for key in keys))
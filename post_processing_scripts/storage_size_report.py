@@ -0,0 +1,91 @@
+"""Disk space of the simulated samples in the available storage formats
+
+    Takes the samples of a dataset simulated without 'optimize_storage' (box mesh and simulated garment as .obj),
+    converts copies of their meshes to each storage format and reports the size per sample
+    and for the given number of samples. Textures, renders and other files of the samples are not counted.
+
+    How to use:
+        python ./post_processing_scripts/storage_size_report.py <dataset path> [--num 1000]
+
+    Requires system.json with the paths to the default bodies
+"""
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import trimesh
+
+from pygarment.meshgen.mesh_storage import store_positions_only
+from pygarment.meshgen.sim_config import PathCofig
+
+
+_formats = ['obj', 'ply', 'positions']
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset', type=str, help='dataset with the meshes stored as .obj')
+    parser.add_argument('--num', '-n', type=int, default=1000, help='number of samples to measure')
+
+    args = parser.parse_args()
+    return args
+
+
+def _size(*files):
+    return sum(f.stat().st_size for f in files if f.exists())
+
+
+def sample_sizes(sample_path: Path, name, tmp_path: Path):
+    """Bytes of the box mesh and the simulated garment of the sample in each storage format"""
+    sizes = {}
+    for storage_format in _formats:
+        paths = PathCofig(sample_path, tmp_path / storage_format, name, body_name='mean_all')
+        shutil.copy(sample_path / f'{name}_boxmesh.obj', paths.g_box_mesh)
+        shutil.copy(sample_path / f'{name}_sim.obj', paths.g_sim)
+
+        if storage_format == 'ply':
+            # As in simulation.optimize_garment_storage()
+            trimesh.load(paths.g_box_mesh).export(paths.g_box_mesh_compressed)
+            trimesh.load(paths.g_sim).export(paths.g_sim_compressed)
+            paths.g_box_mesh.unlink()
+            paths.g_sim.unlink()
+        elif storage_format == 'positions':
+            store_positions_only(paths)
+
+        sizes[storage_format] = _size(
+            paths.g_box_mesh, paths.g_sim,
+            paths.g_box_mesh_compressed, paths.g_sim_compressed,
+            paths.g_box_topology, paths.g_sim_positions, paths.g_sim_normals)
+        shutil.rmtree(paths.out_el)
+    return sizes
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    dataset_path = Path(args.dataset)
+
+    samples = [
+        p for p in sorted(dataset_path.iterdir())
+        if p.is_dir() and (p / f'{p.name}_sim.obj').exists() and (p / f'{p.name}_boxmesh.obj').exists()]
+    samples = samples[:args.num]
+    if not samples:
+        print(f'No samples with .obj meshes found in {dataset_path}')
+        exit(1)
+
+    sizes = {storage_format: [] for storage_format in _formats}
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for sample_path in samples:
+            for storage_format, size in sample_sizes(sample_path, sample_path.name, Path(tmp_path)).items():
+                sizes[storage_format].append(size)
+
+    print(f'{len(samples)} samples of {dataset_path}')
+    print(f'{"format":>10} {"KB/sample":>10} {"total, MB":>10} {"vs obj":>8}')
+    obj_total = sum(sizes['obj'])
+    for storage_format in _formats:
+        total = sum(sizes[storage_format])
+        print(f'{storage_format:>10} {np.mean(sizes[storage_format]) / 1024:10.1f} '
+              f'{total / 1024 ** 2:10.1f} {total / obj_total:8.2f}')
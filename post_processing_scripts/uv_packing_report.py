@@ -0,0 +1,64 @@
+"""Packing efficiency of UV islands (sewing pattern panels) in the garment textures
+
+    Reports the share of the texture covered by the panels and the texture size 
+    for the available packing methods.
+
+    How to use:
+        python ./post_processing_scripts/uv_packing_report.py 
+        python ./post_processing_scripts/uv_packing_report.py <path>_specification.json ... --dpi 1500 --rotation
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from pygarment.meshgen.boxmeshgen import BoxMesh
+from pygarment.meshgen.render.texture_utils import unwarp_UV, normalize_UVs, uv_occupancy, texture_scale
+
+
+def get_command_args():
+    """command line arguments to control the run"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'patterns', type=str, nargs='*', 
+        default=sorted(str(p) for p in Path('./assets/Patterns').glob('*_specification.json')),
+        help='pattern specification files. Bundled patterns by default')
+    parser.add_argument('--res', type=float, default=1.0, help='box mesh resolution')
+    parser.add_argument('--padding', type=float, default=3, help='padding between the UV islands')
+    parser.add_argument('--dpi', type=int, default=1500, help='texture dpi to report the image size for')
+    parser.add_argument('--rotation', action='store_true', help='also report MaxRects packing with rotations')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+
+    args = get_command_args()
+    methods = [('shelf', False), ('maxrects', False)] + ([('maxrects', True)] if args.rotation else [])
+    occupancy = {m: [] for m in methods}
+    for pattern in args.patterns:
+        garment = BoxMesh(pattern, args.res)
+        garment.load()
+        texture_coords = np.array(garment.vertex_texture)
+        face_texture_coords = np.array(
+            [[tex_id0, tex_id1, tex_id2] for _, tex_id0, _, tex_id1, _, tex_id2, in garment.faces_with_texture])
+
+        print(f'{garment.name} ({len(garment.panels)} panels)')
+        for packing, rotation in methods:
+            all_uvs, boundaries = unwarp_UV(
+                texture_coords, face_texture_coords, padding=args.padding, 
+                packing=packing, allow_rotation=rotation)
+            _, width, height = normalize_UVs(all_uvs, axis_padding=args.padding)
+            occupancy[(packing, rotation)].append(uv_occupancy(boundaries, width, height))
+
+            scale = texture_scale(args.dpi)
+            print(
+                f'  {packing + (" + rotation" if rotation else ""):<20} '
+                f'occupancy {occupancy[(packing, rotation)][-1] * 100:5.1f}%  '
+                f'UV map {width:6.1f} x {height:6.1f} cm  '
+                f'texture {int(width * scale)} x {int(height * scale)} px')
+
+    print('Mean occupancy:')
+    for (packing, rotation), values in occupancy.items():
+        print(f'  {packing + (" + rotation" if rotation else ""):<20} {np.mean(values) * 100:5.1f}%')
@@ -279,6 +279,33 @@ class Properties():
                             updated = True
         return updated
 
+    def summarize_nested_stats(self, key):
+        """Summary of the stats recorded as a dictionary of values per datapoint (e.g. time of processing stages):
+            sum, average and 95th percentile of each of the values over datapoints
+        """
+        updated = False
+        for section in self.properties.values():
+            if isinstance(section, dict) and 'stats' in section and key in section['stats']:
+                per_value = {}
+                for datapoint_values in section['stats'][key].values():
+                    if not isinstance(datapoint_values, dict):
+                        continue
+                    for name, value in datapoint_values.items():
+                        if isinstance(value, Number):
+                            per_value.setdefault(name, []).append(value)
+
+                if per_value:
+                    section['stats'][key + '_summary'] = {
+                        name: {
+                            'sum': float(sum(values)),
+                            'avg': float(np.mean(values)),
+                            'p95': float(np.percentile(values, 95)),
+                            'count': len(values)
+                        } for name, values in sorted(per_value.items())
+                    }
+                    updated = True
+        return updated
+
     # -- Specialised updates (require domain knowledge) --
     def add_sys_info(self):
         """Add or update system information on the top level of config"""
@@ -317,6 +344,8 @@ class Properties():
         updated_frames = self.summarize_stats('fin_frame', log_avg=True)
         updated_sim_time = self.summarize_stats('sim_time', log_sum=True, log_avg=True, as_time=True)
         updated_spf = self.summarize_stats('spf', log_avg=True, as_time=True)
+        updated_substeps = self.summarize_stats('total_substeps', log_sum=True, log_avg=True)
+        updated_save_time = self.summarize_stats('save_time', log_sum=True, log_avg=True, as_time=True)
         updated_scan = self.summarize_stats('processing_time', log_sum=True, log_avg=True, as_time=True)
         updated_scan_faces = self.summarize_stats('faces_removed', log_avg=True)
 
@@ -329,6 +358,7 @@ class Properties():
             'face_count', log_avg=True, log_median=True, log_min=True, log_max=True)
         updated_panel_count = self.summarize_stats(
             'panel_count', log_avg=True, log_median=True, log_min=True, log_max=True)
+        self.summarize_nested_stats('stage_time')
  
         # fails
         self.count_fails(log=True)
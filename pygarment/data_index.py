@@ -0,0 +1,209 @@
+"""
+    Index of the dataset samples: names, design hashes, bodies, files and processing status
+    stored in a single SQLite file next to the data, s.t. the tools do not need to scan
+    folders with tens of thousands of entries
+"""
+
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+import yaml
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT PRIMARY KEY,
+    design_hash TEXT,
+    body_id TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    name TEXT,
+    kind TEXT,
+    path TEXT,
+    size INTEGER,
+    PRIMARY KEY (name, kind)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    name TEXT,
+    stage TEXT,
+    status TEXT,
+    info TEXT,
+    updated REAL,
+    PRIMARY KEY (name, stage)
+);
+"""
+
+
+def design_hash(design):
+    """Hash of the design parameters, independent of the key order"""
+    return hashlib.sha1(yaml.dump(design, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DatasetIndex():
+    """SQLite index of the samples of a dataset folder
+
+        Sample files (artifacts) are stored with paths relative to the folder of the index
+        and are identified by their kind -- the file name without the sample name prefix,
+        e.g. 'specification.json' or 'render_front.png'
+    """
+    file_name = 'dataset_index.sqlite'
+
+    def __init__(self, path, timeout=60.):
+        """
+            * path -- index file. If a folder is given, the index file in this folder is used
+        """
+        path = Path(path)
+        self.path = path / self.file_name if path.is_dir() else path
+        self.root = self.path.parent
+        self.connection = sqlite3.connect(str(self.path), timeout=timeout)
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    @classmethod
+    def find(cls, folder):
+        """Index of the dataset folder if one exists, None otherwise"""
+        path = Path(folder) / cls.file_name
+        return cls(path) if path.exists() else None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ---- Updates ----
+    def add_sample(self, name, design_hash=None, body_id=None):
+        """Add or update the sample. Values that are not given are kept"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO samples (name, design_hash, body_id, updated) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET '
+                'design_hash=COALESCE(excluded.design_hash, design_hash), '
+                'body_id=COALESCE(excluded.body_id, body_id), updated=excluded.updated',
+                (name, design_hash, body_id, time.time()))
+
+    def add_sample_folder(self, name, folder, design_hash=None, body_id=None):
+        """Add the sample with all the files in its folder (replacing the previous record of the files)"""
+        folder = Path(folder)
+        rows = []
+        for file in folder.iterdir():
+            if file.is_file():
+                kind = file.name[len(name) + 1:] if file.name.startswith(f'{name}_') else file.name
+                rows.append((name, kind, self._relative(file), file.stat().st_size))
+
+        self.add_sample(name, design_hash, body_id)
+        with self.connection:
+            self.connection.execute('DELETE FROM artifacts WHERE name=?', (name,))
+            self.connection.executemany(
+                'INSERT INTO artifacts (name, kind, path, size) VALUES (?, ?, ?, ?)', rows)
+
+    def set_stage(self, name, stage, status, info=None):
+        """Record the status of the processing stage of the sample (e.g. 'sim': 'done')"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO stages (name, stage, status, info, updated) VALUES (?, ?, ?, ?, ?)',
+                (name, stage, status, info, time.time()))
+
+    def remove_sample(self, name):
+        with self.connection:
+            for table in ['samples', 'artifacts', 'stages']:
+                self.connection.execute(f'DELETE FROM {table} WHERE name=?', (name,))
+
+    def merge(self, other_path):
+        """Add (or replace) all the records of another index with the same root folder"""
+        with self.connection:
+            self.connection.execute('ATTACH DATABASE ? AS other', (str(other_path),))
+        try:
+            with self.connection:
+                for table in ['samples', 'artifacts', 'stages']:
+                    self.connection.execute(f'INSERT OR REPLACE INTO {table} SELECT * FROM other.{table}')
+        finally:
+            self.connection.execute('DETACH DATABASE other')
+
+    # ---- Queries ----
+    def names(self, stage=None, status=None):
+        """Names of the samples, optionally filtered by the status of the given stage"""
+        if stage is None:
+            query, params = 'SELECT name FROM samples', ()
+        elif status is None:
+            query, params = 'SELECT name FROM stages WHERE stage=?', (stage,)
+        else:
+            query, params = 'SELECT name FROM stages WHERE stage=? AND status=?', (stage, status)
+        return [row[0] for row in self.connection.execute(query + ' ORDER BY name', params)]
+
+    def sample(self, name):
+        """Design hash and body id of the sample"""
+        row = self.connection.execute(
+            'SELECT design_hash, body_id FROM samples WHERE name=?', (name,)).fetchone()
+        return None if row is None else {'design_hash': row[0], 'body_id': row[1]}
+
+    def stage_status(self, stage):
+        """{name: status} of the stage"""
+        return dict(self.connection.execute('SELECT name, status FROM stages WHERE stage=?', (stage,)))
+
+    def artifacts(self, kind=None, name=None, kind_pattern=None):
+        """[(name, kind, absolute path, size)] of the sample files
+            * kind_pattern -- SQL LIKE pattern of the kind, e.g. 'render%'
+        """
+        conditions, params = [], []
+        for column, op, value in [('kind', '=', kind), ('name', '=', name), ('kind', 'LIKE', kind_pattern)]:
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                params.append(value)
+        query = 'SELECT name, kind, path, size FROM artifacts'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return [(n, k, self.root / p, s) for n, k, p, s in self.connection.execute(query + ' ORDER BY name', params)]
+
+    def artifact_paths(self, kind):
+        """{name: absolute path} of the sample files of the given kind"""
+        return {n: path for n, _, path, _ in self.artifacts(kind=kind)}
+
+    # ---- Utils ----
+    def _relative(self, path):
+        try:
+            return Path(path).resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return str(Path(path).resolve())
+
+
+def build_index(folder, data_subfolder=None, stage=None):
+    """(Re-)index the dataset folder by scanning it once. For datasets created before the index was introduced
+        * data_subfolder -- subfolder with the sample folders (e.g. 'data' for sewing pattern datasets)
+        * stage -- stage to mark as 'done' for all the found samples
+    """
+    folder = Path(folder)
+    samples_path = folder / data_subfolder if data_subfolder else folder
+
+    index = DatasetIndex(folder / DatasetIndex.file_name)
+    for sample_path in sorted(samples_path.iterdir()):
+        if not sample_path.is_dir() or sample_path.name in ['renders', 'patterns_vis', 'shard_leases']:
+            continue
+        name = sample_path.name
+
+        design_file = sample_path / 'design_params.yaml'
+        if not design_file.exists():
+            design_file = sample_path / f'{name}_design_params.yaml'
+        d_hash = None
+        if design_file.exists():
+            with open(design_file, 'r') as f:
+                d_hash = design_hash(yaml.safe_load(f)['design'])
+
+        body_file = sample_path / 'body_measurements.yaml'
+        if not body_file.exists():
+            body_file = sample_path / f'{name}_body_measurements.yaml'
+        body_id = None
+        if body_file.exists():
+            with open(body_file, 'r') as f:
+                body_id = yaml.safe_load(f)['body'].get('body_sample')
+
+        index.add_sample_folder(name, sample_path, design_hash=d_hash, body_id=body_id)
+        if stage is not None:
+            index.set_stage(name, stage, 'done')
+    return index
@@ -0,0 +1,170 @@
+"""Level-of-detail collision proxies for body meshes
+
+    Every body part (from the body segmentation) is decimated separately to a few levels of detail.
+    Every level of a part is offset outwards by the max distance the original surface of the part
+    sticks out of it, s.t. the proxy conservatively covers the full-resolution body.
+    The collision proxy is assembled from the coarsest levels of the parts that satisfy the error bound,
+    e.g. the torso could be coarse while the hands keep full resolution.
+    Body segmentation is transferred to the proxy vertices to allow body-part-based collision filtering.
+"""
+import numpy as np
+import igl
+
+
+class BodyLOD:
+    """Decimated collision proxy of a body mesh"""
+    def __init__(self, vertices, faces, segmentation, face_ratio, error, part_errors, offset, part_ratios=None):
+        self.vertices = vertices
+        self.faces = faces
+        self.segmentation = segmentation   # part name -> list of proxy vertex ids
+        self.face_ratio = face_ratio       # Fraction of faces of the full-resolution parts
+        self.error = error                 # Max deviation from the original surface
+        self.part_errors = part_errors     # part name -> max deviation on this part
+        self.offset = offset               # Max conservative offset applied to the proxy parts
+        self.part_ratios = part_ratios     # part name -> fraction of faces of the part level (1. for full resolution)
+
+
+class PartLOD:
+    """Decimated (and offset) surface of one body part"""
+    def __init__(self, vertices, faces, segmentation, face_ratio, error, offset):
+        self.vertices = vertices
+        self.faces = faces
+        self.segmentation = segmentation   # part name -> list of part proxy vertex ids
+        self.face_ratio = face_ratio
+        self.error = error
+        self.offset = offset
+
+
+# NOTE: Proxies are computed once per body per process
+_lod_cache = {}
+
+# Parts with fewer faces are not decimated
+_min_part_faces = 50
+_unlabeled = '__unlabeled__'
+
+
+def _vertex_labels(num_verts, segmentation):
+    """Per-vertex index of the body part, -1 for unlabeled vertices"""
+    part_names = list(segmentation.keys())
+    labels = np.full(num_verts, -1, dtype=int)
+    for i, part in enumerate(part_names):
+        labels[segmentation[part]] = i
+    return labels, part_names
+
+
+def _proxy_segmentation(labels, part_names):
+    return {part: np.nonzero(labels == i)[0].tolist() for i, part in enumerate(part_names)}
+
+
+def _part_levels(vertices, faces, labels, part_names, face_ratios):
+    """Levels of detail of a part surface, from the coarsest to the full resolution"""
+    part_v, part_f, _, part_to_body = igl.remove_unreferenced(vertices, faces)[-4:]
+    part_f = np.asarray(part_f, dtype=np.int64)
+    part_labels = labels[np.asarray(part_to_body)]
+
+    levels = []
+    if len(part_f) >= _min_part_faces:
+        for ratio in sorted(face_ratios):
+            # NOTE: Older versions of libigl also return a success flag first
+            # NOTE: Quadric error simplification keeps the shape much closer than the edge length based igl.decimate
+            result = igl.qslim(part_v, part_f, int(len(part_f) * ratio))
+            proxy_v, proxy_f, _, birth_verts = result[-4:]
+            proxy_f = np.asarray(proxy_f, dtype=np.int64)
+            if (len(result) > 4 and not result[0]) or not len(proxy_f):
+                continue   # Decimation failed
+
+            # Deviation of the original surface from the proxy
+            # NOTE: Positive values are outside of the proxy. Parts are open surfaces -- sign by pseudonormals
+            dists = igl.signed_distance(
+                part_v, proxy_v, proxy_f, igl.SIGNED_DISTANCE_TYPE_PSEUDONORMAL)[0]
+
+            # Conservative offset: the proxy covers the original surface
+            offset = max(float(dists.max()), 0.)
+            if offset > 0:
+                proxy_v = proxy_v + igl.per_vertex_normals(proxy_v, proxy_f) * offset
+
+            levels.append(PartLOD(
+                proxy_v, proxy_f, _proxy_segmentation(part_labels[np.asarray(birth_verts)], part_names),
+                face_ratio=len(proxy_f) / len(part_f),
+                error=float(np.abs(dists).max() + offset),
+                offset=offset))
+
+    # Full resolution is always available
+    levels.append(PartLOD(
+        part_v, part_f, _proxy_segmentation(part_labels, part_names), face_ratio=1., error=0., offset=0.))
+    return levels
+
+
+def build_body_lods(vertices, faces, segmentation, face_ratios):
+    """Create collision proxies of every body part for each of the face_ratios
+        * vertices, faces -- body mesh
+        * segmentation -- body part name -> list of vertex ids
+        * face_ratios -- fraction of part faces to keep on each level
+
+        Part surfaces include the faces around the part border (when possible), s.t. the proxies
+        of the neighboring parts overlap instead of leaving gaps between them.
+        Returns {part name: list of PartLOD ordered from the coarsest to the full resolution}
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64)
+    labels, part_names = _vertex_labels(len(vertices), segmentation)
+
+    face_labels = labels[faces]
+    part_lods = {}
+    for i, part in enumerate(part_names + [_unlabeled]):
+        in_part = face_labels == (i if part != _unlabeled else -1)
+        if not in_part.any():
+            continue
+        levels = _part_levels(vertices, faces[in_part.any(axis=1)], labels, part_names, face_ratios)
+        if len(levels) == 1:
+            # Decimation fails if the border ring makes the surface non-manifold. 
+            # Decimate the faces with most vertices in the part instead
+            levels = _part_levels(
+                vertices, faces[in_part.sum(axis=1) >= 2], labels, part_names, face_ratios)[:-1] + levels
+        part_lods[part] = levels
+
+    return part_lods
+
+
+def select_lod(part_lods, max_error):
+    """Collision proxy from the coarsest levels of the body parts with deviation from the original within max_error.
+        None if no part could be coarsened
+    """
+    num_faces = sum(len(levels[-1].faces) for levels in part_lods.values())
+    chosen = {
+        part: next(level for level in levels if level.error <= max_error)   # Coarse to fine, full res is the last
+        for part, levels in part_lods.items()}
+    if all(level.face_ratio == 1. for level in chosen.values()):
+        return None
+
+    # NOTE: Proxy vertices keep the labels of the original vertices they come from
+    proxy_v, proxy_f, proxy_seg = [], [], {}
+    start = 0
+    for level in chosen.values():
+        proxy_v.append(level.vertices)
+        proxy_f.append(level.faces + start)
+        for part, ids in level.segmentation.items():
+            proxy_seg.setdefault(part, []).extend(v_id + start for v_id in ids)
+        start += len(level.vertices)
+    proxy_f = np.concatenate(proxy_f)
+
+    return BodyLOD(
+        np.concatenate(proxy_v), proxy_f.astype(np.int32), proxy_seg,
+        face_ratio=len(proxy_f) / num_faces,
+        error=max(level.error for level in chosen.values()),
+        part_errors={part: level.error for part, level in chosen.items() if part != _unlabeled},
+        offset=max(level.offset for level in chosen.values()),
+        part_ratios={part: level.face_ratio for part, level in chosen.items()}
+    )
+
+
+def get_body_lod(body_key, vertices, faces, segmentation, face_ratios, max_error):
+    """Cached collision proxy of the body for given error bound
+        * body_key -- identifier of the body mesh, e.g. path to the body file.
+            NOTE: the same vertices are expected to be provided for the same key
+    """
+    key = (str(body_key), tuple(face_ratios))
+    if key not in _lod_cache:
+        _lod_cache[key] = build_body_lods(vertices, faces, segmentation, face_ratios)
+
+    return select_lod(_lod_cache[key], max_error)
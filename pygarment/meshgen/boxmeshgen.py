@@ -23,6 +23,7 @@ import pygarment.pattern.utils as pat_utils
 import pygarment.meshgen.triangulation_utils as tri_utils
 from pygarment.meshgen.sim_config import PathCofig
 from pygarment.meshgen.render.texture_utils import texture_mesh_islands, save_obj
+from pygarment.meshgen.stage_timer import StageTimer
 
 # TODOLOW Some stitching errors are not getting detected
 
@@ -577,22 +578,28 @@ class BoxMesh(wrappers.VisPattern):
         self.faces_with_texture = []
         self.vertex_texture = []
         self.vertex_labels = {}   # Additional vertex labels coming from panel edges' labels
+        self.timer = StageTimer()   # Time of the loading and serialization stages
 
     # SECTION -- Top level 
     def load(self):
         """
         Loads all relevant functions and prints their time consumptions
         """
-        if self.is_self_intersecting(): 
-            print(f'{self.__class__.__name__}::WARNING::{self.name}::Provided pattern has self-intersecting panels. Simulation might crash')
+        with self.timer.span('self_intersection_check'):
+            if self.is_self_intersecting(): 
+                print(f'{self.__class__.__name__}::WARNING::{self.name}::Provided pattern has self-intersecting panels. Simulation might crash')
 
-        self.load_panels()
-        self.gen_panel_meshes()
+        with self.timer.span('panels'):
+            self.load_panels()
+        with self.timer.span('meshing'):
+            self.gen_panel_meshes()
 
         # NOTE: Collapse stitch vertices and store to self.vertices as well as their stitch_id to self.stitch_segmentation
-        self.collapse_stitch_vertices()
+        with self.timer.span('stitching'):
+            self.collapse_stitch_vertices()
 
-        self.finalise_mesh()
+        with self.timer.span('finalise'):
+            self.finalise_mesh()
         self.loaded = True
 
     def load_panels(self):
@@ -1509,31 +1516,43 @@ class BoxMesh(wrappers.VisPattern):
             'dpi': 600,
             'fabric_grain_texture_path': None,  
             'fabric_grain_resolution': 1,
+            'rasterizer': 'pil',
+            'fabric_canvas_step': 10,
+            'fabric_cache_path': None,
+            'packing': 'maxrects',
+            'allow_rotation': False
         }
         # Update with incoming values, if any
         uv_config.update(in_uv_config)
 
-        uvs = texture_mesh_islands(
-            texture_coords=np.array(self.vertex_texture),
-            face_texture_coords=np.array([[tex_id0, tex_id1, tex_id2] for _, tex_id0, _, tex_id1, _, tex_id2, in self.faces_with_texture]), 
-            out_texture_image_path=self.paths.g_texture,
-            out_fabric_tex_image_path=self.paths.g_texture_fabric,
-            out_mtl_file_path=self.paths.g_mtl,
-            boundary_width=uv_config['seam_width'], 
-            dpi=uv_config['dpi'], 
-            background_img_path=uv_config['fabric_grain_texture_path'],
-            background_resolution=uv_config['fabric_grain_resolution'],
-            mat_name=mat_name
-        )
-        save_obj(
-            self.paths.g_box_mesh, 
-            self.vertices, 
-            self.faces_with_texture, 
-            uvs, 
-            vert_normals=self.eval_vertex_normals() if with_normals else None,
-            mtl_file_name=self.paths.g_mtl.name,
-            mat_name=mat_name
-        )
+        with self.timer.span('texture'):
+            uvs = texture_mesh_islands(
+                texture_coords=np.array(self.vertex_texture),
+                face_texture_coords=np.array([[tex_id0, tex_id1, tex_id2] for _, tex_id0, _, tex_id1, _, tex_id2, in self.faces_with_texture]), 
+                out_texture_image_path=self.paths.g_texture,
+                out_fabric_tex_image_path=self.paths.g_texture_fabric,
+                out_mtl_file_path=self.paths.g_mtl,
+                boundary_width=uv_config['seam_width'], 
+                dpi=uv_config['dpi'], 
+                background_img_path=uv_config['fabric_grain_texture_path'],
+                background_resolution=uv_config['fabric_grain_resolution'],
+                mat_name=mat_name,
+                rasterizer=uv_config['rasterizer'],
+                fabric_canvas_step=uv_config['fabric_canvas_step'],
+                fabric_cache_path=uv_config['fabric_cache_path'],
+                packing=uv_config['packing'],
+                allow_rotation=uv_config['allow_rotation']
+            )
+        with self.timer.span('box_mesh_obj'):
+            save_obj(
+                self.paths.g_box_mesh, 
+                self.vertices, 
+                self.faces_with_texture, 
+                uvs, 
+                vert_normals=self.eval_vertex_normals() if with_normals else None,
+                mtl_file_name=self.paths.g_mtl.name,
+                mat_name=mat_name
+            )
             
     def save_segmentation(self):
         """
@@ -1600,8 +1619,9 @@ class BoxMesh(wrappers.VisPattern):
             return
 
         self.paths = paths    
-        log_dir = super().serialize(self.paths.out_el, to_subfolder=False, tag=tag, with_3d=with_3d,
-                                    with_text=with_text, view_ids=view_ids, empty_ok=empty_ok)
+        with self.timer.span('pattern_files'):
+            log_dir = super().serialize(self.paths.out_el, to_subfolder=False, tag=tag, with_3d=with_3d,
+                                        with_text=with_text, view_ids=view_ids, empty_ok=empty_ok)
 
         if store_panels:
             # Store panel
@@ -1612,9 +1632,10 @@ class BoxMesh(wrappers.VisPattern):
 
 
         self.save_box_mesh_obj(with_normals=with_v_norms, in_uv_config=uv_config)
-        self.save_segmentation()
-        self.save_orig_lens()
-        self.save_vertex_labels()
+        with self.timer.span('box_mesh_info'):
+            self.save_segmentation()
+            self.save_orig_lens()
+            self.save_vertex_labels()
 
         # Copy yaml files
         if self.paths.in_design_params.exists():
@@ -0,0 +1,152 @@
+"""Prediction of the processing cost (box mesh generation + simulation time) of sewing patterns
+
+    Cost is predicted from cheap features of the pattern specification with a log-linear model
+    fitted on the stats of previous runs. It is used to schedule the expensive patterns first,
+    s.t. the long tail of the processing is formed by the cheap ones.
+"""
+from pathlib import Path
+import heapq
+import json
+import numpy as np
+
+from pygarment.data_index import DatasetIndex
+
+
+def spec_features(spec_path: Path, resolution_scale=1.0):
+    """Cheap features of the pattern specification
+        NOTE: Edges are approximated by straight lines
+    """
+    with open(spec_path, 'r') as f:
+        pattern = json.load(f)['pattern']
+
+    edge_length, area = 0., 0.
+    for panel in pattern['panels'].values():
+        vertices = np.asarray(panel['vertices'], dtype=float)
+        for edge in panel['edges']:
+            start, end = vertices[edge['endpoints'][0]], vertices[edge['endpoints'][1]]
+            edge_length += np.linalg.norm(end - start)
+        # Shoelace formula
+        x, y = vertices[:, 0], vertices[:, 1]
+        area += 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+    return {
+        'panels': len(pattern['panels']),
+        'stitches': len(pattern['stitches']),
+        'edge_length': edge_length,
+        'area': area,
+        # Vertices are spread with distance ~resolution_scale cm (see BoxMesh)
+        'vertex_estimate': area / resolution_scale**2 + edge_length / resolution_scale,
+    }
+
+
+class CostModel:
+    """log(cost) = w * [1, log(vertex_estimate), log(boundary vertices), log(panels)]
+        Before fitting, the cost is assumed to be proportional to the vertex estimate
+    """
+    def __init__(self, weights=None, resolution_scale=1.0):
+        self.weights = np.asarray(weights if weights is not None else [0., 1., 0., 0.], dtype=float)
+        self.resolution_scale = resolution_scale
+
+    def _design_matrix(self, features):
+        return np.array([
+            [1.,
+             np.log(max(f['vertex_estimate'], 1.)),
+             np.log(max(f['edge_length'] / self.resolution_scale, 1.)),
+             np.log(max(f['panels'], 1))]
+            for f in features])
+
+    def fit(self, features, costs):
+        """Fit the model to the observed costs (in seconds)"""
+        costs = np.asarray(costs, dtype=float)
+        X = self._design_matrix(features)
+        self.weights = np.linalg.lstsq(X, np.log(np.maximum(costs, 1e-3)), rcond=None)[0]
+        return self
+
+    def predict(self, features):
+        """Predicted costs (in seconds if fitted)"""
+        if not len(features):
+            return np.zeros(0)
+        return np.exp(self._design_matrix(features) @ self.weights)
+
+    def as_dict(self):
+        return {'weights': self.weights.tolist(), 'resolution_scale': self.resolution_scale}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['weights'], values['resolution_scale'])
+
+
+def recorded_costs(props):
+    """Per-sample processing time (meshgen + sim) recorded in dataset properties"""
+    stats = props['sim']['stats']
+    meshgen_time = stats.get('meshgen_time', {})
+    return {name: meshgen_time.get(name, 0.) + sim_time
+            for name, sim_time in stats.get('sim_time', {}).items()}
+
+
+def recorded_samples(sim_data_path: Path, props):
+    """Names, specification features and costs of the samples with recorded stats.
+        Specifications are read from the copies stored with the simulated samples
+    """
+    resolution_scale = props['sim']['config'].get('resolution_scale', 1.0)
+    index = DatasetIndex.find(sim_data_path)
+    spec_paths = None
+    if index is not None:
+        with index:
+            spec_paths = index.artifact_paths('specification.json')
+
+    names, features, costs = [], [], []
+    for name, cost in recorded_costs(props).items():
+        if spec_paths is not None:
+            spec_path = spec_paths.get(name)
+        else:
+            spec_path = Path(sim_data_path) / name / f'{name}_specification.json'
+            spec_path = spec_path if spec_path.exists() else None
+        if spec_path is not None:
+            names.append(name)
+            features.append(spec_features(spec_path, resolution_scale))
+            costs.append(cost)
+    return names, features, costs
+
+
+def fit_from_dataset(sim_data_path: Path, props, min_samples=10):
+    """Fit cost model to the stats of the simulated dataset.
+        Returns None if not enough samples are available
+    """
+    resolution_scale = props['sim']['config'].get('resolution_scale', 1.0)
+    _, features, costs = recorded_samples(sim_data_path, props)
+
+    if len(costs) < min_samples:
+        return None
+    return CostModel(resolution_scale=resolution_scale).fit(features, costs)
+
+
+def order_longest_first(names, predicted_costs):
+    """Names sorted by decreasing predicted cost"""
+    order = np.argsort(-np.asarray(predicted_costs), kind='stable')
+    return [names[i] for i in order]
+
+
+def balance_shards(names, predicted_costs, num_shards):
+    """Split names into shards of about equal total predicted cost.
+        Longest processing time first: every name, from the most expensive one, 
+        goes to the shard with the smallest total cost so far.
+        Names within a shard are kept in the longest-first order
+    """
+    shards = [[] for _ in range(num_shards)]
+    loads = [(0., shard_id) for shard_id in range(num_shards)]   # Ties go to the lower shard id
+    for i in np.argsort(-np.asarray(predicted_costs), kind='stable'):
+        load, shard_id = heapq.heappop(loads)
+        shards[shard_id].append(names[i])
+        heapq.heappush(loads, (load + float(predicted_costs[i]), shard_id))
+    return shards
+
+
+def makespan(costs, num_workers):
+    """Finishing time of processing the jobs in the given order by a pool of workers
+        (every job is taken by the first free worker)
+    """
+    workers = [0.] * num_workers
+    for cost in costs:
+        heapq.heappush(workers, heapq.heappop(workers) + cost)
+    return max(workers)
@@ -1,23 +1,30 @@
 """Routines to run cloth simulation"""
 
 # Basic
+import copy
 import time
 import multiprocessing
 import platform
 import signal
+from contextlib import contextmanager
 from pathlib import Path
 
 # BoxMeshGen
 import pygarment.meshgen.boxmeshgen as bmg
 from pygarment.meshgen.boxmeshgen import BoxMesh
-from pygarment.meshgen.sim_config import PathCofig
+from pygarment.meshgen.sim_config import PathCofig, SimConfig
+import pygarment.meshgen.cost_model as cost_model
+from pygarment.data_config import Properties
+from pygarment.data_index import DatasetIndex
 
 # Warp simulation
-from pygarment.meshgen.simulation import run_sim
+from pygarment.meshgen.simulation import run_sim, run_sim_batch
+from pygarment.meshgen.garment import ClothBatch
 
 
 def batch_sim(data_path, output_path, dataset_props,
-              run_default_body=False, num_samples=None, caching=False, force_restart=False):
+              run_default_body=False, num_samples=None, caching=False, force_restart=False,
+              pattern_names=None, props_file=None, index_file=None, lease=None, pattern_costs=None):
     """
         Performs pattern simulation for each example in the dataset
         given by dataset_props.
@@ -40,6 +47,14 @@ def batch_sim(data_path, output_path, dataset_props,
             * num_samples -- number of (unprocessed) samples from dataset to process with this run. If None, runs over all unprocessed samples
             * caching -- enables caching of every frame of simulation (disabled by default)
             * force_restart -- force restarting the batch processing even if resume conditions are met.
+            * pattern_names -- subset of patterns to process (e.g. a shard of the dataset). All the patterns in data_path by default
+            * props_file -- file to log the dataset properties to. Defaults to dataset_properties_<body type>.yaml in the output_path
+            * index_file -- dataset index to record the processed samples to. Defaults to the index in the output_path
+            * lease -- (ShardLease) of the shard the patterns belong to. The props file is only written while 
+                the lease is owned, and processing stops without saving the dataset properties any further
+                once the lease is lost, e.g. when it is taken over by another node
+            * pattern_costs -- predicted processing costs {pattern name: cost} to order the patterns by
+                with 'longest_first' (see _pattern_costs()). Predicted by this call if not given
 
     """
     # ----- Init -----
@@ -50,20 +65,49 @@ def batch_sim(data_path, output_path, dataset_props,
 
     resume = init_sim_props(dataset_props, batch_run=True, force_restart=force_restart)
     body_type = 'default_body' if run_default_body else 'random_body'
-    data_props_file = output_path / f'dataset_properties_{body_type}.yaml'
-    pattern_names = _get_pattern_names(data_path)
+    data_props_file = props_file or output_path / f'dataset_properties_{body_type}.yaml'
+    if pattern_names is None:
+        pattern_names = _get_pattern_names(data_path)
+
+    sim_config = dataset_props['sim']['config']
+    if get_dict_default_value(sim_config, 'longest_first', False):
+        if pattern_costs is None:
+            pattern_costs = _pattern_costs(data_path, output_path, dataset_props, pattern_names)
+        pattern_names = cost_model.order_longest_first(
+            pattern_names, [pattern_costs.get(name, 0.) for name in pattern_names])
+
+    # Index of the simulated samples
+    index = DatasetIndex(index_file or output_path / DatasetIndex.file_name)
+    source_index = DatasetIndex.find(data_path.parent)
+
+    # Batched simulation of small garments
+    sim_batch_size = get_dict_default_value(sim_config, 'sim_batch_size', 1)
+    if sim_batch_size > 1:
+        unsupported = ClothBatch.unsupported(SimConfig(sim_config))
+        if unsupported:
+            print(f'Sim::WARNING::Batched simulation does not support {unsupported}. '
+                  'Garments are simulated individually')
+            sim_batch_size = 1
+    dataset_props['sim']['stats'].setdefault('pending', [])
+    sim_batch_max_faces = get_dict_default_value(sim_config, 'sim_batch_max_faces', 10000)
+    batch_paths = []   # Generated garments waiting for simulation
 
     # Simulate every template
     count = 0
     for pattern_name in pattern_names:
+        if lease is not None and lease.lost.is_set():
+            break
+
         # skip processed cases -- in case of resume. First condition needed to skip checking second one on False =)
         if resume and pattern_name in dataset_props['sim']['stats']['processed']:
             print(f'Skipped as already processed {pattern_name}')
             continue
 
         dataset_props['sim']['stats']['processed'].append(pattern_name)
-        _serialize_props_with_sim_stats(dataset_props,
-                                        data_props_file)  # save info of processed files before potential crash
+        # save info of processed files before potential crash
+        if not _serialize_props_with_sim_stats(dataset_props, data_props_file, lease):
+            break
+        index.set_stage(pattern_name, 'sim', 'started')
 
         try:
             paths = PathCofig(
@@ -78,13 +122,54 @@ def batch_sim(data_path, output_path, dataset_props,
             # Not all files available
             print("***Pattern loading failed (paths)***")
             dataset_props.add_fail('sim', 'crashes', pattern_name)
+            index.set_stage(pattern_name, 'sim', 'failed', 'crashes')
         else:
-            template_simulation(paths, dataset_props, caching=caching)
+            overrides = _pending_resim_overrides(dataset_props, pattern_name)
+            if overrides is not None:
+                # Escalated re-simulation of a failed sample -- always simulated individually
+                with _sim_config_overrides(sim_config, overrides):
+                    template_simulation(paths, dataset_props, caching=caching)
+                _index_samples(index, source_index, [paths], dataset_props)
+            elif sim_batch_size > 1 and not caching:
+                face_count = template_simulation(paths, dataset_props, simulate=False)
+                if face_count is not None and face_count <= sim_batch_max_faces:
+                    # NOTE: Buffered garments are pending until the batch is simulated, 
+                    # s.t. the whole batch is re-queued if the run stops before that
+                    batch_paths.append(paths)
+                    dataset_props['sim']['stats']['processed'].remove(pattern_name)
+                    dataset_props['sim']['stats']['pending'].append(pattern_name)
+                    _serialize_props_with_sim_stats(dataset_props, data_props_file, lease)
+                else:
+                    if face_count is not None:
+                        # Large garments are simulated individually
+                        simulate_garments([paths], dataset_props)
+                    _index_samples(index, source_index, [paths], dataset_props)
+                if len(batch_paths) >= sim_batch_size:
+                    _simulate_pending(batch_paths, dataset_props, data_props_file, index, source_index, lease)
+                    batch_paths = []
+            else:
+                template_simulation(paths, dataset_props, caching=caching)
+                _index_samples(index, source_index, [paths], dataset_props)
 
         count += 1  # count actively processed cases
         if num_samples is not None and count >= num_samples:  # only process requested number of samples
             break
 
+    if lease is not None and lease.lost.is_set():
+        # NOTE: The new owner of the work continues from the saved properties, 
+        # pending garments are re-queued there
+        print('Sim::WARNING::Processing is stopped')
+        index.close()
+        if source_index is not None:
+            source_index.close()
+        return False
+
+    if batch_paths:
+        _simulate_pending(batch_paths, dataset_props, data_props_file, index, source_index, lease)
+    index.close()
+    if source_index is not None:
+        source_index.close()
+
     # Fin
     print(f'\nFinished batch of {data_path}')  
     try:
@@ -101,50 +186,170 @@ def batch_sim(data_path, output_path, dataset_props,
         pass
 
     # Logs
-    _serialize_props_with_sim_stats(dataset_props, data_props_file)
+    if not _serialize_props_with_sim_stats(dataset_props, data_props_file, lease):
+        print('Sim::WARNING::Processing is stopped')
+        return False
 
     return process_finished
 
 
+def _simulate_pending(batch_paths, dataset_props, data_props_file, index, source_index, lease=None):
+    """Simulate the buffered batch of garments and mark them as processed"""
+    simulate_garments(batch_paths, dataset_props)
+    _index_samples(index, source_index, batch_paths, dataset_props)
+
+    sim_stats = dataset_props['sim']['stats']
+    for paths in batch_paths:
+        sim_stats['pending'].remove(paths.in_tag)
+        sim_stats['processed'].append(paths.in_tag)
+    _serialize_props_with_sim_stats(dataset_props, data_props_file, lease)
+
+
 def resim_fails(data_path, output_path, dataset_props,
-              run_default_body=False, caching=False):
-    """Resimulate failure cases -- maybe some of them would get fixed"""
+              run_default_body=False, caching=False, pattern_names=None, props_file=None, index_file=None, 
+              lease=None, pattern_costs=None):
+    """Resimulate failure cases following the escalation ladder of their failure category
+
+        'resim_escalation' of the sim config maps failure categories (keys of the fails stats)
+        to the lists of sim config overrides applied on the subsequent attempts, e.g.
+            resim_escalation:
+              simulation_timeout:
+              - max_sim_time: 1200
+              - {max_sim_time: 1200, resolution_scale: 1.5}
+        The 'default' ladder is used for the categories not listed, except for the intersection fails
+        that are only resimulated if listed explicitly.
+        Without the escalation config, failed samples are resimulated once with the same settings.
+
+        Every attempt and its outcome are recorded in 'resim_attempts' sim stats
+
+        * pattern_names, props_file, index_file, lease, pattern_costs -- see batch_sim(). 
+            The costs are predicted once for all the attempts if not given
+    """
 
     print('************** RESIMULATING FAILS ****************')
 
     sim_stats = dataset_props['sim']['stats']
-    
-    # Collect fails and remove them from fails list if any
-    fails = sim_stats['fails']
-    to_resim = set()
-    for key in fails:
-        if key not in ['cloth_body_intersection', 'cloth_self_intersection']:
-            for el in fails[key]:
-                to_resim.add(el)
-            fails[key] = []   # NOTE: If nothing to be added in this key, it was already an empty array (and nothing changed)
-    
-    if not len(to_resim):
-        # Return previous finished state
-        return dataset_props['frozen'] if 'frozen' in dataset_props else False
-    
-    if 'processed' not in sim_stats:
-        sim_stats['processed'] = _get_pattern_names(data_path)
-    dataset_props['frozen'] = False
-
-    # Remove fails from processed to trigger re-simulation
-    for sample in to_resim:
-        sim_stats['processed'].remove(sample)
-
-    # Start simulation again
-    finished = batch_sim(
-        data_path, output_path, dataset_props, 
-        run_default_body=run_default_body, 
-        num_samples=len(to_resim)+1, 
-        caching=caching, 
-        force_restart=False
-    )
-
-    return finished
+    ladders = get_dict_default_value(dataset_props['sim']['config'], 'resim_escalation', None)
+    if ladders is None:
+        ladders = {'default': [{}]}
+    if 'resim_attempts' not in sim_stats:
+        sim_stats['resim_attempts'] = {}
+    attempts = sim_stats['resim_attempts']
+
+    finished = dataset_props['frozen'] if 'frozen' in dataset_props else False
+    while True:
+        # NOTE: Attempts could be left pending by the interrupted runs
+        _record_resim_outcomes(sim_stats)
+
+        to_resim = _next_resim_attempts(sim_stats['fails'], attempts, ladders)
+        if not len(to_resim):
+            # Return previous finished state
+            return finished
+
+        if 'processed' not in sim_stats:
+            sim_stats['processed'] = list(pattern_names if pattern_names is not None else _get_pattern_names(data_path))
+        dataset_props['frozen'] = False
+
+        # Remove fails from stats and from processed to trigger re-simulation
+        for sample, (category, step) in to_resim.items():
+            for fail_list in sim_stats['fails'].values():
+                if sample in fail_list:
+                    fail_list.remove(sample)
+            if sample in sim_stats['processed']:
+                sim_stats['processed'].remove(sample)
+
+            if sample not in attempts:
+                attempts[sample] = []
+            attempts[sample].append({
+                'category': category,
+                'step': step,
+                'overrides': ladders[category][step] if category in ladders else ladders['default'][step],
+                'outcome': None
+            })
+        print(f'Resimulating {len(to_resim)} failed samples')
+        if pattern_costs is None:
+            pattern_costs = _pattern_costs(data_path, output_path, dataset_props, pattern_names)
+
+        # Start simulation again
+        finished = batch_sim(
+            data_path, output_path, dataset_props, 
+            run_default_body=run_default_body, 
+            num_samples=len(to_resim)+1, 
+            caching=caching, 
+            force_restart=False,
+            pattern_names=pattern_names,
+            props_file=props_file,
+            index_file=index_file,
+            lease=lease,
+            pattern_costs=pattern_costs
+        )
+        if not finished:
+            # Pending attempts are resumed by the next batch_sim() call
+            return finished
+
+
+def _next_resim_attempts(fails, attempts, ladders):
+    """Failed samples that have steps left on the escalation ladder of their failure category
+
+        Returns {sample name: (category, step)}
+    """
+    to_resim = {}
+    for category, samples in fails.items():
+        if category in ladders:
+            ladder = ladders[category]
+        elif category in ['cloth_body_intersection', 'cloth_self_intersection']:
+            continue
+        else:
+            ladder = get_dict_default_value(ladders, 'default', [])
+
+        for sample in samples:
+            if sample in to_resim:
+                continue
+            # NOTE: Ladder of each category is climbed independently
+            step = sum([attempt['category'] == category for attempt in attempts.get(sample, [])])
+            if step < len(ladder):
+                to_resim[sample] = (category, step)
+    return to_resim
+
+
+def _record_resim_outcomes(sim_stats):
+    """Record outcomes of the pending re-simulation attempts of processed samples"""
+    processed = sim_stats['processed'] if 'processed' in sim_stats else None
+    for sample, sample_attempts in sim_stats['resim_attempts'].items():
+        attempt = sample_attempts[-1]
+        if attempt['outcome'] is not None or (processed is not None and sample not in processed):
+            continue
+        fails = [category for category, samples in sim_stats['fails'].items() if sample in samples]
+        attempt['outcome'] = 'failed' if fails else 'success'
+        attempt['fails'] = fails
+
+
+def _pending_resim_overrides(props, name):
+    """Sim config overrides of the pending re-simulation attempt of the sample, if any"""
+    attempts = get_dict_default_value(props['sim']['stats'], 'resim_attempts', {})
+    if name in attempts and attempts[name][-1]['outcome'] is None:
+        return attempts[name][-1]['overrides'] or {}
+    return None
+
+
+@contextmanager
+def _sim_config_overrides(sim_config, overrides):
+    """Temporarily update (nested) values of the sim config"""
+    backup = copy.deepcopy(sim_config)
+    _update_nested(sim_config, overrides)
+    try:
+        yield sim_config
+    finally:
+        sim_config.clear()
+        sim_config.update(backup)
+
+
+def _update_nested(values, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(values.get(key), dict):
+            _update_nested(values[key], value)
+        else:
+            values[key] = value
 
 # ------- Utils -------
 def init_sim_props(props, batch_run=False, force_restart=False):
@@ -236,21 +441,34 @@ def init_sim_props(props, batch_run=False, force_restart=False):
     if batch_run and 'processed' in props['sim']['stats'] and not force_restart:
         # resuming existing batch processing -- do not clean stats
         # Assuming the last example processed example caused the failure
-        last_processed = props['sim']['stats']['processed'][-1]
-
-        if not any([(name in last_processed) or (last_processed in name) for name in
-                    props['render']['stats']['render_time']]):
-            # crash detected -- the last example does not appear in the stats
-            if last_processed not in props['sim']['stats']['fails']['crashes']:
-                # add to simulation failures
-                # Remove last from processed if it did not crash
-                if last_processed not in props['sim']['stats']['stop_over']:   
-                    props['sim']['stats']['processed'].pop()
-                else:
-                    # Already passed here once -> add as crash
-                    props['sim']['stats']['fails']['crashes'].append(last_processed)
-
-        props['sim']['stats']['stop_over'].append(last_processed)  # indicate resuming dataset simulation
+        sim_stats = props['sim']['stats']
+        if sim_stats['processed']:
+            last_processed = sim_stats['processed'][-1]
+
+            # NOTE: Save time is recorded once the results of the sample are stored (and rendered inline)
+            completed = get_dict_default_value(sim_stats, 'save_time', {})
+            if not any([(name in last_processed) or (last_processed in name) for name in completed]):
+                # crash detected -- the last example does not appear in the stats
+                if last_processed not in sim_stats['fails']['crashes']:
+                    # add to simulation failures
+                    # Remove last from processed if it did not crash
+                    if last_processed not in sim_stats['stop_over']:   
+                        sim_stats['processed'].pop()
+                    else:
+                        # Already passed here once -> add as crash
+                        sim_stats['fails']['crashes'].append(last_processed)
+
+            sim_stats['stop_over'].append(last_processed)  # indicate resuming dataset simulation
+
+        # Garments buffered for batched simulation when the run stopped were not simulated (or crashed with the batch). 
+        # They are re-queued, or added as crashes if stopped the run already once
+        for name in sim_stats['pending'] if 'pending' in sim_stats else []:
+            if name in sim_stats['stop_over']:
+                if name not in sim_stats['fails']['crashes']:
+                    sim_stats['fails']['crashes'].append(name)
+                sim_stats['processed'].append(name)
+            sim_stats['stop_over'].append(name)
+        sim_stats['pending'] = []
 
 
         return True
@@ -263,6 +481,7 @@ def init_sim_props(props, batch_run=False, force_restart=False):
                             sim_time={}, 
                             spf={}, 
                             fin_frame={}, 
+                            save_time={},
                             face_count={},
                             body_collisions={}, 
                             self_collisions={})
@@ -281,14 +500,17 @@ def init_sim_props(props, batch_run=False, force_restart=False):
     props.set_section_stats('render', render_time={})
 
     if batch_run:  # track batch processing
-        props.set_section_stats('sim', processed=[], stop_over=[])
+        props.set_section_stats('sim', processed=[], stop_over=[], pending=[])
 
     return False
 
 
-def template_simulation(paths: PathCofig, props, caching=False):
+def template_simulation(paths: PathCofig, props, caching=False, simulate=True):
     """
         Simulate given template within given scene & save log files
+        * simulate -- if False, only the box mesh is created (e.g. for later batched simulation)
+
+        Returns the number of faces of the box mesh, or None if box mesh generation failed
     """
     sim_props = props['sim']
     res = sim_props['config']['resolution_scale']
@@ -347,6 +569,11 @@ def template_simulation(paths: PathCofig, props, caching=False):
             store_panels=store_panels,
             uv_config=props['render']['config']['uv_texture']
         )
+        # NOTE: Simulation stages are added by the simulator
+        sim_props['stats'].setdefault('stage_time', {})[garment.name] = garment.timer.as_stats('meshgen.')
+
+        if not simulate:
+            return len(garment.faces)
 
         run_sim(
             garment.name,  
@@ -355,8 +582,37 @@ def template_simulation(paths: PathCofig, props, caching=False):
             save_v_norms=vertex_normals,
             store_usd=caching,  # NOTE: False for fast simulation!, 
             optimize_storage=sim_props['config']['optimize_storage'],
+            storage_format=get_dict_default_value(sim_props['config'], 'storage_format', 'ply'),
             verbose=False
         )
+        return len(garment.faces)
+
+def simulate_garments(paths_list, props):
+    """Simulate garments with already generated box meshes, 
+        several garments at once if more than one is given
+    """
+    sim_config = props['sim']['config']
+    vertex_normals = get_dict_default_value(sim_config['options'], 'store_vertex_normals', False)
+    storage_format = get_dict_default_value(sim_config, 'storage_format', 'ply')
+
+    if len(paths_list) == 1:
+        run_sim(
+            paths_list[0].in_tag, 
+            props, 
+            paths_list[0],
+            save_v_norms=vertex_normals,
+            optimize_storage=sim_config['optimize_storage'],
+            storage_format=storage_format,
+        )
+    else:
+        run_sim_batch(
+            [paths.in_tag for paths in paths_list], 
+            props, 
+            paths_list,
+            save_v_norms=vertex_normals,
+            optimize_storage=sim_config['optimize_storage'],
+            storage_format=storage_format,
+        )
 
 def _load_boxmesh_timeout(garment, timeout_after):
     if platform.system() == "Windows":
@@ -397,13 +653,97 @@ def get_dict_default_value(props, name, default_value):
         return props[name]
     return default_value
 
-def _serialize_props_with_sim_stats(dataset_props, filename):
-    """Compute data processing statistics and serialize props to file"""
+def _serialize_props_with_sim_stats(dataset_props, filename, lease=None):
+    """Compute data processing statistics and serialize props to file.
+        With the shard lease given, the file is only replaced while the lease is owned.
+        Returns False if the lease is lost
+    """
     dataset_props.stats_summary()
-    dataset_props.serialize(filename)
+    if lease is None:
+        dataset_props.serialize(filename)
+        return True
+    tmp_path = lease.tmp_path(filename)
+    dataset_props.serialize(tmp_path)
+    return lease.commit_file(tmp_path, filename)
+
+
+def _predict_costs(data_path: Path, output_path: Path, dataset_props, pattern_names):
+    """Predicted processing cost of the patterns.
+        The cost model is fitted to the stats of the reference dataset (if given in 'cost_model_reference'),
+        or to the already processed part of the current one
+    """
+    sim_config = dataset_props['sim']['config']
+    resolution_scale = get_dict_default_value(sim_config, 'resolution_scale', 1.0)
+
+    model = None
+    reference = get_dict_default_value(sim_config, 'cost_model_reference', None)
+    if reference:
+        reference = Path(reference)
+        props_files = sorted(reference.glob('dataset_properties*.yaml'))
+        if props_files:
+            model = cost_model.fit_from_dataset(reference, Properties(props_files[0]))
+    elif 'stats' in dataset_props['sim']:
+        model = cost_model.fit_from_dataset(output_path, dataset_props)
+
+    if model is None:
+        print('Cost model: not enough recorded stats to fit. Ordering by the estimated number of vertices')
+        model = cost_model.CostModel(resolution_scale=resolution_scale)
+    model.resolution_scale = resolution_scale
+
+    costs = []
+    for name in pattern_names:
+        spec_path = data_path / name / f'{name}_specification.json'
+        try:
+            costs.append(model.predict([cost_model.spec_features(spec_path, resolution_scale)])[0])
+        except (OSError, KeyError, ValueError):
+            costs.append(0.)   # Broken samples go last
+
+    return costs
+
+
+def _pattern_costs(data_path: Path, output_path: Path, dataset_props, pattern_names=None):
+    """Predicted processing costs {pattern name: cost} to order the patterns by with 'longest_first',
+        None if the patterns are not ordered by cost.
+        Predicting the costs fits the cost model and reads every pattern, s.t. the costs are predicted 
+        once per run and passed to the batch_sim() calls.
+        NOTE: The order does not change the total time of processing the patterns one by one in a single loop.
+        It only reduces the makespan when the patterns are taken from a shared queue by several workers.
+        Work split between the nodes is balanced by the cost in ShardManifest instead
+    """
+    if 'sim' not in dataset_props or not get_dict_default_value(dataset_props['sim']['config'], 'longest_first', False):
+        return None
+    if pattern_names is None:
+        pattern_names = _get_pattern_names(data_path)
+    return dict(zip(pattern_names, _predict_costs(data_path, output_path, dataset_props, pattern_names)))
+
+
+def _index_samples(index: DatasetIndex, source_index, paths_list, props):
+    """Record the processed samples, their files and the status of processing stages in the dataset index"""
+    fails = props['sim']['stats']['fails']
+    render_time = props['render']['stats']['render_time']
+    for paths in paths_list:
+        name = paths.in_tag
+        source = source_index.sample(name) if source_index is not None else None
+
+        index.add_sample_folder(
+            name, paths.out_el, 
+            design_hash=source['design_hash'] if source else None, 
+            body_id=paths.in_body_obj.stem)
+        sample_fails = [category for category, samples in fails.items() if name in samples]
+        index.set_stage(name, 'sim', 'failed' if sample_fails else 'done', ','.join(sample_fails) or None)
+        if name in render_time:
+            index.set_stage(name, 'render', 'done')
 
 
 def _get_pattern_names(data_path: Path):
+    # NOTE: The index of the sewing pattern dataset is stored next to the data folder
+    index = DatasetIndex.find(data_path.parent)
+    if index is not None:
+        with index:
+            names = index.names(stage='sampling', status='done')
+        if names:
+            return names
+
     names = []
     to_ignore = ['renders']  # special dirs not to include in the pattern list
     for el in data_path.iterdir():
@@ -0,0 +1,206 @@
+"""Compact capture of the simulated garment animation for debugging
+
+    Topology (garment and body faces) is stored once. Garment positions are quantized
+    to a fixed grid step and stored in chunks: the first frame of each chunk as an absolute
+    keyframe, the rest as int16 deltas to the previous frame. Body vertices are only
+    stored when the body shape changes (e.g. body smoothing stages).
+
+    The container is a zip of .npy arrays written incrementally during the simulation,
+    so it could also be opened with np.load() as a regular .npz file.
+"""
+from pathlib import Path
+import io
+import zipfile
+import zlib
+import numpy as np
+
+_INT16_MAX = np.iinfo(np.int16).max
+
+
+def is_captured(name, rate):
+    """Deterministic selection of a 'rate' fraction of samples for capture by sample name"""
+    if not rate:
+        return False
+    return zlib.crc32(name.encode('utf-8')) / 2**32 < rate
+
+
+class FrameCapture:
+    """Writes the simulated frames into a chunked compressed container"""
+    def __init__(self, path: Path, faces, body_faces=None, precision=0.01, chunk_size=60):
+        """
+            * faces -- garment faces
+            * body_faces -- body faces, if body is to be captured
+            * precision -- quantization step of vertex positions (in sim units)
+            * chunk_size -- number of frames between keyframes
+        """
+        self.path = Path(path)
+        self.precision = precision
+        self.chunk_size = chunk_size
+
+        self.frames = []       # Simulation frame number of each captured frame
+        self.chunk_sizes = []
+
+        # NOTE: Fast compression level keeps the capture cheap, deltas compress well anyway
+        self._zip = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._key = None       # Keyframe of the current chunk (quantized)
+        self._prev = None      # Last captured frame (quantized)
+        self._deltas = []
+
+        self._write('faces', np.asarray(faces, dtype=np.int32).reshape(-1, 3))
+        if body_faces is not None:
+            self._write('body_faces', np.asarray(body_faces, dtype=np.int32).reshape(-1, 3))
+        self._write('precision', np.asarray(precision, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _write(self, name, array):
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        self._zip.writestr(f'{name}.npy', buffer.getvalue())
+
+    def _flush_chunk(self):
+        if self._key is None:
+            return
+        chunk_id = len(self.chunk_sizes)
+        self._write(f'chunk_{chunk_id:05d}_key', self._key)
+        self._write(
+            f'chunk_{chunk_id:05d}_deltas',
+            np.stack(self._deltas) if self._deltas else np.zeros((0,) + self._key.shape, dtype=np.int16))
+        self.chunk_sizes.append(len(self._deltas) + 1)
+
+        self._key, self._prev, self._deltas = None, None, []
+
+    def record(self, frame, vertices, body_vertices=None):
+        """Capture garment vertices of the frame.
+            * body_vertices -- provide when the body shape has changed since the last capture
+        """
+        quantized = np.round(np.asarray(vertices, dtype=np.float64) / self.precision).astype(np.int32)
+
+        if self._key is not None:
+            delta = quantized - self._prev
+            if len(self._deltas) + 1 >= self.chunk_size or np.abs(delta).max() > _INT16_MAX:
+                self._flush_chunk()
+
+        if self._key is None:
+            self._key = quantized
+        else:
+            self._deltas.append((quantized - self._prev).astype(np.int16))
+        self._prev = quantized
+
+        if body_vertices is not None:
+            self._write(f'body_{len(self.frames):05d}', np.asarray(body_vertices, dtype=np.float32))
+        self.frames.append(frame)
+
+    def close(self):
+        if self._zip is None:
+            return
+        self._flush_chunk()
+        self._write('frames', np.asarray(self.frames, dtype=np.int32))
+        self._write('chunk_sizes', np.asarray(self.chunk_sizes, dtype=np.int32))
+        self._zip.close()
+        self._zip = None
+
+
+class CapturedAnimation:
+    """Random access reader of the frames written by FrameCapture"""
+    def __init__(self, path: Path):
+        self._data = np.load(path)
+
+        self.faces = self._data['faces']
+        self.body_faces = self._data['body_faces'] if 'body_faces' in self._data.files else None
+        self.precision = float(self._data['precision'])
+        self.frames = self._data['frames']
+
+        self._chunk_starts = np.concatenate([[0], np.cumsum(self._data['chunk_sizes'])])
+        self._body_ids = np.array(sorted(
+            int(name.split('_')[1]) for name in self._data.files if name.startswith('body_0')), dtype=int)
+
+        self._cached_chunk_id, self._cached_chunk = None, None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.vertices(i)
+
+    def _chunk(self, chunk_id):
+        if chunk_id != self._cached_chunk_id:
+            key = self._data[f'chunk_{chunk_id:05d}_key']
+            deltas = self._data[f'chunk_{chunk_id:05d}_deltas'].astype(np.int32)
+            quantized = np.concatenate([key[np.newaxis], key + np.cumsum(deltas, axis=0)])
+            self._cached_chunk_id, self._cached_chunk = chunk_id, quantized
+        return self._cached_chunk
+
+    def vertices(self, i):
+        """Garment vertices of the i-th captured frame"""
+        if i < 0:
+            i += len(self)
+        chunk_id = np.searchsorted(self._chunk_starts, i, side='right') - 1
+        return self._chunk(chunk_id)[i - self._chunk_starts[chunk_id]] * self.precision
+
+    def body_vertices(self, i):
+        """Body vertices as of the i-th captured frame. None if body was not captured"""
+        if i < 0:
+            i += len(self)
+        ids = self._body_ids[self._body_ids <= i]
+        if not len(ids):
+            return None
+        return self._data[f'body_{ids[-1]:05d}']
+
+    def mesh(self, i):
+        """Garment mesh of the i-th captured frame as trimesh object"""
+        import trimesh
+
+        return trimesh.Trimesh(self.vertices(i), self.faces, process=False)
+
+    def body_mesh(self, i):
+        import trimesh
+
+        body_vertices = self.body_vertices(i)
+        if body_vertices is None or self.body_faces is None:
+            return None
+        return trimesh.Trimesh(body_vertices, self.body_faces, process=False)
+
+
+def replay(path: Path, fps=30, loop=False):
+    """Play the captured animation in an interactive pyrender viewer"""
+    import time
+    import pyrender
+
+    animation = CapturedAnimation(path)
+
+    scene = pyrender.Scene()
+    cloth_node = scene.add(pyrender.Mesh.from_trimesh(animation.mesh(0), smooth=False))
+    body_node, body_id = None, None
+
+    viewer = pyrender.Viewer(scene, run_in_thread=True, use_raymond_lighting=True)
+    while viewer.is_active:
+        for i in range(len(animation)):
+            if not viewer.is_active:
+                break
+            cloth_mesh = pyrender.Mesh.from_trimesh(animation.mesh(i), smooth=False)
+
+            # Body is only updated when changed
+            new_body_id = animation._body_ids[animation._body_ids <= i]
+            new_body_id = new_body_id[-1] if len(new_body_id) else None
+            body_mesh = None
+            if new_body_id != body_id and animation.body_faces is not None:
+                body_mesh = pyrender.Mesh.from_trimesh(animation.body_mesh(i), smooth=False)
+
+            with viewer.render_lock:
+                scene.remove_node(cloth_node)
+                cloth_node = scene.add(cloth_mesh)
+                if body_mesh is not None:
+                    if body_node is not None:
+                        scene.remove_node(body_node)
+                    body_node = scene.add(body_mesh)
+                    body_id = new_body_id
+
+            time.sleep(1. / fps)
+
+        if not loop:
+            # Keep the last frame on screen until the viewer is closed
+            while viewer.is_active:
+                time.sleep(0.1)
@@ -1,4 +1,6 @@
+import copy
 import igl
+import math
 import json
 import pickle
 import numpy as np
@@ -14,38 +16,144 @@ from warp.sim.integrator_xpbd import replace_mesh_points
 
 # Custom
 from pygarment.meshgen.sim_config import PathCofig, SimConfig
+from pygarment.meshgen.substep_controller import SubstepController
+from pygarment.meshgen.body_lod import get_body_lod
+from pygarment.meshgen.mesh_connectivity import vertex_vertex_csr, CSRAdjacency
+from pygarment.meshgen.stage_timer import StageTimer
+from pygarment.meshgen.render.texture_utils import read_obj_uvs
 from pygarment.pattern.core import BasicPattern
 
+
+@wp.kernel
+def count_non_static_particles(
+        particle_q: wp.array(dtype=wp.vec3),
+        particle_q_prev: wp.array(dtype=wp.vec3),
+        threshold: float,
+        non_static_count: wp.array(dtype=wp.int32)):
+    """Count particles that moved more than threshold (L1 norm) since the last frame"""
+    tid = wp.tid()
+    diff = particle_q[tid] - particle_q_prev[tid]
+    if wp.abs(diff[0]) + wp.abs(diff[1]) + wp.abs(diff[2]) > threshold:
+        wp.atomic_add(non_static_count, 0, 1)
+
+
+@wp.kernel
+def max_particle_displacement(
+        particle_q: wp.array(dtype=wp.vec3),
+        particle_q_prev: wp.array(dtype=wp.vec3),
+        max_displacement: wp.array(dtype=float)):
+    tid = wp.tid()
+    wp.atomic_max(max_displacement, 0, wp.length(particle_q[tid] - particle_q_prev[tid]))
+
+
+@wp.kernel
+def particle_velocity_stats(
+        particle_qd: wp.array(dtype=wp.vec3),
+        stats: wp.array(dtype=float)):
+    """Accumulate max (stats[0]) and sum (stats[1]) of particle speeds"""
+    tid = wp.tid()
+    speed = wp.length(particle_qd[tid])
+    wp.atomic_max(stats, 0, speed)
+    wp.atomic_add(stats, 1, speed)
+
+
+@wp.kernel
+def count_non_static_garment_particles(
+        particle_q: wp.array(dtype=wp.vec3),
+        particle_q_prev: wp.array(dtype=wp.vec3),
+        particle_garment: wp.array(dtype=wp.int32),
+        threshold: float,
+        non_static_count: wp.array(dtype=wp.int32)):
+    """Count particles of each garment that moved more than threshold (L1 norm) since the last frame"""
+    tid = wp.tid()
+    diff = particle_q[tid] - particle_q_prev[tid]
+    if wp.abs(diff[0]) + wp.abs(diff[1]) + wp.abs(diff[2]) > threshold:
+        wp.atomic_add(non_static_count, particle_garment[tid], 1)
+
+
+@wp.kernel
+def restore_frozen_particles(
+        particle_q: wp.array(dtype=wp.vec3),
+        particle_qd: wp.array(dtype=wp.vec3),
+        frozen_q: wp.array(dtype=wp.vec3),
+        particle_garment: wp.array(dtype=wp.int32),
+        garment_frozen: wp.array(dtype=wp.int32)):
+    """Keep particles of the frozen garments in their final state"""
+    tid = wp.tid()
+    if garment_frozen[particle_garment[tid]] != 0:
+        particle_q[tid] = frozen_q[tid]
+        particle_qd[tid] = wp.vec3(0.0, 0.0, 0.0)
+
+
 class Cloth:
     def __init__(self, 
                  name, config: SimConfig, paths: PathCofig, 
-                 caching=False):
+                 caching=False, 
+                 builder=None, offset=0., shared_bodies=None, particle_filters=None):
+        """
+            * builder -- if given, the garment is only added to this (shared) model builder 
+                as a member of ClothBatch, and no model is created
+            * offset -- placement of the garment (and its body) along the x axis in the shared model
+            * shared_bodies -- body path -> collision meshes to reuse between the garments of a batch
+            * particle_filters -- body collision filter ids of the particles of the garments 
+                already added to the shared builder, see add_to_builder()
+        """
 
         self.caching = caching   # Saves intermediate frames, extra logs, etc.
         self.paths = paths
         self.name = name
         self.config = config
+        self.timer = StageTimer()   # Time of the processing stages
 
         self.sim_fps = config.sim_fps
-        self.sim_substeps = config.sim_substeps
         self.zero_gravity_steps = config.zero_gravity_steps
-        self.sim_dt = (1.0 / self.sim_fps) / self.sim_substeps
         self.usd_frame_time = 0.0 
         self.sim_use_graph = wp.get_device().is_cuda
+        self._set_substeps(config.sim_substeps)
+        self.total_substeps = 0
+        self.graph_captures = 0
+        self._graphs = {}   # Captured frame graphs by the number of substeps
+        self.substep_controller = None
+        if config.enable_adaptive_substeps:
+            # NOTE: The controller is updated every static_check_interval frames 
+            # with the max displacement over the interval
+            self.substep_controller = SubstepController(
+                config.adaptive_substeps_min, 
+                config.adaptive_substeps_max, 
+                displacement_bounds=[b * config.garment_radius for b in config.adaptive_substeps_displacement],
+                calm_frames=math.ceil(config.adaptive_substeps_calm_frames / config.static_check_interval)
+            )
         self.device = wp.get_device() if wp.get_device().is_cuda else 'cpu' 
         self.frame = -1
+        self.attached_count = 0   # Number of vertices under attachment constraint
+        self.smoothing_stage = 0   # Number of recovered body smoothing steps
 
         self.c_scale = 1.0
         self.b_scale = 100.0
         self.body_path = paths.in_body_obj
+        self.offset = offset
+        self._current_verts = None
+        self._render_topology = None   # see render_arrays()
         
         # collision resolution options
         self.enable_body_smoothing = config.enable_body_smoothing
         self.enable_cloth_reference_drag = config.enable_cloth_reference_drag
 
+        if builder is not None:
+            # Member of a batch: the model is created and simulated by ClothBatch
+            with self.timer.span('build_stage'):
+                self.add_to_builder(
+                    builder, config, shared_bodies=shared_bodies, particle_filters=particle_filters)
+            return
+
         # Build the stage -- model object, colliders, etc.
-        self.build_stage(config)
+        with self.timer.span('build_stage'):
+            self.build_stage(config)
+        with self.timer.span('init_simulation'):
+            self._init_simulation(config, paths)
 
+    def _init_simulation(self, config: SimConfig, paths: PathCofig):
+        """Model settings, integrator and states"""
         # -------- Final model settings ----------
         # NOTE: global_viscous_damping: (damping_factor, min_vel_damp, max_vel) 
         # apply damping when vel > min_vel_damp, and clamp vel below max_vel after damping
@@ -87,17 +195,46 @@ class Cloth:
             self.renderer = wp.sim.render.SimRenderer(self.model, str(paths.usd), scaling=1.0)
 
         if self.sim_use_graph:
-            self.create_graph()
-
-        self.last_verts = None
-        self.current_verts = wp.array.numpy(self.state_0.particle_q)
+            with self.timer.span('graph_capture'):
+                self.create_graph()
+
+        # Static equilibrium detection is evaluated on device
+        # NOTE: Positions are only copied to host on request (see current_verts)
+        self.prev_particle_q = wp.zeros_like(self.state_0.particle_q)
+        self.non_static_count = wp.zeros(1, dtype=wp.int32, device=self.device)
+        self.has_prev_state = False
+        # Max particle displacement of the frames since the last substep update
+        self.interval_displacement = wp.zeros(1, dtype=float, device=self.device)
+
+    @property
+    def current_verts(self):
+        """Current garment vertex positions as numpy array. 
+            Copied from device at most once per frame
+        """
+        if self._current_verts is None:
+            # NOTE Makes a copy if particle_q device is not CPU
+            self._current_verts = wp.array.numpy(self.state_0.particle_q)
+        return self._current_verts
 
     def build_stage(self, config):
 
         builder = wp.sim.ModelBuilder(gravity=0.0)
+        self.add_to_builder(builder, config)
+
+        # ------- Finalize --------------
+        with self.timer.span('finalize'):
+            self.model: wp.sim.Model = builder.finalize(device = self.device) #data is transferred to warp tensors, object used in simulation
+
+    def add_to_builder(self, builder, config, shared_bodies=None, particle_filters=None):
+        """Add the garment, its body and constraints to the model builder
+            * shared_bodies -- collision meshes of the bodies already added to the builder (batch mode)
+            * particle_filters -- body collision filter ids of the particles already added to the builder (batch mode).
+                Extended with the filter ids of this garment
+        """
         # --------------- Load body info -----------------
-        body_vertices, body_indices, body_faces = self.load_obj(self.paths.in_body_obj)
-        body_seg = self.read_json(self.paths.body_seg) 
+        with self.timer.span('load_body'):
+            body_vertices, body_indices, body_faces = self.load_obj(self.paths.in_body_obj)
+            body_seg = self.read_json(self.paths.body_seg) 
 
         body_vertices = body_vertices * self.b_scale
         self.shift_y = self.get_shift_param(body_vertices)
@@ -110,8 +247,9 @@ class Cloth:
         self.body_indices = body_indices
 
         # -------------- Load cloth ------------
-        cloth_vertices, cloth_indices, cloth_faces = self.load_obj(self.paths.g_box_mesh)
-        cloth_seg_dict = assign.read_segmentation(self.paths.g_mesh_segmentation)
+        with self.timer.span('load_cloth'):
+            cloth_vertices, cloth_indices, cloth_faces = self.load_obj(self.paths.g_box_mesh)
+            cloth_seg_dict = assign.read_segmentation(self.paths.g_mesh_segmentation)
         self.cloth_seg_dict = cloth_seg_dict
         stitching_vertices = cloth_seg_dict["stitch"] if 'stitch' in cloth_seg_dict.keys() else []
 
@@ -129,32 +267,37 @@ class Cloth:
             with open(self.paths.g_orig_edge_len, 'rb') as file:
                 orig_lens_dict = pickle.load(file)
 
-        cloth_pos = (0.0, 0.0, 0.0)
+        cloth_pos = (self.offset, 0.0, 0.0)
         cloth_rot = wp.quat_from_axis_angle(wp.vec3(0.0, 1.0, 0.0), wp.degrees(0.0)) #no rotation, but orientation of cloth in world space
 
-        builder.add_cloth_mesh_sewing_spring(
-            pos=cloth_pos,
-            rot=cloth_rot,
-            scale=1.0,
-            vel=(0.0, 0.0, 0.0),
-            vertices=cloth_vertices,
-            indices=cloth_indices,
-            resolution_scale=config.resolution_scale,
-            orig_lens=orig_lens_dict,
-            stitching_vertices=stitching_vertices,
-            density=config.garment_density,
-            edge_ke=config.garment_edge_ke,
-            edge_kd=config.garment_edge_kd,
-            tri_ke=config.garment_tri_ke,
-            tri_ka=config.garment_tri_ka,
-            tri_kd=config.garment_tri_kd,
-            tri_drag=config.garment_tri_drag,
-            tri_lift=config.garment_tri_lift,
-            radius=config.garment_radius,
-            add_springs=True,
-            spring_ke=config.spring_ke,
-            spring_kd=config.spring_kd,
-        )
+        # Ranges of the garment elements in the model
+        particle_start, spring_start = len(builder.particle_q), len(builder.spring_rest_length)
+        with self.timer.span('add_cloth'):
+            builder.add_cloth_mesh_sewing_spring(
+                pos=cloth_pos,
+                rot=cloth_rot,
+                scale=1.0,
+                vel=(0.0, 0.0, 0.0),
+                vertices=cloth_vertices,
+                indices=cloth_indices,
+                resolution_scale=config.resolution_scale,
+                orig_lens=orig_lens_dict,
+                stitching_vertices=stitching_vertices,
+                density=config.garment_density,
+                edge_ke=config.garment_edge_ke,
+                edge_kd=config.garment_edge_kd,
+                tri_ke=config.garment_tri_ke,
+                tri_ka=config.garment_tri_ka,
+                tri_kd=config.garment_tri_kd,
+                tri_drag=config.garment_tri_drag,
+                tri_lift=config.garment_tri_lift,
+                radius=config.garment_radius,
+                add_springs=True,
+                spring_ke=config.spring_ke,
+                spring_kd=config.spring_kd,
+            )
+        self.particle_range = (particle_start, len(builder.particle_q))
+        self.spring_range = (spring_start, len(builder.spring_rest_length))
 
         # ------------ Add a body -----------      
         if self.enable_body_smoothing:
@@ -166,57 +309,99 @@ class Cloth:
             smoothing_step_size = smoothing_total_smoothing_factor / smoothing_num_steps
             self.body_smoothing_frames = [smoothing_recover_start_frame + smoothing_frame_gap_between_steps*i for i in range(smoothing_num_steps + 1)]
             self.body_smoothing_vertices_list = []
-            self.body_smoothing_vertices_list = implicit_laplacian_smoothing(body_vertices, body_indices.reshape(-1, 3), 
-                                                                             step_size=smoothing_step_size, 
-                                                                             iters=smoothing_num_steps)
+            with self.timer.span('body_smoothing'):
+                self.body_smoothing_vertices_list = implicit_laplacian_smoothing(body_vertices, body_indices.reshape(-1, 3), 
+                                                                                 step_size=smoothing_step_size, 
+                                                                                 iters=smoothing_num_steps)
             body_vertices = self.body_smoothing_vertices_list.pop()
             self.body_smoothing_frames.pop()
             self.body_indices = body_indices
             self.body_vertices_device_buffer = wp.array(body_vertices, dtype=wp.vec3, device=self.device)
             self.v_body = body_vertices
         
-        self.body_mesh = wp.sim.Mesh(body_vertices, body_indices)
+        # Collision geometry of the body
+        coll_vertices, coll_indices, coll_seg = body_vertices, body_indices, body_seg
+        self.body_mesh_full = None   # Full-res body for quality checks, if collision proxy is used
+        body_key = str(self.paths.in_body_obj)
+        shared = (shared_bodies is not None 
+                  and not self.enable_body_smoothing   # Smoothed bodies are updated per garment
+                  and body_key in shared_bodies)
+        if shared:
+            self.body_mesh, self.body_mesh_full, coll_vertices, coll_indices, coll_seg = shared_bodies[body_key]
+        elif config.enable_body_lod:
+            if self.enable_body_smoothing:
+                print(f'{self.name}::WARNING::Body LOD is not compatible with body smoothing. '
+                      'Using full body mesh for collisions')
+            else:
+                with self.timer.span('body_lod'):
+                    lod = get_body_lod(
+                        self.paths.in_body_obj, body_vertices, body_faces, body_seg, 
+                        config.body_lod_face_ratios, config.body_lod_max_error)
+                if lod is None:
+                    print(f'{self.name}::INFO::No body LOD satisfies the error bound '
+                          f'{config.body_lod_max_error}. Using full body mesh for collisions')
+                else:
+                    print(f'{self.name}::INFO::Using body LOD with {len(lod.faces)} faces '
+                          f'({lod.face_ratio:.2f} of full resolution, error {lod.error:.3f}, offset {lod.offset:.3f})')
+                    coll_vertices, coll_indices, coll_seg = lod.vertices, lod.faces.flatten(), lod.segmentation
+                    self.body_mesh_full = wp.sim.Mesh(body_vertices, body_indices)
+                    self.body_mesh_full.finalize(device=self.device)
+
+        if not shared:
+            self.body_mesh = wp.sim.Mesh(coll_vertices, coll_indices)
+            if shared_bodies is not None:
+                shared_bodies[body_key] = (
+                    self.body_mesh, self.body_mesh_full, coll_vertices, coll_indices, coll_seg)
         
-        body_pos = wp.vec3(0.0, 0, 0.0)
+        body_pos = wp.vec3(self.offset, 0, 0.0)
         body_rot = wp.quat_from_axis_angle(wp.vec3(0.0, 1.0, 0.0), wp.degrees(0.0))
 
 
         # Cloth-body segemntation
-        cloth_reference_labels, body_parts = assign.panel_assignment(
-                        cloth_seg_dict, cloth_vertices, cloth_indices, wp.transform(cloth_pos, cloth_rot), 
-                        body_seg, body_vertices, body_indices, wp.transform(body_pos, body_rot), 
-                        device=self.device,
-                        panel_init_labels=self._load_panel_labels(),
-                        strategy='closest', 
-                        merge_two_legs=True,
-                        smpl_body=self.paths.use_smpl_seg
-                        )  
+        with self.timer.span('panel_assignment'):
+            cloth_reference_labels, body_parts = assign.panel_assignment(
+                            cloth_seg_dict, cloth_vertices, cloth_indices, wp.transform(cloth_pos, cloth_rot), 
+                            body_seg, body_vertices, body_indices, wp.transform(body_pos, body_rot), 
+                            device=self.device,
+                            panel_init_labels=self._load_panel_labels(),
+                            strategy='closest', 
+                            merge_two_legs=True,
+                            smpl_body=self.paths.use_smpl_seg
+                            )  
         
         face_filters, particle_filter = [], []
         if config.enable_body_collision_filters:
-            v_connectivity = self._build_vert_connectivity(cloth_vertices, cloth_indices)
-            # Arm filter for the skirts
-            face_filters.append(assign.create_face_filter(
-                body_vertices, body_indices, body_seg, ['left_arm', 'right_arm', 'arms'], smpl_body=self.paths.use_smpl_seg))
-            particle_filter = assign.assign_face_filter_points(
-                cloth_reference_labels, 
-                ['left_leg', 'right_leg', 'legs'],
-                filter_id=0,
-                vert_connectivity=v_connectivity
-            )
+            with self.timer.span('collision_filters'):
+                v_connectivity = self._build_vert_connectivity(cloth_vertices, cloth_indices)
+                # Arm filter for the skirts
+                face_filters.append(assign.create_face_filter(
+                    coll_vertices, coll_indices, coll_seg, ['left_arm', 'right_arm', 'arms'], smpl_body=self.paths.use_smpl_seg))
+                particle_filter = assign.assign_face_filter_points(
+                    cloth_reference_labels, 
+                    ['left_leg', 'right_leg', 'legs'],
+                    filter_id=0,
+                    vert_connectivity=v_connectivity
+                )
 
-            # Overall filter that ignored internal geometry
-            face_filters.append(assign.create_face_filter(
-                body_vertices, body_indices, body_seg, ['face_internal'], smpl_body=self.paths.use_smpl_seg))
-            particle_filter = assign.assign_face_filter_points(
-                cloth_reference_labels, 
-                ['body'],
-                filter_id=1,   
-                vert_connectivity=v_connectivity,
-                current_vertex_filter=particle_filter
-            )
+                # Overall filter that ignored internal geometry
+                face_filters.append(assign.create_face_filter(
+                    coll_vertices, coll_indices, coll_seg, ['face_internal'], smpl_body=self.paths.use_smpl_seg))
+                particle_filter = assign.assign_face_filter_points(
+                    cloth_reference_labels, 
+                    ['body'],
+                    filter_id=1,   
+                    vert_connectivity=v_connectivity,
+                    current_vertex_filter=particle_filter
+                )
 
-        self.body_shape_index = 0   # Body is the first collider object to be added
+            if particle_filters is not None:
+                # NOTE: Filter ids are set for all the particles of the model at once. 
+                # Garments of a batch are added one after another, so their filters are concatenated.
+                # Face filters are set per body shape, and every garment collides only with its own body
+                particle_filters.extend(list(particle_filter))
+                particle_filter = list(particle_filters)
+
+        self.body_shape_index = builder.shape_count   # Body is the first collider object of the garment
         builder.add_shape_mesh(
             body=-1,
             mesh=self.body_mesh,
@@ -232,36 +417,38 @@ class Cloth:
         # ----- Attachment constraint -------
 
         if config.enable_attachment_constraint:
-            self._add_attachment_labels(builder, config)
+            with self.timer.span('attachment'):
+                self._add_attachment_labels(builder, config)
 
         # ----- Global collision resolution error ---- 
-        for part in body_parts:
-            part_v, part_inds = assign.extract_submesh(body_vertices, body_indices, body_parts[part])
-            builder.add_cloth_reference_shape_mesh(
-                mesh = wp.sim.Mesh(part_v, part_inds),
-                name = part,
-                pos = body_pos,
-                rot = body_rot,
-                scale = (1.0,1.0,1.0) #performed body scaling above
-            )
-        # NOTE: has a side-effect of filling up model.particle_reference_label array 
-        self.body_parts_names2index = builder.add_cloth_reference_labels(
-            cloth_reference_labels, 
-            [   # NOTE: Not adding drag between legs and the body as it's useless and contradicts attachment
-                ['left_arm', 'body'], 
-                ['right_arm', 'body'], 
-                ['left_leg', 'right_leg'],
-                ['left_arm', 'left_leg'], 
-                ['right_arm', 'left_leg'], 
-                ['left_arm', 'right_leg'], 
-                ['right_arm', 'right_leg'], 
-                ['left_arm', 'legs'], 
-                ['right_arm', 'legs'], 
-            ]
-        )  
-
-        # ------- Finalize --------------
-        self.model: wp.sim.Model = builder.finalize(device = self.device) #data is transferred to warp tensors, object used in simulation
+        if shared_bodies is not None:
+            # NOTE: Reference labels are set for the whole model and are not supported for batches
+            return
+        with self.timer.span('reference_shapes'):
+            for part in body_parts:
+                part_v, part_inds = assign.extract_submesh(body_vertices, body_indices, body_parts[part])
+                builder.add_cloth_reference_shape_mesh(
+                    mesh = wp.sim.Mesh(part_v, part_inds),
+                    name = part,
+                    pos = body_pos,
+                    rot = body_rot,
+                    scale = (1.0,1.0,1.0) #performed body scaling above
+                )
+            # NOTE: has a side-effect of filling up model.particle_reference_label array 
+            self.body_parts_names2index = builder.add_cloth_reference_labels(
+                cloth_reference_labels, 
+                [   # NOTE: Not adding drag between legs and the body as it's useless and contradicts attachment
+                    ['left_arm', 'body'], 
+                    ['right_arm', 'body'], 
+                    ['left_leg', 'right_leg'],
+                    ['left_arm', 'left_leg'], 
+                    ['right_arm', 'left_leg'], 
+                    ['left_arm', 'right_leg'], 
+                    ['right_arm', 'right_leg'], 
+                    ['left_arm', 'legs'], 
+                    ['right_arm', 'legs'], 
+                ]
+            )  
 
     def _add_attachment_labels(self, builder, config):
         with open(self.paths.in_body_mes, 'r') as file:
@@ -272,7 +459,7 @@ class Cloth:
         lables_present = False
         for i, attach_label in enumerate(config.attachment_labels):     
             if attach_label in vertex_labels.keys() and len(vertex_labels[attach_label]) > 0:
-                constaint_verts = vertex_labels[attach_label]
+                constaint_verts = [v + self.particle_range[0] for v in vertex_labels[attach_label]]
                 if attach_label == 'lower_interface':
                     lables_present = True
                     if '_waist_level' in body_dict:
@@ -281,7 +468,7 @@ class Cloth:
                         waist_level = body_dict['height'] - body_dict['head_l'] - body_dict['waist_line']
                     builder.add_attachment(
                         constaint_verts, 
-                        wp.vec3(0, waist_level, 0),
+                        wp.vec3(self.offset, waist_level, 0),
                         wp.vec3(0., 1., 0.),    # Vertical attachment
                         stiffness = config.attachment_stiffness[i],
                         damping = config.attachment_damping[i]
@@ -292,7 +479,7 @@ class Cloth:
                     neck_w = body_dict['neck_w'] - 2
                     builder.add_attachment(
                         constaint_verts, 
-                        wp.vec3(-neck_w / 2, 0, 0),   
+                        wp.vec3(self.offset - neck_w / 2, 0, 0),   
                         wp.vec3(1., 0., 0.),    # Horizontal attachment
                         stiffness = config.attachment_stiffness[i],
                         damping = config.attachment_damping[i]
@@ -303,7 +490,7 @@ class Cloth:
                     neck_w = body_dict['neck_w'] - 2
                     builder.add_attachment(
                         constaint_verts, 
-                        wp.vec3(neck_w / 2, 0, 0),   
+                        wp.vec3(self.offset + neck_w / 2, 0, 0),   
                         wp.vec3(-1., 0., 0.),    # Horizontal attachment
                         stiffness = config.attachment_stiffness[i],
                         damping = config.attachment_damping[i]
@@ -315,7 +502,7 @@ class Cloth:
                     level = body_dict['height'] - body_dict['head_l'] - body_dict['armscye_depth']
                     builder.add_attachment(
                         constaint_verts, 
-                        wp.vec3(0, level, 0),  
+                        wp.vec3(self.offset, level, 0),  
                         wp.vec3(0., 1., 0.),    # Vertical attachment
                         stiffness = config.attachment_stiffness[i],
                         damping = config.attachment_damping[i]
@@ -325,6 +512,7 @@ class Cloth:
                           'is not supported. Skipped')
                     continue
                     
+                self.attached_count += len(constaint_verts)
                 print(f'Using attachment for {attach_label} with {len(constaint_verts)} vertices')
 
         if not lables_present:
@@ -347,9 +535,13 @@ class Cloth:
     def _sim_frame_with_substeps(self):
         """Basic scheme for simulating a frame update"""
         
-        wp.sim.collide(self.model, self.state_0, self.sim_dt * self.sim_substeps)  # Generates contact points for the particles and rigid bodies
-        # in the model, to be used in the contact dynamics kernel of the integrator
-        # launches kernels
+        if self.sim_use_graph:
+            # NOTE: Captured in the frame graph together with the substeps -- not timed separately
+            self._collide()
+        else:
+            # NOTE: Kernels are executed synchronously on CPU
+            with self.timer.span('collide'):
+                self._collide()
 
         for s in range(self.sim_substeps):
             self.state_0.clear_forces()  # set particle and body forces to 0s
@@ -359,7 +551,58 @@ class Cloth:
             # swap states
             (self.state_0, self.state_1) = (self.state_1, self.state_0)  # swap prev, new state
 
-    def create_graph(self):
+    def _collide(self):
+        wp.sim.collide(self.model, self.state_0, self.sim_dt * self.sim_substeps)  # Generates contact points for the particles and rigid bodies
+        # in the model, to be used in the contact dynamics kernel of the integrator
+        # launches kernels
+
+    def _set_substeps(self, substeps):
+        if self.sim_use_graph and substeps % 2:
+            # NOTE: Even number of state swaps keeps the captured graph 
+            # reading from and writing to the same state object
+            substeps += 1
+        self.sim_substeps = substeps
+        self.sim_dt = (1.0 / self.sim_fps) / self.sim_substeps
+
+    def _perturbation(self):
+        """Scene is about to change -- prepare the substeps in advance"""
+        if self.substep_controller is not None:
+            self._set_substeps(self.substep_controller.perturbed())
+
+    def _adapt_substeps(self, frame):
+        """Accumulate the max displacement of the last frame on device, and
+            update the number of substeps every static_check_interval frames
+        """
+        wp.launch(
+            kernel=max_particle_displacement,
+            dim=self.model.particle_count,
+            inputs=[self.state_0.particle_q, self.prev_particle_q],
+            outputs=[self.interval_displacement],
+            device=self.device
+        )
+        if frame % self.config.static_check_interval:
+            return
+
+        # NOTE: Host-device synchronization, together with the static check
+        displacement = float(wp.array.numpy(self.interval_displacement)[0])
+        self.interval_displacement.zero_()
+        substeps = self.substep_controller.update(displacement, self.sim_substeps)
+        if substeps != self.sim_substeps:
+            self._set_substeps(substeps)
+            if self.sim_use_graph:
+                self.create_graph(reuse=True)
+
+    def create_graph(self, reuse=False):
+        """Capture the frame update graph for the current number of substeps
+            * reuse -- use the graph captured before for the same number of substeps, if any. 
+                Graphs captured before the scene changes (e.g. gravity activation) are dropped otherwise
+        """
+        if not reuse:
+            self._graphs = {}
+        if self.sim_substeps in self._graphs:
+            self.graph = self._graphs[self.sim_substeps]
+            return
+
         # create update graph
         wp.capture_begin()  # Captures all subsequent kernel launches and memory operations on CUDA devices.
         
@@ -367,6 +610,8 @@ class Cloth:
 
         self.graph = wp.capture_end()  # returns a handle to a CUDA graph object that can be launched with :func:`~warp.capture_launch()`
         # do not capture kernel launches anymore
+        self._graphs[self.sim_substeps] = self.graph
+        self.graph_captures += 1
 
     def update(self, frame):
         with wp.ScopedTimer("simulate", print=False, active=True):
@@ -376,32 +621,43 @@ class Cloth:
                 self.model.particle_grid.build(self.state_0.particle_q, self.model.particle_max_radius * 2.0)
             if frame == self.zero_gravity_steps:
                 self.model.gravity = np.array((0.0, -9.81, 0.0))
+                self._perturbation()
                 if self.sim_use_graph:
                     self.create_graph()
             if self.enable_body_smoothing and frame in self.body_smoothing_frames:
                 self.update_smooth_body_shape()
+                self._perturbation()
                 if self.sim_use_graph:
                     self.create_graph()
             if (self.model.attachment_constraint 
                     and frame >= self.config.attachment_frames):  
                 self.model.attachment_constraint = False
+                self._perturbation()
                 if self.sim_use_graph:
                     self.create_graph()
             
+            # Keep the state of the last frame on device for static checks
+            wp.copy(self.prev_particle_q, self.state_0.particle_q)
+            self.has_prev_state = True
+
             if self.sim_use_graph: #GPU
                 wp.capture_launch(self.graph)
 
             else: #CPU: launch kernels without graph
                 self._sim_frame_with_substeps()
 
-            # Update vertices of last frame
-            self.last_verts = self.current_verts
-            # NOTE Makes a copy if particle_q device is not CPU
-            self.current_verts = wp.array.numpy(self.state_0.particle_q)  
+            self.total_substeps += self.sim_substeps
+
+            # Host copy of vertices is outdated now
+            self._current_verts = None
+
+            if self.substep_controller is not None:
+                self._adapt_substeps(frame)
             
     def update_smooth_body_shape(self):
         body_vertices = self.body_smoothing_vertices_list.pop()
         self.v_body = body_vertices
+        self.smoothing_stage += 1
         wp.copy(self.body_vertices_device_buffer,
                 wp.array(body_vertices, dtype=wp.vec3, device='cpu', copy=False))
 
@@ -481,15 +737,19 @@ class Cloth:
         return n_normalized
 
     def calc_vertex_norms(self):
-        vertex_normals = np.zeros((len(self.v_cloth_init), 4))
-        for face in self.f_cloth:
-            v0, v1, v2 = np.array(self.current_verts)[face]
-            face_norm = list(self.calc_norm(v0, v1, v2))
-            temp_update = face_norm + [1]
-            vertex_normals[face] += temp_update
+        verts = np.asarray(self.current_verts)
+        faces = np.asarray(self.f_cloth, dtype=np.int64).reshape(-1, 3)
+
+        v0, v1, v2 = verts[faces[:, 0]], verts[faces[:, 1]], verts[faces[:, 2]]
+        face_norms = np.cross(v1 - v0, v2 - v0)
+        face_norms /= np.linalg.norm(face_norms, axis=1)[:, np.newaxis]
 
-        vertex_normals = vertex_normals[:, :3] / (vertex_normals[:, 3][:, np.newaxis])
-        return vertex_normals
+        # Average of the normals of incident faces
+        vertex_normals = np.zeros((len(self.v_cloth_init), 3))
+        np.add.at(vertex_normals, faces.ravel(), np.repeat(face_norms, 3, axis=0))
+        face_counts = np.bincount(faces.ravel(), minlength=len(self.v_cloth_init))
+
+        return vertex_normals / face_counts[:, np.newaxis]
 
     def save_frame(self, save_v_norms=False): 
         """Save current garment state as an obj file, 
@@ -527,6 +787,21 @@ class Cloth:
                 else:
                     obj_file.write(line)
 
+    def render_arrays(self):
+        """Current garment state to render from memory, without reading the saved frame 
+            (see pythonrender.garment_mesh_from_arrays()). 
+            Vertices are split along the UV seams of the box mesh
+        """
+        if self._render_topology is None:
+            uvs, face_uv_ids = read_obj_uvs(self.paths.g_box_mesh)
+            corners = np.stack([np.asarray(self.f_cloth).reshape(-1), face_uv_ids.reshape(-1)], axis=1)
+            corners, face_corners = np.unique(corners, axis=0, return_inverse=True)
+            self._render_topology = corners[:, 0], uvs[corners[:, 1]], face_corners.reshape(-1, 3)
+
+        vert_ids, uvs, faces = self._render_topology
+        texture = self.paths.g_texture_fabric if self.paths.g_texture_fabric.exists() else self.paths.g_texture
+        return dict(vertices=np.asarray(self.current_verts)[vert_ids], faces=faces, uvs=uvs, texture=texture)
+
     def is_static(self):
         """
             Checks whether garment is in the static equilibrium
@@ -534,38 +809,76 @@ class Cloth:
         """
         threshold = self.config.static_threshold
         non_static_percent = self.config.non_static_percent
+        num_verts = self.model.particle_count
 
-        curr_verts_arr = self.current_verts
-        last_verts_arr = self.last_verts
-
-        if self.last_verts is None:  # first iteration
-            return False, len(curr_verts_arr)
+        if not self.has_prev_state:  # first iteration
+            return False, num_verts
 
         # Compare L1 norm per vertex
         # Checking vertices change is the same as checking if velocity is zero
-        diff = np.abs(curr_verts_arr - last_verts_arr)
-        diff_L1 = np.sum(diff, axis=1)
-
-        non_static_len = len(
-            diff_L1[diff_L1 > threshold])  # compare vertex-wise to allow accurate control over outliers
+        # NOTE: compare vertex-wise to allow accurate control over outliers
+        self.non_static_count.zero_()
+        wp.launch(
+            kernel=count_non_static_particles,
+            dim=num_verts,
+            inputs=[
+                self.state_0.particle_q,
+                self.prev_particle_q,
+                float(threshold)
+            ],
+            outputs=[self.non_static_count],
+            device=self.device
+        )
+        # NOTE: The only host-device synchronization point of the check
+        non_static_len = int(wp.array.numpy(self.non_static_count)[0])
 
-        if non_static_len == 0 or (non_static_len < len(curr_verts_arr) * 0.01 * non_static_percent):
-            print('\nStatic with {} non-static vertices out of {}'.format(non_static_len, len(curr_verts_arr)))
+        if non_static_len == 0 or (non_static_len < num_verts * 0.01 * non_static_percent):
+            print('\nStatic with {} non-static vertices out of {}'.format(non_static_len, num_verts))
             # Store last frame
             return True, non_static_len
         else:
             return False, non_static_len
 
+    def velocity_stats(self):
+        """Max and mean speed of garment particles in the current state"""
+        stats = wp.zeros(2, dtype=float, device=self.device)
+        wp.launch(
+            kernel=particle_velocity_stats,
+            dim=self.model.particle_count,
+            inputs=[self.state_0.particle_qd],
+            outputs=[stats],
+            device=self.device
+        )
+        max_speed, sum_speed = wp.array.numpy(stats)
+        return float(max_speed), float(sum_speed / max(self.model.particle_count, 1))
+
+    def count_attached(self):
+        """Number of vertices currently held by attachment constraints"""
+        return self.attached_count if self.model.attachment_constraint else 0
+
+    def count_body_contacts(self):
+        """Number of cloth-body contacts generated for the last frame"""
+        return int(wp.array.numpy(self.model.soft_contact_count)[0])
+
+    def _garment_springs(self):
+        """Spring indices of this garment and their number"""
+        start, end = self.spring_range
+        if (start, end) == (0, self.model.spring_count):
+            return self.model.spring_indices, self.model.spring_count
+        # Garment is a part of a batch
+        return self.model.spring_indices[2 * start:2 * end], end - start
+
     def count_self_intersections(self):
         model = self.model
+        spring_indices, spring_count = self._garment_springs()
 
-        if model.particle_count and model.spring_count: 
+        if model.particle_count and spring_count: 
             model.particle_self_intersection_count.zero_()
             wp.launch(
                 kernel=count_self_intersections,
-                dim=model.spring_count,
+                dim=spring_count,
                 inputs=[
-                    model.spring_indices,
+                    spring_indices,
                     model.particle_shape.id,
                 ],
                 outputs=[
@@ -577,16 +890,40 @@ class Cloth:
         else: 
             return 0
 
+    def _swap_body_collider(self, mesh_id):
+        """Replace the geometry of the body collider with the given mesh. 
+            Returns the id of the previous mesh
+        """
+        source = wp.array.numpy(self.model.shape_geo.source)
+        prev_id = int(source[self.body_shape_index])
+        source[self.body_shape_index] = mesh_id
+        wp.copy(
+            self.model.shape_geo.source, 
+            wp.array(source, dtype=wp.uint64, device=self.device))
+        return prev_id
+
     def count_body_intersections(self):
+        if self.body_mesh_full is not None:
+            # Quality checks are performed against the full-res body, not the collision proxy
+            proxy_id = self._swap_body_collider(self.body_mesh_full.mesh.id)
+            try:
+                return self._count_body_intersections()
+            finally:
+                self._swap_body_collider(proxy_id)
+
+        return self._count_body_intersections()
+
+    def _count_body_intersections(self):
         model = self.model
+        spring_indices, spring_count = self._garment_springs()
 
         if model.particle_count:
             model.body_cloth_intersection_count.zero_()
             wp.launch(
                 kernel=count_body_cloth_intersections,
-                dim=model.spring_count,
+                dim=spring_count,
                 inputs=[
-                    model.spring_indices,
+                    spring_indices,
                     model.particle_shape.id,
                     model.shape_geo,
                     self.body_shape_index
@@ -601,18 +938,171 @@ class Cloth:
             return 0 
         
     def _build_vert_connectivity(self, vertices, indices):
-        vert_connectivity = [[] for _ in range(len(vertices))]
+        """Per-vertex neighbours, indexed as per-vertex lists. 
+            NOTE: A neighbour is listed once for every face the edge belongs to
+            NOTE: Stored in CSR arrays, python lists are only created for the accessed vertices
+        """
+        return CSRAdjacency(*vertex_vertex_csr(indices, len(vertices), unique=False))
 
-        for face_id in range(int(len(indices) / 3)):
-            v1, v2, v3 = indices[face_id*3 + 0], indices[face_id*3 + 1], indices[face_id*3 + 2]
-            
-            vert_connectivity[v1].append(v2)
-            vert_connectivity[v1].append(v3)
 
-            vert_connectivity[v2].append(v1)
-            vert_connectivity[v2].append(v3)
+class ClothBatch(Cloth):
+    """Several independent garments simulated in a single warp model 
+        to reduce the per-launch overhead for small garments.
+
+        Every garment is placed with its own body instance at a separate location along the x axis.
+        Garments with the same body share its collision mesh. 
+        Static equilibrium is detected for each garment independently, and the garments that
+        reached it are frozen in their final state until the rest of the batch is finished. 
+
+        NOTE: Cloth reference drag, global collision filter (both rely on the cloth reference labels
+        that are set for the whole model), adaptive substeps and USD caching are not supported for batches: 
+        garments with these options are to be simulated individually (see unsupported()).
+        Both are enabled in the default sim config.
+
+        NOTE: Results match the individual simulation within tolerance, not exactly: 
+        positions shifted by the garment offsets are rounded differently, 
+        and the contacts of the whole model are generated and resolved together (see test_batch_sim.py)
+    """
+    unsupported_options = [
+        'enable_cloth_reference_drag', 'enable_global_collision_filter', 'enable_adaptive_substeps']
+
+    @classmethod
+    def unsupported(cls, config: SimConfig):
+        """Enabled options of the config that batched simulation does not support"""
+        return [option for option in cls.unsupported_options if getattr(config, option)]
 
-            vert_connectivity[v3].append(v1)
-            vert_connectivity[v3].append(v2)
+    def __init__(self, names, config: SimConfig, paths_list, spacing=300.):
+        """
+            * names, paths_list -- names and paths of the garments in the batch
+            * spacing -- distance between the garments along the x axis (in sim units). 
+                Should be large enough for the garments (and bodies) not to interact
+        """
+        self.spacing = spacing
+        self._member_info = list(zip(names, paths_list))
+
+        unsupported = self.unsupported(config)
+        if unsupported:
+            # NOTE: Turning the options off would simulate the garments differently from individual runs
+            raise ValueError(
+                f'{self.__class__.__name__}::ERROR::Options {unsupported} are not supported for batches')
+
+        super().__init__(f'batch_{names[0]}_{len(names)}', config, paths_list[0], caching=False)
+
+    def build_stage(self, config):
+
+        builder = wp.sim.ModelBuilder(gravity=0.0)
+        shared_bodies = {}
+        particle_filters = []
+        self.members = []
+        for i, (name, paths) in enumerate(self._member_info):
+            # NOTE: Config copies keep per-garment adjustments (e.g. attachment turned off) local
+            self.members.append(Cloth(
+                name, copy.copy(config), paths, 
+                builder=builder, offset=i * self.spacing, 
+                shared_bodies=shared_bodies, particle_filters=particle_filters))
+
+        with self.timer.span('finalize'):
+            self.model: wp.sim.Model = builder.finalize(device=self.device)
+        for member in self.members:
+            member.model = self.model
+
+        self.particle_range = (0, self.model.particle_count)
+        self.spring_range = (0, self.model.spring_count)
+        self.body_shape_index = self.members[0].body_shape_index
+
+        # Attachment is released for the whole model at once
+        config.enable_attachment_constraint = any(
+            m.config.enable_attachment_constraint for m in self.members)
+        config.update_min_steps()
+        self.attached_count = sum(m.attached_count for m in self.members)
+        if self.enable_body_smoothing:
+            self.body_smoothing_frames = list(self.members[0].body_smoothing_frames)
+
+        # Garment masks
+        particle_garment = np.zeros(self.model.particle_count, dtype=np.int32)
+        for i, member in enumerate(self.members):
+            particle_garment[member.particle_range[0]:member.particle_range[1]] = i
+        self.particle_garment = wp.array(particle_garment, dtype=wp.int32, device=self.device)
+        self.frozen = np.zeros(len(self.members), dtype=np.int32)
+        self.garment_frozen = wp.array(self.frozen, dtype=wp.int32, device=self.device)
+        self.members_non_static = wp.zeros(len(self.members), dtype=wp.int32, device=self.device)
+
+    def _init_simulation(self, config: SimConfig, paths: PathCofig):
+        super()._init_simulation(config, paths)
+        self.frozen_q = wp.zeros_like(self.state_0.particle_q)
+
+    def update(self, frame):
+        super().update(frame)
 
-        return vert_connectivity
+        if self.frozen.any():
+            wp.launch(
+                kernel=restore_frozen_particles,
+                dim=self.model.particle_count,
+                inputs=[
+                    self.state_0.particle_q, 
+                    self.state_0.particle_qd,
+                    self.frozen_q,
+                    self.particle_garment,
+                    self.garment_frozen
+                ],
+                device=self.device
+            )
+
+    def update_smooth_body_shape(self):
+        self.smoothing_stage += 1
+        for member, frozen in zip(self.members, self.frozen):
+            if not frozen:
+                member.update_smooth_body_shape()
+
+    def active_members(self):
+        return [m for m, frozen in zip(self.members, self.frozen) if not frozen]
+
+    def members_static(self):
+        """Static equilibrium check for each garment of the batch. 
+            Returns a list of (is_static, non-static vertex count) per garment
+        """
+        if not self.has_prev_state:  # first iteration
+            return [(False, m.particle_range[1] - m.particle_range[0]) for m in self.members]
+
+        self.members_non_static.zero_()
+        wp.launch(
+            kernel=count_non_static_garment_particles,
+            dim=self.model.particle_count,
+            inputs=[
+                self.state_0.particle_q,
+                self.prev_particle_q,
+                self.particle_garment,
+                float(self.config.static_threshold)
+            ],
+            outputs=[self.members_non_static],
+            device=self.device
+        )
+        # NOTE: The only host-device synchronization point of the check
+        non_static = wp.array.numpy(self.members_non_static)
+
+        result = []
+        for member, count in zip(self.members, non_static):
+            num_verts = member.particle_range[1] - member.particle_range[0]
+            static = count == 0 or count < num_verts * 0.01 * self.config.non_static_percent
+            result.append((bool(static), int(count)))
+        return result
+
+    def _store_member_state(self, member):
+        """Copy the current state of the garment to the member object in its local coordinates"""
+        start, end = member.particle_range
+        member._current_verts = self.current_verts[start:end] - np.array([member.offset, 0., 0.])
+        member.frame = self.frame
+        member.total_substeps = self.total_substeps
+
+    def freeze(self, member_id):
+        """Store the current state of the garment as final and keep it fixed for the rest of the simulation"""
+        self._store_member_state(self.members[member_id])
+
+        self.frozen[member_id] = 1
+        wp.copy(self.frozen_q, self.state_0.particle_q)
+        wp.copy(self.garment_frozen, wp.array(self.frozen, dtype=wp.int32, device='cpu'))
+
+    def finish(self):
+        """Store the final state of the garments that are still simulated"""
+        for member in self.active_members():
+            self._store_member_state(member)
@@ -0,0 +1,68 @@
+"""Mesh adjacency in compressed sparse row (CSR) format
+
+    Adjacency of element i is stored in indices[offsets[i]:offsets[i + 1]]
+"""
+import numpy as np
+
+
+def _group_csr(keys, values, num_keys):
+    """CSR adjacency from (key, value) pairs. Order of values within each key is preserved"""
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_keys), out=offsets[1:])
+    return offsets, values[order]
+
+
+def vertex_vertex_csr(faces, num_verts, unique=True):
+    """Neighbours of each vertex over the mesh edges
+        * faces -- triangles as (F, 3) or flat array of vertex ids
+        * unique -- If False, a neighbour is listed once for every face the edge belongs to,
+            in the order of faces
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    src = faces[:, [0, 0, 1, 1, 2, 2]].ravel()
+    dst = faces[:, [1, 2, 0, 2, 0, 1]].ravel()
+
+    if unique:
+        pairs = np.unique(src * num_verts + dst)
+        src, dst = pairs // num_verts, pairs % num_verts
+
+    return _group_csr(src, dst, num_verts)
+
+
+class CSRAdjacency:
+    """Read-only per-element view of CSR adjacency: adjacency[i] is the python list of elements adjacent to i. 
+        Drop-in replacement of per-element python lists that only converts the elements accessed
+    """
+    def __init__(self, offsets, indices):
+        self.offsets = offsets
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.indices[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def vertex_vertex_lists(faces, num_verts):
+    """Reference per-face loop building per-vertex python lists of neighbours 
+        (the same as vertex_vertex_csr(faces, num_verts, unique=False)). 
+        Kept for tests and benchmarks
+    """
+    faces = np.asarray(faces).reshape(-1, 3).tolist()
+    vert_connectivity = [[] for _ in range(num_verts)]
+    for v1, v2, v3 in faces:
+        vert_connectivity[v1].append(v2)
+        vert_connectivity[v1].append(v3)
+
+        vert_connectivity[v2].append(v1)
+        vert_connectivity[v2].append(v3)
+
+        vert_connectivity[v3].append(v1)
+        vert_connectivity[v3].append(v2)
+
+    return vert_connectivity
@@ -0,0 +1,239 @@
+"""Quality checks of the stored simulation results without the simulator
+
+    Counts of cloth self-intersections and cloth-body intersections are evaluated
+    in the same manner as the simulator's checks: a cloth edge is counted if it intersects
+    a (non-adjacent) triangle of the cloth or a triangle of the body.
+    The broad phase uses a NumPy bounding volume hierarchy, the narrow phase --
+    vectorized segment-triangle intersection tests.
+"""
+from pathlib import Path
+import numpy as np
+import trimesh
+import yaml
+
+
+# ------- Bounding volume hierarchy -------
+def _morton_codes(points, bits=10):
+    """Interleaved bits of quantized point coordinates"""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    grid = ((points - lo) / np.maximum(hi - lo, 1e-12) * ((1 << bits) - 1)).astype(np.uint64)
+
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((grid[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
+
+
+class AABBTree:
+    """Implicit complete binary tree over axis-aligned boxes of primitives sorted in Morton order.
+        Queries are evaluated for all the query boxes at once level-by-level
+    """
+    def __init__(self, lo, hi, leaf_size=8):
+        """
+            * lo, hi -- (N, 3) corners of the primitive boxes
+        """
+        self.lo, self.hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+        self.leaf_size = leaf_size
+
+        num_prims = len(self.lo)
+        num_leaves = 1 << int(np.ceil(np.log2(max(np.ceil(num_prims / leaf_size), 1))))
+
+        # Primitives of each leaf, -1 for padding
+        order = np.argsort(_morton_codes(0.5 * (self.lo + self.hi)), kind='stable')
+        self.leaf_prims = np.full(num_leaves * leaf_size, -1, dtype=np.int64)
+        self.leaf_prims[:num_prims] = order
+        self.leaf_prims = self.leaf_prims.reshape(num_leaves, leaf_size)
+
+        valid = self.leaf_prims >= 0
+        prim_lo = np.where(valid[..., None], self.lo[self.leaf_prims], np.inf)
+        prim_hi = np.where(valid[..., None], self.hi[self.leaf_prims], -np.inf)
+
+        # Node boxes per level, from the leaves up to the root
+        levels = [(prim_lo.min(axis=1), prim_hi.max(axis=1))]
+        while len(levels[-1][0]) > 1:
+            level_lo, level_hi = levels[-1]
+            levels.append((
+                np.minimum(level_lo[0::2], level_lo[1::2]),
+                np.maximum(level_hi[0::2], level_hi[1::2])))
+        self.levels = levels[::-1]   # Root first
+
+    def query(self, lo, hi):
+        """Pairs of (query id, primitive id) with overlapping boxes"""
+        lo, hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+        query_ids = np.arange(len(lo))
+        nodes = np.zeros(len(lo), dtype=np.int64)
+
+        for depth, (node_lo, node_hi) in enumerate(self.levels):
+            overlap = np.all(
+                (lo[query_ids] <= node_hi[nodes]) & (hi[query_ids] >= node_lo[nodes]), axis=1)
+            query_ids, nodes = query_ids[overlap], nodes[overlap]
+            if depth < len(self.levels) - 1:
+                # Descend to both children
+                query_ids = np.repeat(query_ids, 2)
+                nodes = (np.repeat(nodes, 2) << 1) + np.tile([0, 1], len(nodes))
+
+        # Primitives of the overlapping leaves
+        prims = self.leaf_prims[nodes].ravel()
+        query_ids = np.repeat(query_ids, self.leaf_size)
+        valid = prims >= 0
+        query_ids, prims = query_ids[valid], prims[valid]
+
+        overlap = np.all((lo[query_ids] <= self.hi[prims]) & (hi[query_ids] >= self.lo[prims]), axis=1)
+        return query_ids[overlap], prims[overlap]
+
+
+# ------- Intersection tests -------
+def segment_triangle_intersect(p0, p1, a, b, c, eps=1e-9):
+    """Vectorized test of segments (p0, p1) against triangles (a, b, c).
+        All inputs are (N, 3) arrays. Returns (N,) bool array
+    """
+    direction = p1 - p0
+    e1, e2 = b - a, c - a
+    pvec = np.cross(direction, e2)
+    det = np.einsum('ij,ij->i', e1, pvec)
+    parallel = np.abs(det) < eps
+    inv_det = 1. / np.where(parallel, 1., det)
+
+    tvec = p0 - a
+    u = np.einsum('ij,ij->i', tvec, pvec) * inv_det
+    qvec = np.cross(tvec, e1)
+    v = np.einsum('ij,ij->i', direction, qvec) * inv_det
+    t = np.einsum('ij,ij->i', e2, qvec) * inv_det
+
+    return ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
+
+
+def mesh_edges(faces):
+    """Unique edges of a triangle mesh"""
+    edges = np.sort(np.asarray(faces)[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    return np.unique(edges, axis=0)
+
+
+def _intersecting_edges(vertices, edges, tri_vertices, tri_faces, exclude_adjacent=False, chunk_size=200000):
+    """Mask of edges intersecting any of the triangles"""
+    tri_corners = tri_vertices[tri_faces]
+    tree = AABBTree(tri_corners.min(axis=1), tri_corners.max(axis=1))
+
+    p0, p1 = vertices[edges[:, 0]], vertices[edges[:, 1]]
+    edge_ids, tri_ids = tree.query(np.minimum(p0, p1), np.maximum(p0, p1))
+
+    if exclude_adjacent:
+        # Triangles sharing a vertex with the edge
+        shares_vertex = np.any(
+            (tri_faces[tri_ids] == edges[edge_ids, 0:1]) | (tri_faces[tri_ids] == edges[edge_ids, 1:2]), axis=1)
+        edge_ids, tri_ids = edge_ids[~shares_vertex], tri_ids[~shares_vertex]
+
+    hits = np.zeros(len(edges), dtype=bool)
+    for start in range(0, len(edge_ids), chunk_size):
+        e, t = edge_ids[start:start + chunk_size], tri_ids[start:start + chunk_size]
+        intersect = segment_triangle_intersect(
+            p0[e], p1[e], tri_corners[t, 0], tri_corners[t, 1], tri_corners[t, 2])
+        hits[e[intersect]] = True
+    return hits
+
+
+def count_self_intersections(vertices, faces):
+    """Number of cloth edges intersecting non-adjacent cloth triangles"""
+    vertices, faces = np.asarray(vertices, dtype=float), np.asarray(faces, dtype=np.int64)
+    edges = mesh_edges(faces)
+    return int(_intersecting_edges(vertices, edges, vertices, faces, exclude_adjacent=True).sum())
+
+
+def count_body_intersections(vertices, faces, body_vertices, body_faces):
+    """Number of cloth edges intersecting the body surface"""
+    vertices, faces = np.asarray(vertices, dtype=float), np.asarray(faces, dtype=np.int64)
+    edges = mesh_edges(faces)
+    return int(_intersecting_edges(
+        vertices, edges,
+        np.asarray(body_vertices, dtype=float), np.asarray(body_faces, dtype=np.int64)).sum())
+
+
+# ------- Stored data -------
+def load_sim_geometry(sample_path: Path, name=None):
+    """Vertices and faces of the stored simulated garment in any of the storage formats.
+        Vertices duplicated along UV seams are merged
+    """
+    sample_path = Path(sample_path)
+    name = name or sample_path.name
+
+    positions = sample_path / f'{name}_sim_positions.npy'
+    if positions.exists():
+        with np.load(sample_path / f'{name}_boxmesh_topology.npz') as topology:
+            return np.load(positions).astype(float), topology['faces'].astype(np.int64)
+
+    for ext in ['obj', 'ply']:
+        path = sample_path / f'{name}_sim.{ext}'
+        if path.exists():
+            mesh = trimesh.load_mesh(str(path), process=False)
+            mesh.merge_vertices(merge_tex=True, merge_norm=True)
+            return np.asarray(mesh.vertices, dtype=float), np.asarray(mesh.faces, dtype=np.int64)
+
+    raise FileNotFoundError(f'No simulated garment found for {name} in {sample_path}')
+
+
+def body_path(sample_path: Path, name, dataset_props, system, body_id=None):
+    """Body the sample was simulated with
+        * body_id -- body recorded in the dataset index, if available. 
+            Otherwise, the body is found from the body measurements of the sample
+    """
+    sample_path = Path(sample_path)
+    if body_id is not None:
+        bodies_path = (Path(system['bodies_default_path']) if sample_path.parent.name == 'default_body'
+                       else Path(system['body_samples_path']) / dataset_props['body_samples'] / 'meshes')
+        return bodies_path / f'{body_id}.obj'
+
+    measurements = sample_path / f'{name}_body_measurements.yaml'
+    body_sample = None
+    if measurements.exists():
+        with open(measurements, 'r') as file:
+            body_sample = yaml.load(file, Loader=yaml.SafeLoader)['body'].get('body_sample')
+
+    if body_sample is None:
+        return Path(system['bodies_default_path']) / f'{dataset_props["body_default"]}.obj'
+    return Path(system['body_samples_path']) / dataset_props['body_samples'] / 'meshes' / f'{body_sample}.obj'
+
+
+def simulated_samples(dataset_path: Path, dataset_props, system, index=None):
+    """(name, sample path, body path) of the samples with simulation results, ordered by body.
+        Samples are listed from the dataset index (DatasetIndex), if given, or from the sample folders
+    """
+    dataset_path = Path(dataset_path)
+    samples = []
+    if index is not None:
+        simulated = set(name for name, _, _, _ in index.artifacts(kind_pattern='sim.%'))
+        simulated.update(index.artifact_paths('sim_positions.npy'))
+        for name in simulated:
+            sample_path = dataset_path / name
+            samples.append((name, sample_path, body_path(
+                sample_path, name, dataset_props, system, body_id=index.sample(name)['body_id'])))
+    else:
+        for sample_path in (p for p in dataset_path.iterdir() if p.is_dir()):
+            name = sample_path.name
+            if any(sample_path.glob(f'{name}_sim.*')) or (sample_path / f'{name}_sim_positions.npy').exists():
+                samples.append((name, sample_path, body_path(sample_path, name, dataset_props, system)))
+
+    return sorted(samples, key=lambda sample: (str(sample[2]), sample[0]))
+
+
+def load_body(body_path: Path):
+    """Body mesh in simulation units and placement (see Cloth.build_stage)"""
+    body = trimesh.load_mesh(str(body_path), process=False)
+    vertices = np.asarray(body.vertices, dtype=float) * 100.
+    min_y = vertices[:, 1].min()
+    if min_y < 0:
+        vertices[:, 1] += abs(min_y)
+    return vertices, np.asarray(body.faces, dtype=np.int64)
+
+
+def sample_qa(sample_path: Path, body_path: Path, name=None):
+    """Intersection counts of a stored sample"""
+    vertices, faces = load_sim_geometry(sample_path, name)
+    body_vertices, body_faces = load_body(body_path)
+
+    return {
+        'self_collisions': count_self_intersections(vertices, faces),
+        'body_collisions': count_body_intersections(vertices, faces, body_vertices, body_faces),
+        'vertices': len(vertices),
+        'faces': len(faces),
+    }
@@ -0,0 +1,150 @@
+"""Compact storage of simulated garments
+
+    Faces, UVs and segmentation of the simulated garment are identical to the ones of the box mesh
+    of the same sample. In 'positions' storage format, the box mesh topology is stored once per sample
+    as .npz, and the simulation result only as float32 vertex positions, which are combined into
+    a full mesh on read.
+    Vertex normals of the simulated garment (stored with save_v_norms) are kept as float16 next to
+    the positions, and are not recomputed on read: the garments stored without them are loaded without
+    normals, as from .obj.
+"""
+from pathlib import Path
+import numpy as np
+import trimesh
+
+from pygarment.meshgen.sim_config import PathCofig
+
+
+def read_obj_topology(path: Path):
+    """Vertices, texture coordinates and triangles of an .obj file
+        Returns a dict with
+            * vertices -- (V, 3) float32
+            * uvs -- (T, 2) float32
+            * faces -- (F, 3) vertex ids
+            * face_uvs -- (F, 3) texture coordinate ids (empty if the mesh has no texture coordinates)
+    """
+    vertices, uvs, faces, face_uvs = [], [], [], []
+    with open(path, 'r') as obj_file:
+        for line in obj_file:
+            if line.startswith('v '):
+                vertices.append(line.split()[1:4])
+            elif line.startswith('vt '):
+                uvs.append(line.split()[1:3])
+            elif line.startswith('f '):
+                corners = [c.split('/') for c in line.split()[1:]]
+                faces.append([int(c[0]) - 1 for c in corners])
+                if len(corners[0]) > 1 and corners[0][1]:
+                    face_uvs.append([int(c[1]) - 1 for c in corners])
+
+    return {
+        'vertices': np.array(vertices, dtype=np.float32).reshape(-1, 3),
+        'uvs': np.array(uvs, dtype=np.float32).reshape(-1, 2),
+        'faces': np.array(faces, dtype=np.int32).reshape(-1, 3),
+        'face_uvs': np.array(face_uvs, dtype=np.int32).reshape(-1, 3),
+    }
+
+
+def read_obj_normals(path: Path):
+    """(N, 3) float32 vertex normals of an .obj file (empty if the file has no normals)"""
+    normals = []
+    with open(path, 'r') as obj_file:
+        for line in obj_file:
+            if line.startswith('vn '):
+                normals.append(line.split()[1:4])
+    return np.array(normals, dtype=np.float32).reshape(-1, 3)
+
+
+def save_topology(path: Path, topology):
+    np.savez_compressed(path, **topology)
+
+
+def load_topology(path: Path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def save_positions(path: Path, vertices):
+    np.save(path, np.asarray(vertices, dtype=np.float32))
+
+
+def save_normals(path: Path, normals):
+    np.save(path, np.asarray(normals, dtype=np.float16))
+
+
+def to_trimesh(vertices, topology, texture_path=None, normals=None):
+    """Full mesh from vertex positions (and optionally vertex normals) and the topology of the box mesh
+        NOTE: Like trimesh's obj loader, vertices are split along UV seams
+    """
+    vertices = np.asarray(vertices)
+    if normals is not None:
+        normals = np.asarray(normals, dtype=np.float32)
+    faces, face_uvs = topology['faces'], topology['face_uvs']
+    if not len(face_uvs):
+        return trimesh.Trimesh(vertices, faces, vertex_normals=normals, process=False)
+
+    # Unique (vertex, uv) pairs become vertices of the mesh
+    corners = np.stack([faces.ravel(), face_uvs.ravel()], axis=1)
+    corners, corner_ids = np.unique(corners, axis=0, return_inverse=True)
+
+    image = None
+    if texture_path is not None and Path(texture_path).exists():
+        from PIL import Image
+        image = Image.open(texture_path)
+
+    return trimesh.Trimesh(
+        vertices[corners[:, 0]],
+        corner_ids.reshape(-1, 3),
+        vertex_normals=normals[corners[:, 0]] if normals is not None else None,
+        visual=trimesh.visual.TextureVisuals(uv=topology['uvs'][corners[:, 1]], image=image),
+        process=False)
+
+
+def load_sim_mesh(paths: PathCofig, with_texture=True):
+    """Simulated garment as trimesh object, independent of the storage format"""
+    if paths.g_sim_positions.exists():
+        topology = load_topology(paths.g_box_topology)
+        return to_trimesh(
+            np.load(paths.g_sim_positions), topology,
+            texture_path=paths.g_texture if with_texture else None,
+            normals=np.load(paths.g_sim_normals) if paths.g_sim_normals.exists() else None)
+    if paths.g_sim.exists():
+        return trimesh.load_mesh(str(paths.g_sim), process=False)
+    return trimesh.load_mesh(str(paths.g_sim_compressed), process=False)
+
+
+def load_box_mesh(paths: PathCofig, with_texture=True):
+    """Box mesh as trimesh object, independent of the storage format"""
+    if paths.g_box_topology.exists():
+        topology = load_topology(paths.g_box_topology)
+        return to_trimesh(
+            topology['vertices'], topology,
+            texture_path=paths.g_texture if with_texture else None)
+    if paths.g_box_mesh.exists():
+        return trimesh.load_mesh(str(paths.g_box_mesh), process=False)
+    return trimesh.load_mesh(str(paths.g_box_mesh_compressed), process=False)
+
+
+def store_positions_only(paths: PathCofig):
+    """Replace the box mesh and simulated garment .obj files
+        with the box mesh topology, float32 simulated positions and
+        float16 simulated vertex normals (if stored in the .obj)
+    """
+    topology = read_obj_topology(paths.g_box_mesh)
+    sim_vertices = read_obj_topology(paths.g_sim)['vertices']
+    if len(sim_vertices) != len(topology['vertices']):
+        raise ValueError(
+            f'Simulated mesh {paths.g_sim} does not match the box mesh: '
+            f'{len(sim_vertices)} vs {len(topology["vertices"])} vertices')
+
+    save_topology(paths.g_box_topology, topology)
+    save_positions(paths.g_sim_positions, sim_vertices)
+    sim_normals = read_obj_normals(paths.g_sim)
+    if len(sim_normals):
+        if len(sim_normals) != len(sim_vertices):
+            raise ValueError(
+                f'Simulated mesh {paths.g_sim} has {len(sim_normals)} vertex normals '
+                f'for {len(sim_vertices)} vertices')
+        save_normals(paths.g_sim_normals, sim_normals)
+
+    paths.g_box_mesh.unlink()
+    paths.g_sim.unlink()
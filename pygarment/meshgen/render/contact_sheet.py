@@ -0,0 +1,86 @@
+"""Tiling of renders into contact sheets (grids of images with labels) for quick visual inspection"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def contact_sheet(images, columns=None, labels=None, cell_size=None, label_height=16, background=(255, 255, 255, 255)):
+    """Tile the images into a grid image
+        * images -- list of PIL images or image arrays
+        * columns -- number of grid columns. Defaults to a roughly square grid
+        * labels -- captions to write under the images
+        * cell_size -- (width, height) of a grid cell. Images are downscaled to fit into the cell
+            (keeping the aspect ratio). Defaults to the size of the largest image
+    """
+    images = [Image.fromarray(np.asarray(im)) if not isinstance(im, Image.Image) else im for im in images]
+    if not images:
+        raise ValueError('contact_sheet::ERROR::No images to tile')
+    columns = columns or math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    if cell_size is None:
+        cell_size = max(im.width for im in images), max(im.height for im in images)
+    label_height = label_height if labels is not None else 0
+
+    sheet = Image.new('RGBA', (columns * cell_size[0], rows * (cell_size[1] + label_height)), background)
+    draw = ImageDraw.Draw(sheet)
+    for i, image in enumerate(images):
+        x, y = (i % columns) * cell_size[0], (i // columns) * (cell_size[1] + label_height)
+        if image.width > cell_size[0] or image.height > cell_size[1]:
+            image = image.copy()
+            image.thumbnail(cell_size)
+        image = image.convert('RGBA')
+        # Centered in the cell
+        offset = x + (cell_size[0] - image.width) // 2, y + (cell_size[1] - image.height) // 2
+        sheet.alpha_composite(image, offset)
+        if labels is not None:
+            draw.text((x + 2, y + cell_size[1] + 2), str(labels[i]), fill=(0, 0, 0, 255))
+
+    return sheet
+
+
+def paged_contact_sheets(images, out_path, grid=(8, 6), cell_size=(256, 256), prefix='sheet'):
+    """Tile a large number of images into pages of grid[0] x grid[1] (columns x rows) labelled thumbnails, 
+        e.g. for visual inspection of a dataset
+        * images -- list of (label, image path) in the order of the pages. 
+            NOTE: Appending new images to the end of the list keeps the previous pages unchanged
+
+        Only the pages with new or updated images are (re-)created. The content of the pages is 
+        tracked in <out_path>/<prefix>_pages.json. 
+        Returns the paths of the (re-)created pages
+    """
+    out_path = Path(out_path)
+    out_path.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_path / f'{prefix}_pages.json'
+    pages = {}
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            pages = json.load(f)
+
+    per_page = grid[0] * grid[1]
+    updated = []
+    for page_id in range(math.ceil(len(images) / per_page)):
+        page_images = images[page_id * per_page:(page_id + 1) * per_page]
+        content = [[label, str(path), Path(path).stat().st_mtime_ns] for label, path in page_images]
+        page_path = out_path / f'{prefix}_{page_id:04d}.png'
+        if pages.get(page_path.name) == content and page_path.exists():
+            continue
+
+        thumbnails = []
+        for _, path in page_images:
+            with Image.open(path) as image:
+                image.thumbnail(cell_size)
+                thumbnails.append(image.convert('RGBA'))
+        contact_sheet(
+            thumbnails, columns=grid[0], labels=[label for label, _ in page_images], cell_size=cell_size
+        ).save(page_path)
+
+        pages[page_path.name] = content
+        updated.append(page_path)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(pages, f)
+
+    return updated
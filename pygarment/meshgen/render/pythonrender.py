@@ -1,13 +1,21 @@
 import os
 import platform
 if platform.system() == 'Linux':
-    os.environ["PYOPENGL_PLATFORM"] = "egl"
+    # NOTE: Could be overridden, e.g. with 'osmesa' for software rendering on machines without GPU
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+import hashlib
+import multiprocessing
+import queue
+import traceback
+from collections import OrderedDict
 import numpy as np
 import trimesh
 import pyrender
 from PIL import Image
 
 from pygarment.meshgen.sim_config import PathCofig
+from pygarment.meshgen.mesh_storage import load_sim_mesh
+from pygarment.meshgen.render.contact_sheet import contact_sheet
 
 
 def rotate_matrix_y(matrix, angle_deg):
@@ -59,12 +67,40 @@ def get_bounding_box_edges(mesh):
 
     return corners
 
+# Rotation of the camera around the body (vertical axis) for the named views
+_side_angles = {
+    'front': 0., 
+    'back': 180., 
+    'left': 90., 
+    'right': -90., 
+    'three_quarter': 45., 
+    'three_quarter_back': 225.
+}
+
+def view_name(view, index=0):
+    """Name of the camera view to use in file names. 
+        Views are given by name (see _side_angles), rotation angle in degrees or 4x4 camera pose
+    """
+    if isinstance(view, str):
+        return view
+    if np.ndim(view) == 0:
+        return f'{float(view):g}deg'
+    return f'view_{index}'
+
 def create_camera(pyrender, pyrender_body_mesh, scene, side, camera_location=None):
+    """Add camera of the view to the scene. 
+        The view (side) is given by name (see _side_angles), 
+        rotation angle around the body in degrees, or as a 4x4 camera pose
+    """
 
     # Create a camera
     y_fov = np.pi / 6. 
     camera = pyrender.PerspectiveCamera(yfov=y_fov)
     
+    if np.ndim(side) == 2:
+        # Camera pose is given
+        return scene.add(camera, pose=np.asarray(side, dtype=float))
+
 
     if camera_location is None:
         # Evaluate w.r.t. body
@@ -93,11 +129,14 @@ def create_camera(pyrender, pyrender_body_mesh, scene, side, camera_location=Non
 
     camera_pose = rotate_matrix_x(camera_pose, -15)
     camera_pose = rotate_matrix_y(camera_pose, 20)
-    if side == 'back':
-        camera_pose = rotate_matrix_y(camera_pose, 180)
+    if isinstance(side, str) and side not in _side_angles:
+        raise ValueError(f'create_camera::ERROR::Unknown view {side}. Supported: {list(_side_angles.keys())}')
+    angle = _side_angles[side] if isinstance(side, str) else float(side)
+    if angle:
+        camera_pose = rotate_matrix_y(camera_pose, angle)
 
     # Set camera's pose in the scene
-    scene.add(camera, pose=camera_pose)
+    return scene.add(camera, pose=camera_pose)
 
 def create_lights(scene, intensity=30.0):
     light_positions = [
@@ -157,23 +196,84 @@ def render(
     image = Image.fromarray(color)
     image.save(paths.render_path(side), "PNG")
 
-def load_meshes(paths:PathCofig, body_v, body_f):
+    # NOTE: releases GPU buffers of the meshes, s.t. the (cached) body mesh could be used with another renderer
+    renderer.delete()
+
+_body_material_defaults = {
+    'base_color': (0.0, 0.0, 0.0, 1.0),  # RGB color, Alpha
+    'metallic': 0.658,  # Range: [0.0, 1.0]
+    'roughness': 0.5  # Range: [0.0, 1.0]
+}
+_body_cache_size = 8
+_body_mesh_cache = OrderedDict()
+
+def body_key(body_v, body_f):
+    """Identifier of the body geometry"""
+    body_v, body_f = np.asarray(body_v), np.asarray(body_f)
+    return hashlib.sha1(body_v.tobytes() + body_f.tobytes()).hexdigest()
+
+def load_body_mesh(body_v, body_f, material_props=None):
+    """Body render mesh. Prepared meshes are cached by the body geometry and material, 
+        s.t. the same body is not re-processed for every garment
+    """
+    material_props = dict(_body_material_defaults, **(material_props or {}))
+    key = (
+        body_key(body_v, body_f), 
+        tuple(material_props['base_color']), material_props['metallic'], material_props['roughness'])
+    if key in _body_mesh_cache:
+        _body_mesh_cache.move_to_end(key)
+        return _body_mesh_cache[key]
+
     # Load body mesh
     body_mesh = trimesh.Trimesh(body_v, body_f)
     body_mesh.vertices = body_mesh.vertices / 100
     # Color body mesh
     body_material = pyrender.MetallicRoughnessMaterial(
-        baseColorFactor=(0.0, 0.0, 0.0, 1.0),  # RGB color, Alpha
-        metallicFactor=0.658,  # Range: [0.0, 1.0]
-        roughnessFactor=0.5  # Range: [0.0, 1.0]
+        baseColorFactor=material_props['base_color'],
+        metallicFactor=material_props['metallic'],
+        roughnessFactor=material_props['roughness']
     )
     pyrender_body_mesh = pyrender.Mesh.from_trimesh(body_mesh, material=body_material)
 
+    _body_mesh_cache[key] = pyrender_body_mesh
+    if len(_body_mesh_cache) > _body_cache_size:
+        _body_mesh_cache.popitem(last=False)
+    return pyrender_body_mesh
 
+def load_garment_mesh(paths: PathCofig, max_texture_size=None):
     #Load garment mesh
+    if not paths.g_sim.exists():
+        # Compact storage (see simulation.optimize_garment_storage()) -- no material file
+        garm_mesh = load_sim_mesh(paths, with_texture=False)
+        texture = paths.g_texture_fabric if paths.g_texture_fabric.exists() else paths.g_texture
+        return garment_mesh_from_arrays(
+            garm_mesh.vertices, garm_mesh.faces, garm_mesh.visual.uv, texture, 
+            max_texture_size=max_texture_size)
+
     garm_mesh = trimesh.load_mesh(str(paths.g_sim))  # NOTE: Includes the texture
     garm_mesh.vertices = garm_mesh.vertices / 100   # scale to m
 
+    return _garment_render_mesh(garm_mesh, max_texture_size)
+
+def garment_mesh_from_arrays(vertices, faces, uvs, texture, max_texture_size=None):
+    """Garment render mesh from in-memory data, without reading the simulated garment from disk
+        * vertices -- (n, 3) positions (in cm)
+        * faces -- (m, 3) vertex ids 
+        * uvs -- (n, 2) texture coordinates of the vertices (vertices are split along UV seams) 
+        * texture -- texture image or its path
+        * max_texture_size -- downsample the texture to fit into max_texture_size x max_texture_size, if given
+    """
+    if not isinstance(texture, Image.Image):
+        texture = Image.open(texture)
+    garm_mesh = trimesh.Trimesh(
+        np.asarray(vertices) / 100,   # scale to m
+        np.asarray(faces), 
+        visual=trimesh.visual.TextureVisuals(uv=np.asarray(uvs), image=texture),
+        process=False)
+
+    return _garment_render_mesh(garm_mesh, max_texture_size)
+
+def _garment_render_mesh(garm_mesh, max_texture_size=None):
     # Material adjustments
     material = garm_mesh.visual.material.to_pbr()
     material.baseColorFactor = [1., 1., 1., 1.]
@@ -182,18 +282,227 @@ def load_meshes(paths:PathCofig, body_v, body_f):
     white_back = Image.new('RGBA', material.baseColorTexture.size, color=(255, 255, 255, 255))
     white_back.paste(material.baseColorTexture)
     material.baseColorTexture = white_back.convert('RGB')  
+    if max_texture_size:
+        material.baseColorTexture.thumbnail((max_texture_size, max_texture_size))
 
     garm_mesh.visual.material = material
 
-    pyrender_garm_mesh = pyrender.Mesh.from_trimesh(garm_mesh, smooth=True) 
-    
-    return pyrender_garm_mesh, pyrender_body_mesh
-
-def render_images(paths: PathCofig, body_v, body_f, render_props):
-
-    pyrender_garm_mesh, pyrender_body_mesh = load_meshes(paths, body_v, body_f)
-
-    for side in render_props['sides']:
-        render(pyrender_garm_mesh, pyrender_body_mesh, side, paths, render_props)
+    return pyrender.Mesh.from_trimesh(garm_mesh, smooth=True) 
+
+def load_meshes(paths:PathCofig, body_v, body_f, body_material=None):
+    return load_garment_mesh(paths), load_body_mesh(body_v, body_f, body_material)
+
+
+_preview_defaults = {
+    'pixel_budget': 256 * 256,   # Number of pixels in a preview render
+    'texture_size': 256,   # Max size of the garment texture
+    'flat_shading': False   # Render without lighting
+}
+
+def preview_props(render_props):
+    """Render config of the preview profile: resolution is reduced to fit into the pixel budget 
+        (keeping the aspect ratio), and preview settings from 'preview' section of the render config 
+        are added to the defaults
+    """
+    preview = dict(_preview_defaults, **(render_props['preview'] if 'preview' in render_props else {}))
+    width, height = render_props['resolution'] if 'resolution' in render_props else (1080, 1080)
+    scale = min(1., np.sqrt(preview['pixel_budget'] / (width * height)))
+
+    props = dict(render_props)
+    props['resolution'] = [max(1, int(width * scale)), max(1, int(height * scale))]
+    props['preview'] = preview
+    return props
+
+
+class GarmentRenderer:
+    """Long-lived offscreen renderer. 
+        GL context, lights, cameras and the body mesh stay resident between the garments,
+        and only the garment mesh is swapped for every new garment
+    """
+    def __init__(self, render_props):
+        self.resolution = tuple(render_props['resolution']) if 'resolution' in render_props else (1080, 1080)
+        self.renderer = pyrender.OffscreenRenderer(
+            viewport_width=self.resolution[0], viewport_height=self.resolution[1])
+
+        self.scene = pyrender.Scene(bg_color=(1., 1., 1., 0.))  # Transparent!
+        create_lights(self.scene, intensity=80.)
+
+        self._body_node = None
+        self._camera_key = None
+        self._camera_nodes = {}
+
+    def _set_body(self, body_v, body_f, material_props=None):
+        """Replace the body mesh if the body differs from the current one"""
+        body_mesh = load_body_mesh(body_v, body_f, material_props)
+        if self._body_node is not None and self._body_node.mesh is body_mesh:
+            return False
+        if self._body_node is not None:
+            self.scene.remove_node(self._body_node)
+        self._body_node = self.scene.add(body_mesh)
+        return True
+
+    def _set_cameras(self, views, render_props, body_changed):
+        """Camera of every view. Cameras depend on the body if their location is not given"""
+        camera_location = render_props['front_camera_location'] if 'front_camera_location' in render_props else None
+        key = repr((
+            [np.asarray(view).tolist() for view in views], 
+            list(camera_location) if camera_location is not None else None))
+        if key == self._camera_key and not (body_changed and camera_location is None):
+            return
+        for node in self._camera_nodes.values():
+            self.scene.remove_node(node)
+        self._camera_nodes = {
+            view_name(view, i): create_camera(
+                pyrender, self._body_node.mesh, self.scene, view,
+                camera_location=list(camera_location) if camera_location is not None else None)
+            for i, view in enumerate(views)
+        }
+        self._camera_key = key
+
+    def render_garment(
+            self, paths: PathCofig, body_v, body_f, render_props, 
+            garment_arrays=None, save=True, profile='full', views=None):
+        """Render all the views of the simulated garment (uploaded to GPU once) to paths.render_path(view name)
+            * garment_arrays -- in-memory garment, arguments of garment_mesh_from_arrays(). 
+                The simulated garment is loaded from paths.g_sim if not given
+            * save -- save renders to disk. The RGBA renders are returned as {view name: image array} in any case. 
+                If 'contact_sheet' is set in the render config, all the views are also tiled into
+                paths.render_sheet_path()
+            * views -- camera views to render: names, angles or camera poses (see create_camera()). 
+                'sides' of the render config by default
+            * profile -- 'full' or 'preview'. Preview renders (see preview_props()) are saved to paths.preview_path(side)
+        """
+        if profile == 'preview':
+            render_props = preview_props(render_props)
+            max_texture_size = render_props['preview']['texture_size']
+            flags = pyrender.RenderFlags.RGBA
+            if render_props['preview']['flat_shading']:
+                flags |= pyrender.RenderFlags.FLAT
+            out_path = paths.preview_path
+        elif profile == 'full':
+            max_texture_size = None
+            flags = pyrender.RenderFlags.RGBA
+            out_path = paths.render_path
+        else:
+            raise ValueError(f'{self.__class__.__name__}::ERROR::Unknown render profile {profile}')
+
+        resolution = tuple(render_props['resolution']) if 'resolution' in render_props else (1080, 1080)
+        if resolution != self.resolution:
+            self.renderer.viewport_width, self.renderer.viewport_height = resolution
+            self.resolution = resolution
+
+        if views is None:
+            views = render_props['sides']
+        body_changed = self._set_body(
+            body_v, body_f, render_props['body_material'] if 'body_material' in render_props else None)
+        self._set_cameras(views, render_props, body_changed)
+
+        garment_mesh = (
+            garment_mesh_from_arrays(**garment_arrays, max_texture_size=max_texture_size) 
+            if garment_arrays is not None 
+            else load_garment_mesh(paths, max_texture_size=max_texture_size))
+        garment_node = self.scene.add(garment_mesh)
+        images = {}
+        try:
+            for i, view in enumerate(views):
+                name = view_name(view, i)
+                self.scene.main_camera_node = self._camera_nodes[name]
+                color, _ = self.renderer.render(self.scene, flags=flags)
+                if save:
+                    Image.fromarray(color).save(out_path(name), "PNG")
+                images[name] = color
+        finally:
+            # NOTE: GPU buffers of the removed mesh are released on the next render
+            self.scene.remove_node(garment_node)
+
+        if save and 'contact_sheet' in render_props and render_props['contact_sheet']:
+            contact_sheet(list(images.values()), columns=len(images), labels=list(images.keys())).save(
+                paths.render_sheet_path(preview=profile == 'preview'), "PNG")
+        return images
+
+    def delete(self):
+        self.renderer.delete()
+
+
+def _render_worker_loop(tasks, results):
+    renderer = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        args, kwargs = task
+        try:
+            if renderer is None:
+                renderer = GarmentRenderer(args[3])
+            images = renderer.render_garment(*args, **kwargs)
+            results.put((None, images if not kwargs['save'] else None))
+        except BaseException:
+            results.put((traceback.format_exc(), None))
+    if renderer is not None:
+        renderer.delete()
+
+
+class RenderWorker:
+    """GarmentRenderer running in a separate process, 
+        e.g. to keep the GL context apart from the simulator's CUDA context
+    """
+    def __init__(self):
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._process = context.Process(
+            target=_render_worker_loop, args=(self._tasks, self._results), daemon=True)
+        self._process.start()
+
+    def render_garment(
+            self, paths: PathCofig, body_v, body_f, render_props, 
+            garment_arrays=None, save=True, profile='full', views=None):
+        """See GarmentRenderer.render_garment(). 
+            NOTE: Renders are only returned if not saved, to avoid transfering them between processes
+        """
+        self._tasks.put((
+            (paths, np.asarray(body_v), np.asarray(body_f), render_props), 
+            dict(garment_arrays=garment_arrays, save=save, profile=profile, views=views)))
+        while True:
+            try:
+                error, images = self._results.get(timeout=1.)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise RuntimeError(f'{self.__class__.__name__}::ERROR::Render worker process died')
+        if error is not None:
+            raise RuntimeError(f'{self.__class__.__name__}::ERROR::Rendering failed in the worker:\n{error}')
+        return images
+
+    def delete(self):
+        if self._process.is_alive():
+            self._tasks.put(None)
+            self._process.join()
+
+
+_renderer = None
+
+def get_renderer(render_props):
+    """Renderer shared by all the render_images() calls of the process. 
+        Runs in a worker process if 'render_worker' is set in render config
+    """
+    global _renderer
+    if _renderer is None:
+        _renderer = RenderWorker() if render_props.get('render_worker', False) else GarmentRenderer(render_props)
+    return _renderer
+
+def render_images(
+        paths: PathCofig, body_v, body_f, render_props, 
+        garment_arrays=None, save=True, profile=None, views=None):
+    """Render the garment on the body from all the requested views (render config 'sides' by default). 
+        The garment is taken from garment_arrays (see garment_mesh_from_arrays()) if given, 
+        or loaded from paths.g_sim otherwise. 
+        Render profile ('full' or 'preview') is taken from the render config if not given
+    """
+    if profile is None:
+        profile = render_props['profile'] if 'profile' in render_props else 'full'
+    return get_renderer(render_props).render_garment(
+        paths, body_v, body_f, render_props, 
+        garment_arrays=garment_arrays, save=save, profile=profile, views=views)
 
 
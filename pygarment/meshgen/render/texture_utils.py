@@ -1,9 +1,15 @@
 """Routines for processing UV coordinated for garments and generating texture maps"""
+import hashlib
+import itertools
+import os
+import uuid
+from collections import OrderedDict
 import numpy as np
 import igl
 import matplotlib.pyplot as plt
 import matplotlib
 from pathlib import Path
+from PIL import Image, ImageDraw
 
 # SECTION UV islands texture creation 
 def texture_mesh_islands(
@@ -16,12 +22,19 @@ def texture_mesh_islands(
         background_img_path=None,
         background_resolution=1.,
         uv_padding=3, 
-        mat_name='islands_texture'
+        mat_name='islands_texture',
+        rasterizer='pil',
+        fabric_canvas_step=10,
+        fabric_cache_path=None,
+        packing='maxrects',
+        allow_rotation=False
 ):
     """
         Returns updated uv coordinates (properly normalized and aligned with the created texture)
     """
-    all_uvs, boundary_uv_to_draw = unwarp_UV(texture_coords, face_texture_coords, padding=uv_padding)
+    all_uvs, boundary_uv_to_draw = unwarp_UV(
+        texture_coords, face_texture_coords, padding=uv_padding, 
+        packing=packing, allow_rotation=allow_rotation)
         
     uv_list, width, height = normalize_UVs(all_uvs, axis_padding=uv_padding)   # NOTE !! Axis padding should match the uv padding
 
@@ -31,7 +44,8 @@ def texture_mesh_islands(
         texture_image_path=out_texture_image_path,
         boundary_width=boundary_width,
         dpi=dpi,
-        preserve_alpha=True
+        preserve_alpha=True,
+        rasterizer=rasterizer
     )
 
     # Create image with fabric background
@@ -43,7 +57,10 @@ def texture_mesh_islands(
             dpi=dpi,
             background_img_path=background_img_path, 
             background_resolution=background_resolution,
-            preserve_alpha=False  
+            preserve_alpha=False,
+            rasterizer=rasterizer,
+            fabric_canvas_step=fabric_canvas_step,
+            fabric_cache_path=fabric_cache_path
         )
 
     # Save mtl is requested
@@ -64,21 +81,18 @@ def _uv_connected_components(face_texture_coords):
 
     return vert_components, face_components, num_ccs
 
-def unwarp_UV(texture_coords, face_texture_coords, padding=3):
+def unwarp_UV(texture_coords, face_texture_coords, padding=3, packing='maxrects', allow_rotation=False):
+    """Layout UV islands (connected components) in the UV space without overlaps
+        * packing -- 'maxrects' for compact packing of the island bounding boxes, 
+            'shelf' for the (legacy) layout in columns
+        * allow_rotation -- allow 'maxrects' to rotate islands by 90 degrees. 
+            NOTE: rotates the fabric grain of the rotated panels
+    """
     # Unwrap uvs for each connected component------------------------
 
     vert_components, face_components, num_ccs = _uv_connected_components(face_texture_coords)
 
-    all_uvs = [] # transform all UVs to update obj file
-    boundary_uv_to_draw = [] # only draw the boundary UVs
-
-    translate_Y = 0
-    translate_X = 0
-
-    shells_per_row = int(num_ccs ** 0.5)
-    column_x_shift = 0
-
-    # Loop through each connected component
+    all_vert_pos, bound_vert_pos, sizes = [], [], []
     for i in range(num_ccs):
         
         # Get faces and vertices of connected component
@@ -87,18 +101,49 @@ def unwarp_UV(texture_coords, face_texture_coords, padding=3):
 
         # get all vertices of connected component
         verts_in_cc = np.where(vert_components == i)[0]
-
-        all_vert_pos = texture_coords[verts_in_cc]
         
         # Find boundary loop
         bound_verts = igl.boundary_loop(face_vts_in_cc)
-        bound_vert_pos = texture_coords[bound_verts]
 
-        # Shift component by bounding box
-        bbox = bound_vert_pos.min(axis=0), bound_vert_pos.max(axis=0)
-        bbox_len_Y = (bbox[1][1] - bbox[0][1])
-        bbox_len_X = (bbox[1][0] - bbox[0][0])
-    
+        # Shift component to the origin
+        bbox_min = texture_coords[bound_verts].min(axis=0)
+        all_vert_pos.append(texture_coords[verts_in_cc] - bbox_min)
+        bound_vert_pos.append(texture_coords[bound_verts] - bbox_min)
+        sizes.append(bound_vert_pos[-1].max(axis=0))
+
+    if packing == 'shelf':
+        placements = _shelf_pack(sizes, padding)
+    elif packing == 'maxrects':
+        placements = _maxrects_pack(sizes, padding, allow_rotation=allow_rotation)
+    else:
+        raise ValueError(f'unwarp_UV::ERROR::Unknown packing {packing}')
+
+    all_uvs = [] # transform all UVs to update obj file
+    boundary_uv_to_draw = [] # only draw the boundary UVs
+    for i, (translate_X, translate_Y, rotated) in enumerate(placements):
+        bound_pos, all_pos = bound_vert_pos[i], all_vert_pos[i]
+        if rotated:
+            # 90 deg counterclockwise, keeping the island in the positive quadrant
+            bound_pos = np.stack([sizes[i][1] - bound_pos[:, 1], bound_pos[:, 0]], axis=1)
+            all_pos = np.stack([sizes[i][1] - all_pos[:, 1], all_pos[:, 0]], axis=1)
+
+        # translate boundary positions
+        boundary_uv_to_draw.append([(x + translate_X, y + translate_Y) for x, y in bound_pos])
+        
+        # translate all positions
+        all_uvs.extend([(x + translate_X, y + translate_Y) for x, y in all_pos])
+
+    return all_uvs, boundary_uv_to_draw  
+
+def _shelf_pack(sizes, padding):
+    """Islands in columns of (roughly) equal number of islands"""
+    placements = []
+    translate_Y = 0
+    translate_X = 0
+
+    shells_per_row = int(len(sizes) ** 0.5)
+    column_x_shift = 0
+    for i, (bbox_len_X, bbox_len_Y) in enumerate(sizes):
         if (i % shells_per_row == 0):
             # Start new column
             translate_Y = padding
@@ -108,17 +153,95 @@ def unwarp_UV(texture_coords, face_texture_coords, padding=3):
         # Update shift
         column_x_shift = max(bbox_len_X, column_x_shift)
 
-        # translate boundary positions
-        verts_translated_bound = [(x + translate_X, y + translate_Y) for x, y in bound_vert_pos]
-        boundary_uv_to_draw.append(verts_translated_bound)
-        
-        # translate all positions
-        verts_translated = [(x + translate_X, y + translate_Y) for x, y in all_vert_pos]
-        all_uvs.extend(verts_translated)
-        
+        placements.append((translate_X, translate_Y, False))
         translate_Y = translate_Y + bbox_len_Y + padding
 
-    return all_uvs, boundary_uv_to_draw  
+    return placements
+
+def _maxrects_pack(sizes, padding, allow_rotation=False, n_widths=20):
+    """Pack the island bounding boxes (with padding) with MaxRects Bottom-Left heuristic 
+        (J. Jylänki, A Thousand Ways to Pack the Bin, 2010) into a strip. 
+        Several strip widths (with and without rotations) are tried, and the layout with the smallest area is chosen
+    """
+    rects = [(w + padding, h + padding) for w, h in sizes]
+    # NOTE: Larger islands first
+    order = sorted(range(len(rects)), key=lambda i: (max(rects[i]), min(rects[i])), reverse=True)
+
+    min_width = max(min(r) if allow_rotation else r[0] for r in rects)
+    total_area = sum(w * h for w, h in rects)
+    total_height = sum(max(r) for r in rects)
+    widths = np.unique(np.concatenate([
+        np.sqrt(total_area) * np.linspace(0.8, 2.5, n_widths),
+        [sum(r[0] for r in rects)]   # Everything in one row
+    ]))
+
+    best, best_area = None, None
+    for width, rotation in itertools.product(widths, [False, True] if allow_rotation else [False]):
+        width = max(width, min_width)
+        placements = _maxrects_strip(rects, order, width, total_height, rotation)
+        if placements is None:
+            continue
+        used_w = max(x + (rects[i][1] if rot else rects[i][0]) for i, (x, _, rot) in enumerate(placements))
+        used_h = max(y + (rects[i][0] if rot else rects[i][1]) for i, (_, y, rot) in enumerate(placements))
+        if best is None or used_w * used_h < best_area:
+            best, best_area = placements, used_w * used_h
+
+    # Islands are placed after the padding
+    return [(x + padding, y + padding, rot) for x, y, rot in best]
+
+def _maxrects_strip(rects, order, width, height, allow_rotation):
+    free = [(0., 0., width, height)]   # x, y, w, h
+    placements = [None] * len(rects)
+    for i in order:
+        best, best_score = None, None
+        for fx, fy, fw, fh in free:
+            for rotated in ([False, True] if allow_rotation else [False]):
+                w, h = rects[i][::-1] if rotated else rects[i]
+                if w <= fw and h <= fh:
+                    score = (fy + h, fx)   # Bottom-Left
+                    if best_score is None or score < best_score:
+                        best, best_score = (fx, fy, w, h, rotated), score
+        if best is None:
+            return None
+        x, y, w, h, rotated = best
+        placements[i] = (x, y, rotated)
+        free = _maxrects_split(free, x, y, w, h)
+    return placements
+
+def _maxrects_split(free, x, y, w, h):
+    """Update free rectangles after placing (x, y, w, h)"""
+    new_free = []
+    for fx, fy, fw, fh in free:
+        if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+            new_free.append((fx, fy, fw, fh))
+            continue
+        # Split the intersected free rectangle into up to 4 maximal ones
+        if x > fx:
+            new_free.append((fx, fy, x - fx, fh))
+        if x + w < fx + fw:
+            new_free.append((x + w, fy, fx + fw - x - w, fh))
+        if y > fy:
+            new_free.append((fx, fy, fw, y - fy))
+        if y + h < fy + fh:
+            new_free.append((fx, y + h, fw, fy + fh - y - h))
+
+    # Remove rectangles contained in others
+    return [
+        r for i, r in enumerate(new_free) 
+        if not any(
+            j != i and o[0] <= r[0] and o[1] <= r[1] 
+            and r[0] + r[2] <= o[0] + o[2] and r[1] + r[3] <= o[1] + o[3] 
+            and (o != r or j < i)
+            for j, o in enumerate(new_free))
+    ]
+
+def uv_occupancy(boundary_uv_to_draw, width, height):
+    """Fraction of the UV map area covered by the islands"""
+    area = 0
+    for boundary in boundary_uv_to_draw:
+        x, y = np.asarray(boundary).T
+        area += 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))   # Shoelace
+    return area / (width * height)
 
 def normalize_UVs(all_uvs, axis_padding=3):
     # normalize all_uvs
@@ -143,7 +266,10 @@ def create_UV_island_texture(
         background_alpha=0.8,
         background_img_path=None,
         background_resolution=5,
-        preserve_alpha=True
+        preserve_alpha=True,
+        rasterizer='pil',
+        fabric_canvas_step=10,
+        fabric_cache_path=None
     ):
     """Create texture image from the set of UV boundary loops (e.g. sewing pattern panels). 
         It renders the border of the loops and fills them in with color 
@@ -154,7 +280,151 @@ def create_UV_island_texture(
             * texture_image_path -- filepath to same a texture image to
             * boundary_width -- width of the boundary outline 
             * dpi -- resolution of the output image
+            * rasterizer -- 'pil' draws directly into the image buffer, 'matplotlib' uses (slower) matplotlib figures.
+                Both produce images of the same size and look
+            * fabric_canvas_step, fabric_cache_path -- caching of the fabric backgrounds, see fabric_canvas(). 
+                Only used by the 'pil' rasterizer
+    """
+    args = dict(
+        boundary_width=boundary_width, boundary_color=boundary_color, dpi=dpi, 
+        color_alpha=color_alpha, background_alpha=background_alpha, 
+        background_img_path=background_img_path, background_resolution=background_resolution,
+        preserve_alpha=preserve_alpha
+    )
+    if rasterizer == 'pil':
+        _rasterize_UV_islands(
+            boundary_uv_to_draw, width, height, texture_image_path, 
+            fabric_canvas_step=fabric_canvas_step, fabric_cache_path=fabric_cache_path, **args)
+    elif rasterizer == 'matplotlib':
+        _plot_UV_islands(boundary_uv_to_draw, width, height, texture_image_path, **args)
+    else:
+        raise ValueError(f'create_UV_island_texture::ERROR::Unknown rasterizer {rasterizer}')
+
+def _island_colors(n_components, shift=0.17):
+    divisor = max(5, n_components)
+    cmap = matplotlib.colormaps['twilight']   # copper cool  spring winter twilight  # Using smooth Matplotlib colormaps
+    return [cmap((1 - shift) * id / divisor) for id in range(divisor)]
+
+def texture_scale(dpi):
+    """Pixels per UV unit in the texture images of the given dpi"""
+    # NOTE: matplotlib's default axes take 77% of the figure height, which 
+    # defines the size of the texture images created with matplotlib
+    return dpi / 100 * 0.77
+
+def _rasterize_UV_islands(
+        boundary_uv_to_draw, width, height, texture_image_path, 
+        boundary_width, boundary_color, dpi, color_alpha, background_alpha,
+        background_img_path, background_resolution, preserve_alpha, 
+        fabric_canvas_step=10, fabric_cache_path=None,
+        supersampling=2
+    ):
+    """Draw the UV islands directly into an image buffer. 
+        Polygons are drawn with supersampling for anti-aliased edges
+    """
+    scale = texture_scale(dpi)
+    im_size = int(width * scale), int(height * scale)
+
+    # Base: background, white or transparent
+    if background_img_path is not None:
+        image = fabric_canvas(
+            background_img_path, width, height, scale, 
+            background_resolution=background_resolution, background_alpha=background_alpha,
+            transparent=preserve_alpha, canvas_step=fabric_canvas_step, cache_path=fabric_cache_path)
+    else:
+        image = Image.new('RGBA', im_size, (255, 255, 255, 0 if preserve_alpha else 255))
+
+    # Islands
+    ss_scale = scale * supersampling
+    islands = Image.new('RGBA', (im_size[0] * supersampling, im_size[1] * supersampling), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(islands)
+    line_color = tuple(int(c * 255) for c in matplotlib.colors.to_rgba(boundary_color))
+    line_width = max(1, round(boundary_width / 2 * dpi / 72 * supersampling))  # points to pixels
+    colors = _island_colors(len(boundary_uv_to_draw))
+    for i, boundary in enumerate(boundary_uv_to_draw):
+        boundary = np.asarray(boundary, dtype=float)
+        # NOTE: PIL puts pixel centers at integer coordinates
+        polygon = np.stack([boundary[:, 0] * ss_scale, (height - boundary[:, 1]) * ss_scale], axis=1) - 0.5
+        polygon = [tuple(p) for p in polygon]
+
+        color = tuple(int(round(c * 255)) for c in colors[i][:3]) + (int(round(color_alpha * 255)), )
+        draw.polygon(polygon, fill=color)
+        draw.line(polygon + [polygon[0]], fill=line_color, width=line_width)
+
+    # Downsample with premultiplied alpha (no dark fringes) and composite over the base
+    islands = islands.convert('RGBa').reduce(supersampling).convert('RGBA')
+    image = Image.alpha_composite(image, islands)
+
+    if not preserve_alpha:
+        image = image.convert('RGB')   # Opaque anyway. Smaller to store
+    # NOTE: ~3x faster to encode than the default level 6 with only a few % larger files
+    image.save(texture_image_path, compress_level=3)
+
+_fabric_cache_size = 16
+_fabric_canvas_cache = OrderedDict()
+
+def fabric_canvas(
+        background_img_path, width, height, scale, 
+        background_resolution=5, background_alpha=0.8, transparent=False,
+        canvas_step=10, cache_path=None):
+    """Fabric background of the texture of int(width * scale) x int(height * scale) pixels, 
+        blended over white (or transparent) canvas.
+
+        Canvases are cached by the fabric image, canvas size and scale in memory and, 
+        if cache_path is given, on disk. To reuse canvases between garments, 
+        the canvas size is rounded up to the multiple of canvas_step (in UV units, 0 for no rounding), 
+        and the requested size is cropped from it
     """
+    im_size = int(width * scale), int(height * scale)
+    if canvas_step:
+        width = np.ceil(width / canvas_step) * canvas_step
+        height = np.ceil(height / canvas_step) * canvas_step
+    canvas_size = int(width * scale), int(height * scale)
+
+    fabric_path = Path(background_img_path).resolve()
+    fabric_stat = fabric_path.stat()
+    # NOTE: Same crop as in the matplotlib version: rows by width, columns by height
+    crop_size = int(height * background_resolution), int(width * background_resolution)
+    key = (
+        str(fabric_path), fabric_stat.st_mtime_ns, fabric_stat.st_size, 
+        canvas_size, crop_size, background_alpha, transparent)
+
+    if key in _fabric_canvas_cache:
+        _fabric_canvas_cache.move_to_end(key)
+        canvas = _fabric_canvas_cache[key]
+    else:
+        file_path = None
+        if cache_path is not None:
+            file_path = Path(cache_path) / f'fabric_{hashlib.sha1(repr(key).encode("utf-8")).hexdigest()}.npy'
+        if file_path is not None and file_path.exists():
+            canvas = Image.fromarray(np.load(file_path), 'RGBA')
+        else:
+            back_img = Image.open(fabric_path).convert('RGBA')
+            back_img = back_img.crop((
+                0, 0, min(crop_size[0], back_img.width), min(crop_size[1], back_img.height)))
+            back_img = back_img.resize(canvas_size, Image.BILINEAR)
+            back_img.putalpha(back_img.getchannel('A').point(lambda a: round(a * background_alpha)))
+            canvas = Image.alpha_composite(
+                Image.new('RGBA', canvas_size, (255, 255, 255, 0 if transparent else 255)), back_img)
+
+            if file_path is not None:
+                # NOTE: Written atomically -- other processes may read the cache at the same time
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = file_path.with_name(f'{file_path.stem}_{uuid.uuid4().hex}.tmp.npy')
+                np.save(tmp_path, np.asarray(canvas))
+                os.replace(tmp_path, file_path)
+
+        _fabric_canvas_cache[key] = canvas
+        if len(_fabric_canvas_cache) > _fabric_cache_size:
+            _fabric_canvas_cache.popitem(last=False)
+
+    return canvas.crop((0, 0, im_size[0], im_size[1]))
+
+def _plot_UV_islands(
+        boundary_uv_to_draw, width, height, texture_image_path, 
+        boundary_width, boundary_color, dpi, color_alpha, background_alpha,
+        background_img_path, background_resolution, preserve_alpha
+    ):
+    """Draw the UV islands with matplotlib"""
     n_components = len(boundary_uv_to_draw)
 
     # Figure size
@@ -162,10 +432,7 @@ def create_UV_island_texture(
     fig.set_size_inches(width / 100, height / 100)  # width & height are usually given in cm
 
     # Colors
-    shift = 0.17
-    divisor = max(5, n_components)
-    cmap = matplotlib.colormaps['twilight']   # copper cool  spring winter twilight  # Using smooth Matplotlib colormaps
-    color_sample = [cmap((1 - shift) * id / divisor) for id in range(divisor)]
+    color_sample = _island_colors(n_components)
 
     # Background -- garment style
     if background_img_path is not None:
@@ -264,6 +531,17 @@ def save_obj(
                         f"{v_id1 + 1}/{tex_id1 + 1} "
                         f"{v_id2 + 1}/{tex_id2 + 1}\n")
 
+def read_obj_uvs(obj_file_path):
+    """Texture coordinates and texture coordinate ids of the faces of a triangle mesh obj file"""
+    uvs, face_uv_ids = [], []
+    with open(obj_file_path, 'r') as file:
+        for line in file:
+            if line.startswith('vt '):
+                uvs.append([float(c) for c in line.split()[1:3]])
+            elif line.startswith('f '):
+                face_uv_ids.append([int(corner.split('/')[1]) - 1 for corner in line.split()[1:4]])
+    return np.array(uvs), np.array(face_uv_ids)
+
 def add_texture_to_obj(obj_file_path, output_file_path, uv_list, mtl_file_name, mat_name):
     # Update OBJ-----------------------------------------------------
 
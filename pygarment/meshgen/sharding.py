@@ -0,0 +1,331 @@
+"""Sharding of the dataset simulation between several machines sharing a filesystem
+
+    Patterns are deterministically assigned to shards by the hash of their names (or balanced 
+    by their predicted processing cost), and the assignment is stored in the shard manifest in the output folder. Each shard keeps its own
+    dataset properties file, s.t. the nodes never write to the same file.
+    Nodes take shards through lease files created atomically (O_EXCL).
+    Leases are kept alive by heartbeats, and leases of dead nodes become stale and are
+    picked up by the idle nodes. No external queue service is needed.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+from pygarment.data_config import Properties
+from pygarment.data_index import DatasetIndex
+from pygarment.meshgen.cost_model import balance_shards
+
+
+def shard_of(name, num_shards):
+    """Shard id of the pattern. Stable between the runs and the machines"""
+    return zlib.crc32(name.encode('utf-8')) % num_shards
+
+
+class ShardManifest:
+    """Assignment of patterns to shards and the shard state files in the output folder"""
+
+    manifest_name = 'shard_manifest.json'
+
+    def __init__(self, output_path: Path, body_type, shards, costs=None):
+        self.output_path = Path(output_path)
+        self.body_type = body_type
+        self.shards = shards   # list of lists of pattern names
+        self.costs = costs     # {pattern name: predicted cost} if the shards are balanced by cost
+        self.lease_path = self.output_path / 'shard_leases'
+        self.lease_path.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def load_or_create(cls, output_path: Path, body_type, pattern_names, num_shards=None, predict_costs=None):
+        """Load the manifest of the output folder or create one if not yet created.
+            The manifest created by another node is reused as is
+            * predict_costs -- optional function: list of pattern names -> list of their predicted processing costs.
+                If given, shards are balanced by the total predicted cost (LPT) instead of assigned by the name hash,
+                s.t. the expensive patterns do not pile up in a few straggler shards.
+                The predicted costs are stored in the manifest and reused by the nodes (see costs)
+        """
+        output_path = Path(output_path)
+        path = output_path / cls.manifest_name
+        if not path.exists():
+            if num_shards is None:
+                raise ValueError(f'{cls.__name__}::ERROR::No shard manifest in {output_path}, number of shards required')
+            pattern_names = sorted(pattern_names)
+            costs = None
+            if predict_costs is not None:
+                costs = dict(zip(pattern_names, predict_costs(pattern_names)))
+                shards = balance_shards(pattern_names, [costs[name] for name in pattern_names], num_shards)
+            else:
+                shards = [[] for _ in range(num_shards)]
+                for name in pattern_names:
+                    shards[shard_of(name, num_shards)].append(name)
+
+            # NOTE: the manifest is deterministic (given the same cost model), 
+            # so racing nodes write identical files
+            tmp_path = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'num_shards': num_shards, 'shards': shards, 'costs': costs}, f, indent=2)
+            os.replace(tmp_path, path)
+
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if num_shards is not None and manifest['num_shards'] != num_shards:
+            raise ValueError(
+                f'{cls.__name__}::ERROR::{path} is created for {manifest["num_shards"]} shards, '
+                f'{num_shards} requested')
+
+        return cls(output_path, body_type, manifest['shards'], costs=manifest.get('costs'))
+
+    @property
+    def num_shards(self):
+        return len(self.shards)
+
+    def props_path(self, shard_id):
+        return self.output_path / f'dataset_properties_{self.body_type}_shard_{shard_id}.yaml'
+
+    def index_path(self, shard_id):
+        return self.output_path / f'dataset_index_shard_{shard_id}.sqlite'
+
+    def _done_path(self, shard_id):
+        return self.lease_path / f'shard_{shard_id}.done'
+
+    def is_done(self, shard_id):
+        return self._done_path(shard_id).exists()
+
+    def mark_done(self, shard_id):
+        self._done_path(shard_id).touch()
+
+    def all_done(self):
+        return all(self.is_done(shard_id) for shard_id in range(self.num_shards))
+
+    def acquire(self, shard_id=None, lease_timeout=900., heartbeat_interval=60.):
+        """Lease a shard to process: the requested one, or any unfinished shard that is not leased
+            by a live node. Shards that were never started are preferred over the stragglers.
+            Returns None if nothing is available
+        """
+        if shard_id is not None:
+            candidates = [shard_id]
+        else:
+            # Spread the nodes over the shards to reduce contention
+            start = zlib.crc32(f'{socket.gethostname()}_{os.getpid()}'.encode('utf-8')) % self.num_shards
+            order = [(start + i) % self.num_shards for i in range(self.num_shards)]
+            candidates = sorted(order, key=lambda i: self.props_path(i).exists())
+
+        for candidate in candidates:
+            if self.is_done(candidate):
+                continue
+            lease = ShardLease(
+                self.lease_path / f'shard_{candidate}.lease', candidate,
+                lease_timeout=lease_timeout, heartbeat_interval=heartbeat_interval)
+            if lease.try_acquire():
+                return lease
+        return None
+
+    def merge(self):
+        """Merge the dataset properties of all the shards started so far.
+            Config and other info is taken from the first one, the stats are combined
+        """
+        merged = None
+        started = 0
+        for shard_id in range(self.num_shards):
+            path = self.props_path(shard_id)
+            if not path.exists():
+                continue
+            started += 1
+            shard_props = Properties(path)
+            if merged is None:
+                merged = shard_props
+                continue
+            for key, section in shard_props.properties.items():
+                if isinstance(section, dict) and 'stats' in section and key in merged:
+                    _merge_stats(merged[key]['stats'], section['stats'])
+
+        if merged is None:
+            return None
+
+        finished = started == self.num_shards and self.all_done()
+        merged['frozen'] = finished
+        merged['shards'] = {
+            'num_shards': self.num_shards,
+            'started': started,
+            'done': sum(self.is_done(shard_id) for shard_id in range(self.num_shards))
+        }
+        if finished and 'sim' in merged:
+            for key in ['processed', 'stop_over', 'pending']:
+                merged['sim']['stats'].pop(key, None)
+        merged.stats_summary()
+
+        return merged
+
+    def merge_index(self):
+        """Merge the sample indices of the shards into the dataset index of the output folder"""
+        with DatasetIndex(self.output_path / DatasetIndex.file_name) as index:
+            for shard_id in range(self.num_shards):
+                if self.index_path(shard_id).exists():
+                    index.merge(self.index_path(shard_id))
+
+
+class ShardLease:
+    """Exclusive lease of a shard, kept alive by the heartbeat thread.
+        Lease is stale if its heartbeat is older than lease_timeout, or if it belongs to
+        a dead process on the same host (e.g. the node restarted after a crash)
+
+        Every acquisition writes a unique token to the lease file. A node that was considered dead
+        (e.g. stalled for longer than lease_timeout) finds another token in its lease on the next heartbeat,
+        sets the 'lost' event to stop processing the shard, and leaves the lease of the new owner intact
+    """
+    def __init__(self, path: Path, shard_id, lease_timeout=900., heartbeat_interval=60.):
+        self.path = Path(path)
+        self.shard_id = shard_id
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.token = None
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self):
+        self.token = uuid.uuid4().hex
+        try:
+            self._create()
+        except FileExistsError:
+            stale_owner = self._stale_owner()
+            if stale_owner is None:
+                return False
+            # Take over the stale lease. Only one of the racing nodes succeeds in moving it
+            stale_path = self.path.with_name(f'{self.path.name}.{uuid.uuid4().hex}.stale')
+            try:
+                os.rename(self.path, stale_path)
+            except FileNotFoundError:
+                return False
+            if self._read_owner(stale_path) != stale_owner:
+                # Another node took over in between and the fresh lease was moved -- give it back.
+                # NOTE: Linking never overwrites a lease created by yet another node meanwhile. 
+                # If one was, the node whose lease was moved finds out on its heartbeat
+                try:
+                    os.link(stale_path, self.path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+            try:
+                self._create()
+            except FileExistsError:
+                return False
+
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+        return True
+
+    def is_owned(self):
+        """The lease file is the one created by this lease"""
+        owner = self._read_owner(self.path)
+        return owner is not None and owner.get('token') == self.token
+
+    def tmp_path(self, path: Path):
+        """Hidden file to write a new version of the shard file to before committing it (see commit_file())"""
+        path = Path(path)
+        return path.with_name(f'.{path.stem}.{self.token}{path.suffix}')
+
+    def commit_file(self, tmp_path: Path, path: Path):
+        """Replace the file of the shard with its new version only if the lease is still owned.
+            Otherwise, the new version is discarded and 'lost' is set
+            Returns True if the file is replaced
+            NOTE: The lease is checked right before the replacement, s.t. a node that lost its lease 
+            while writing the file does not overwrite the progress of the new owner
+        """
+        if self.is_owned():
+            os.replace(tmp_path, path)
+            return True
+        os.remove(tmp_path)
+        self.lost.set()
+        return False
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not self.is_owned():
+            return   # Taken over by another node
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _create(self):
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time(), 'token': self.token
+            }, f)
+
+    def _read_owner(self, path):
+        """Contents of the lease file. None if there is no file, {} if it is being written"""
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return {}
+
+    def _stale_owner(self, path=None):
+        """Contents of the lease file if the lease is stale, None otherwise"""
+        path = path or self.path
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        owner = self._read_owner(path)
+        if owner is None:
+            return None
+        if not owner:
+            # Lease is being written
+            return owner if age > self.lease_timeout else None
+
+        if age > self.lease_timeout:
+            return owner
+        if owner['host'] == socket.gethostname():
+            try:
+                os.kill(owner['pid'], 0)
+            except ProcessLookupError:
+                return owner
+            except PermissionError:
+                pass
+        return None
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            if not self.is_owned():
+                print(f'{self.__class__.__name__}::WARNING::Lease of shard {self.shard_id} was taken over. '
+                      'Processing of the shard is stopped')
+                self.lost.set()
+                return
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                pass   # Taken over right after the check -- found on the next heartbeat
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def _merge_stats(stats, new_stats):
+    """Combine per-sample stats: dicts are merged, lists are concatenated"""
+    for key, value in new_stats.items():
+        if key not in stats:
+            stats[key] = value
+        elif isinstance(value, dict) and isinstance(stats[key], dict):
+            _merge_stats(stats[key], value)
+        elif isinstance(value, list) and isinstance(stats[key], list):
+            # NOTE: samples of the shards do not overlap
+            stats[key] = stats[key] + value
+        # NOTE: Summaries are re-computed after the merge
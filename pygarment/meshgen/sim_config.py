@@ -72,6 +72,7 @@ class PathCofig:
 
         self.g_box_mesh = self.out_el / f'{self.boxmesh_tag}_boxmesh.obj'
         self.g_box_mesh_compressed = self.out_el / f'{self.boxmesh_tag}_boxmesh.ply'
+        self.g_box_topology = self.out_el / f'{self.boxmesh_tag}_boxmesh_topology.npz'
         self.g_mesh_segmentation = self.out_el / f'{self.boxmesh_tag}_sim_segmentation.txt'
         self.g_orig_edge_len = self.out_el / f'{self.boxmesh_tag}_orig_lens.pickle'
         self.g_vert_labels = self.out_el / f'{self.boxmesh_tag}_vertex_labels.yaml'
@@ -89,13 +90,26 @@ class PathCofig:
         self.g_sim = self.out_el / f'{self.sim_tag}_sim.obj'
         self.g_sim_glb = self.out_el / f'{self.sim_tag}_sim.glb'
         self.g_sim_compressed = self.out_el / f'{self.sim_tag}_sim.ply'
+        self.g_sim_positions = self.out_el / f'{self.sim_tag}_sim_positions.npy'
+        self.g_sim_normals = self.out_el / f'{self.sim_tag}_sim_normals.npy'
         self.usd = self.out_el / f'{self.sim_tag}_simulation.usd'
+        self.g_sim_telemetry = self.out_el / f'{self.sim_tag}_sim_telemetry.npz'
+        self.g_sim_capture = self.out_el / f'{self.sim_tag}_sim_capture.npz'
 
 
     def render_path(self, camera_name=''):
         
         fname = f'{self.sim_tag}_render_{camera_name}.png' if camera_name else f'{self.sim_tag}_render.png'
         return self.out_el / fname
+
+    def preview_path(self, camera_name=''):
+        
+        fname = f'{self.sim_tag}_preview_{camera_name}.png' if camera_name else f'{self.sim_tag}_preview.png'
+        return self.out_el / fname
+
+    def render_sheet_path(self, preview=False):
+        """All the views of the garment tiled in one image"""
+        return self.out_el / f'{self.sim_tag}_{"preview" if preview else "views"}_sheet.png'
         
 
 class SimConfig:
@@ -108,7 +122,7 @@ class SimConfig:
 
         # Basic setup
         self.sim_fps = 60.0
-        self.sim_substeps = 10 #increase?
+        self.sim_substeps = self.get_sim_props_value(sim_props, 'sim_substeps', 10)
         self.sim_wo_gravity_percentage = 0
         self.zero_gravity_steps = self.get_sim_props_value(sim_props, 'zero_gravity_steps', 5)
         self.resolution_scale = self.get_sim_props_value(sim_props, 'resolution_scale', 1.0)
@@ -122,6 +136,20 @@ class SimConfig:
             self.max_frame_time = int(self.max_frame_time)
         self.max_sim_time = int(self.get_sim_props_value(sim_props, 'max_sim_time', 25 * 60))
         self.non_static_percent = self.get_sim_props_value(sim_props, 'non_static_percent', 5)
+        # Check for static equilibrium every K frames
+        self.static_check_interval = max(
+            int(self.get_sim_props_value(sim_props, 'static_check_interval', 1)), 1)
+        # Logging
+        self.record_telemetry = self.get_sim_props_value(sim_props, 'record_telemetry', False)
+        # Capture of simulated frames for debugging
+        # Fraction of samples to capture (selected deterministically by sample name)
+        self.frame_capture_rate = self.get_sim_props_value(sim_props, 'frame_capture_rate', 0.0)
+        # Capture every K frames
+        self.frame_capture_interval = max(
+            int(self.get_sim_props_value(sim_props, 'frame_capture_interval', 1)), 1)
+        # Quantization step of captured positions (in sim units, cm)
+        self.frame_capture_precision = self.get_sim_props_value(sim_props, 'frame_capture_precision', 0.01)
+
         # Quality filter
         self.max_body_collisions = self.get_sim_props_value(sim_props, 'max_body_collisions', 0)
         self.max_self_collisions = self.get_sim_props_value(sim_props, 'max_self_collisions', 0)
@@ -172,6 +200,19 @@ class SimConfig:
         if not self.attachment_frames or not self.attachment_labels:
             self.enable_attachment_constraint = False
 
+        # Adaptive number of substeps per frame
+        self.enable_adaptive_substeps = self.get_sim_props_value(
+            sim_props_option, 'enable_adaptive_substeps', False)
+        self.adaptive_substeps_min = self.get_sim_props_value(
+            sim_props_option, 'adaptive_substeps_min', 4)
+        self.adaptive_substeps_max = self.get_sim_props_value(
+            sim_props_option, 'adaptive_substeps_max', 40)
+        # Bounds on max particle displacement per substep, relative to fabric thickness
+        self.adaptive_substeps_displacement = self.get_sim_props_value(
+            sim_props_option, 'adaptive_substeps_displacement', [0.05, 0.5])
+        self.adaptive_substeps_calm_frames = self.get_sim_props_value(
+            sim_props_option, 'adaptive_substeps_calm_frames', 10)
+
         # Global damping properties
         self.global_damping_factor = self.get_sim_props_value(
             sim_props_option,'global_damping_factor', 1.) 
@@ -253,6 +294,16 @@ class SimConfig:
             sim_props_material, 'fabric_friction', 0.5
         )
 
+        # Body collision proxies (level-of-detail)
+        self.enable_body_lod = self.get_sim_props_value(
+            sim_props_option, 'enable_body_lod', False)
+        # Fractions of body faces to keep in the proxies
+        self.body_lod_face_ratios = self.get_sim_props_value(
+            sim_props_option, 'body_lod_face_ratios', [0.05, 0.1, 0.25, 0.5])
+        # Max deviation of the proxy from the body surface (in sim units, cm)
+        self.body_lod_max_error = self.get_sim_props_value(
+            sim_props_option, 'body_lod_max_error', 0.5)
+
         # Body material
         self.body_thickness = self.get_sim_props_value(sim_props_option,'body_collision_thickness', 0.0)
         self.body_friction = self.get_sim_props_value(sim_props_option,'body_friction', 0.5)
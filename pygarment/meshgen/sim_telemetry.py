@@ -0,0 +1,81 @@
+"""Lightweight per-frame telemetry of the cloth simulation
+
+    Records one row of statistics per simulated frame and stores them in a columnar .npz file,
+    s.t. simulation parameters (static_threshold, substeps, max_sim_steps, etc.)
+    could be tuned from data
+"""
+from pathlib import Path
+import numpy as np
+
+
+class SimTelemetry:
+    """Collects per-frame simulation statistics column-wise"""
+
+    # Column name -> dtype
+    columns = {
+        'frame': np.int32,
+        'frame_time': np.float32,      # wall-clock time of the frame, s
+        'max_velocity': np.float32,    # over all garment particles
+        'mean_velocity': np.float32,
+        'attached_verts': np.int32,    # vertices under active attachment constraint
+        'body_contacts': np.int32,     # cloth-body soft contacts generated for the frame
+        'smoothing_stage': np.int32,   # number of body smoothing steps recovered so far
+        'non_static': np.int32,        # result of the static check, -1 if not checked this frame
+    }
+
+    def __init__(self):
+        self.rows = {name: [] for name in self.columns}
+
+    def __len__(self):
+        return len(self.rows['frame'])
+
+    def record(self, **values):
+        """Add a row of frame statistics. Missing values are recorded as -1"""
+        for name in self.columns:
+            self.rows[name].append(values.get(name, -1))
+
+    def as_arrays(self):
+        return {name: np.asarray(self.rows[name], dtype=dtype)
+                for name, dtype in self.columns.items()}
+
+    def save(self, path: Path):
+        np.savez_compressed(path, **self.as_arrays())
+
+
+def load_telemetry(path: Path):
+    """Load telemetry columns as a dict of numpy arrays"""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def summarize(telemetry, velocity_threshold=None):
+    """Summary statistics of a single simulation run
+        * telemetry -- dict of columns, as returned by load_telemetry()
+        * velocity_threshold -- if given, reports the first frame
+            when the max velocity of the garment dropped below the threshold
+    """
+    frame_time = telemetry['frame_time']
+    if not len(frame_time):
+        return {'frames': 0}
+
+    summary = {
+        'frames': int(len(frame_time)),
+        'sim_time': float(frame_time.sum()),
+        'frame_time_avg': float(frame_time.mean()),
+        'frame_time_p95': float(np.percentile(frame_time, 95)),
+        'frame_time_max': float(frame_time.max()),
+        'slowest_frame': int(telemetry['frame'][np.argmax(frame_time)]),
+        'max_velocity_peak': float(telemetry['max_velocity'].max()),
+        'max_velocity_final': float(telemetry['max_velocity'][-1]),
+        'mean_velocity_final': float(telemetry['mean_velocity'][-1]),
+    }
+
+    checked = telemetry['non_static'] >= 0
+    if checked.any():
+        summary['non_static_final'] = int(telemetry['non_static'][checked][-1])
+
+    if velocity_threshold is not None:
+        below = np.nonzero(telemetry['max_velocity'] < velocity_threshold)[0]
+        summary['calm_frame'] = int(telemetry['frame'][below[0]]) if len(below) else None
+
+    return summary
@@ -19,6 +19,7 @@ import traceback
 import platform
 import multiprocessing
 import signal
+from concurrent.futures import ThreadPoolExecutor
 import trimesh
 
 # Warp
@@ -26,10 +27,14 @@ import warp as wp
 
 # Custom code
 from pygarment.meshgen.render.pythonrender import render_images
-from pygarment.meshgen.garment import Cloth
+from pygarment.meshgen.garment import Cloth, ClothBatch
 from pygarment.meshgen.sim_config import SimConfig, PathCofig
+from pygarment.meshgen.sim_telemetry import SimTelemetry
+from pygarment.meshgen.frame_capture import FrameCapture, is_captured
+from pygarment.meshgen.mesh_storage import store_positions_only
 
-wp.init()
+# NOTE: warp is initialized on the first simulation (see init_warp()),
+# s.t. the module could be imported without paying for warp startup
 
 class SimulationError(BaseException):
     """To be rised when panel stitching cannot be executed correctly"""
@@ -43,30 +48,64 @@ class SimTimeOutError(BaseException):
     """To be rised when simulation takes too long"""
     pass
 
-def optimize_garment_storage(paths: PathCofig):
+def optimize_garment_storage(paths: PathCofig, storage_format='ply'):
     """Prepare the data element for compact storage: store the meshes as ply instead of obj, 
         remove texture files 
-    """
-    # Objs to ply
-    try:
-        boxmesh = trimesh.load(paths.g_box_mesh)
-        boxmesh.export(paths.g_box_mesh_compressed)
-        paths.g_box_mesh.unlink()
-    except BaseException:
-        pass
 
-    try:
-        simmesh = trimesh.load(paths.g_sim)
-        simmesh.export(paths.g_sim_compressed)
-        paths.g_sim.unlink()
-    except BaseException:
-        pass
+        * storage_format -- 'ply' to store both meshes as .ply files, 
+            'positions' to store the box mesh topology once and only float32 vertex positions of the simulated mesh
+    """
+    if storage_format == 'positions':
+        try:
+            store_positions_only(paths)
+        except BaseException as e:
+            print(f'Sim::WARNING::Storing {paths.sim_tag} as positions failed with {e}. Using ply')
+            storage_format = 'ply'
+
+    if storage_format != 'positions':
+        # Objs to ply
+        try:
+            boxmesh = trimesh.load(paths.g_box_mesh)
+            boxmesh.export(paths.g_box_mesh_compressed)
+            paths.g_box_mesh.unlink()
+        except BaseException:
+            pass
+
+        try:
+            simmesh = trimesh.load(paths.g_sim)
+            simmesh.export(paths.g_sim_compressed)
+            paths.g_sim.unlink()
+        except BaseException:
+            pass
 
     # Remove large texture file and mtl -- not so necessary
     paths.g_texture_fabric.unlink(missing_ok=True)
     paths.g_mtl.unlink(missing_ok=True)
 
 
+def init_warp():
+    """Initialize warp runtime, if not yet initialized"""
+    if wp.context.runtime is None:
+        wp.init()
+
+
+def warm_up(device=None):
+    """Compile all the kernels used by Cloth simulation ahead of time. 
+        Compiled kernels are stored in warp kernel cache, 
+        s.t. new processes could start simulating without waiting for compilation
+    """
+    init_warp()
+    import warp.sim
+    import warp.collision
+    import pygarment.meshgen.garment as garment_module
+
+    start_time = time.time()
+    for module in [warp.sim, warp.collision, garment_module]:
+        wp.load_module(module, device=device, recursive=True)
+    print(f'Sim::INFO::Warp kernels warm-up took {time.time() - start_time:.2f}s. '
+          f'Kernel cache: {wp.config.kernel_cache_dir}')
+
+
 def update_progress(progress, total):
     """Progress bar in console"""
     # https://stackoverflow.com/questions/3173320/text-progress-bar-in-the-console
@@ -115,11 +154,16 @@ def _run_frame_with_timeout(garment, frame_timeout, frame_num):
     except TimeoutError as e:
         raise FrameTimeOutError
 
-def sim_frame_sequence(garment, config, store_usd=False, verbose=False):
+def sim_frame_sequence(
+        garment, config, store_usd=False, verbose=False, 
+        telemetry: SimTelemetry = None, capture: FrameCapture = None):
 
     # Save initial state
     if store_usd:
         garment.render_usd_frame()
+    if capture is not None:
+        capture.record(-1, garment.current_verts, body_vertices=garment.v_body)
+        capture_body_stage = garment.smoothing_stage
 
     start_time = time.time()
     for frame in range(0, config.max_sim_steps):
@@ -130,6 +174,7 @@ def sim_frame_sequence(garment, config, store_usd=False, verbose=False):
             update_progress(frame, config.max_sim_steps)
 
         garment.frame = frame 
+        frame_start_time = time.time()
 
         #Run frame and raise FrameTimeOutError if frame takes too long to simulate
 
@@ -150,8 +195,35 @@ def sim_frame_sequence(garment, config, store_usd=False, verbose=False):
             num_cloth_cloth_contacts = garment.count_self_intersections()
             print(f'\nSelf-Intersection: {num_cloth_cloth_contacts}')
 
-        if frame >= config.zero_gravity_steps and frame >= config.min_sim_steps:
-            static, _ = garment.is_static()
+        if (frame >= config.zero_gravity_steps 
+                and frame >= config.min_sim_steps
+                and frame % config.static_check_interval == 0):
+            static, non_static_count = garment.is_static()
+        else:
+            non_static_count = -1
+
+        if telemetry is not None:
+            # NOTE: Synchronizes with the device on every frame
+            max_velocity, mean_velocity = garment.velocity_stats()
+            telemetry.record(
+                frame=frame,
+                frame_time=time.time() - frame_start_time,
+                max_velocity=max_velocity,
+                mean_velocity=mean_velocity,
+                attached_verts=garment.count_attached(),
+                body_contacts=garment.count_body_contacts(),
+                smoothing_stage=garment.smoothing_stage,
+                non_static=non_static_count
+            )
+
+        if capture is not None and (static or frame % config.frame_capture_interval == 0):
+            # NOTE: Body is only stored when its shape has changed
+            body_changed = garment.smoothing_stage != capture_body_stage
+            capture.record(
+                frame, garment.current_verts, 
+                body_vertices=garment.v_body if body_changed else None)
+            capture_body_stage = garment.smoothing_stage
+
         if static:
             break
 
@@ -160,26 +232,171 @@ def sim_frame_sequence(garment, config, store_usd=False, verbose=False):
             raise SimTimeOutError
         
 
+def sim_batch_frame_sequence(batch: ClothBatch, config, finish_times, verbose=False):
+    """Simulate the garments of the batch until each of them reaches static equilibrium
+        * finish_times -- filled with the time of reaching static equilibrium per garment id
+    """
+    # NOTE: Time limits are given per garment
+    max_sim_time = config.max_sim_time * len(batch.members)
+    max_frame_time = config.max_frame_time * len(batch.members) if config.max_frame_time is not None else None
+
+    start_time = time.time()
+    for frame in range(0, config.max_sim_steps):
+        
+        if verbose:
+            print(f'\n------ Frame {frame + 1} ------')
+        else:
+            update_progress(frame, config.max_sim_steps)
+
+        batch.frame = frame 
+
+        if max_frame_time is None:
+            batch.run_frame()
+        else:
+            _run_frame_with_timeout(
+                batch, 
+                frame_timeout=max_frame_time if frame > 0 else max_frame_time * 2,
+                frame_num=frame
+            )
+
+        if frame >= config.zero_gravity_steps and frame % config.static_check_interval == 0:
+            for i, (static, _) in enumerate(batch.members_static()):
+                member = batch.members[i]
+                if static and not batch.frozen[i] and frame >= member.config.min_sim_steps:
+                    print(f'\n{member.name} is static at frame {frame}')
+                    batch.freeze(i)
+                    finish_times[i] = time.time()
+
+        if batch.frozen.all():
+            break
+
+        runtime = time.time() - start_time
+        if runtime > max_sim_time:
+            raise SimTimeOutError
+
+
+def _quality_checks(garment: Cloth, cloth_name, props, config: SimConfig, start_time, non_static_count=None):
+    """Record failures of the finished simulation
+        * non_static_count -- result of the last static check, if already known
+    """
+    sim_props = props['sim']
+
+    if garment.frame == config.max_sim_steps - 1:
+        non_st_count = non_static_count if non_static_count is not None else garment.is_static()[1]
+        print('\nFailed to achieve static equilibrium for {} with {} non-static vertices out of {}'.format(
+            cloth_name, non_st_count, len(garment.current_verts)))
+        props.add_fail('sim', 'static_equilibrium', cloth_name)
+
+    if time.time() - start_time < 0.5:  # 0.5 sec  -- finished suspiciously fast
+        props.add_fail('sim', 'fast_finish', cloth_name)
+
+    # 3D penetrations
+    num_body_collisions = garment.count_body_intersections()
+    print("BODY CLOTH INTERSECTIONS: ", num_body_collisions)
+    num_self_collisions = garment.count_self_intersections()
+
+    sim_props['stats']['body_collisions'][cloth_name] = num_body_collisions
+    sim_props['stats']['self_collisions'][cloth_name] = num_self_collisions
+
+    if num_body_collisions > config.max_body_collisions:
+        props.add_fail('sim', 'cloth_body_intersection', cloth_name)
+    if num_self_collisions: 
+        print(f'Self-Intersecting with {num_self_collisions}, '
+              f'is fail: {num_self_collisions > config.max_self_collisions}')
+        if num_self_collisions > config.max_self_collisions:
+            props.add_fail('sim', 'cloth_self_intersection', cloth_name)
+    else:
+        print('Not self-intersecting!!!')
+
+
+def _save_frame(garment: Cloth, save_v_norms):
+    """Save the simulated garment. Returns the time it took"""
+    start_time = time.time()
+    with garment.timer.span('save_frame'):
+        garment.save_frame(save_v_norms=save_v_norms) #saving after stats
+    return time.time() - start_time
+
+
+def _store_results(
+        garment: Cloth, cloth_name, props, paths: PathCofig, sim_time, 
+        save_v_norms=False, optimize_storage=False, storage_format='ply'):
+    """Record sim stats, save and render the simulated garment 
+        (unless 'inline_render' is disabled in the render config)"""
+    sim_props = props['sim']
+    render_props = props['render']
+
+    frame = garment.frame
+    print(f"\nSimulation took #frames={frame + 1}")
+
+    sim_props['stats']['sim_time'][cloth_name] = sim_time
+    sim_props['stats']['spf'][cloth_name] = sim_time / frame if frame else sim_time
+    sim_props['stats']['fin_frame'][cloth_name] = frame
+    sim_props['stats'].setdefault('total_substeps', {})[cloth_name] = garment.total_substeps
+
+    if 'inline_render' in render_props['config'] and not render_props['config']['inline_render']:
+        # Rendered separately, e.g. with post_processing_scripts/render_dataset.py
+        save_time = _save_frame(garment, save_v_norms)
+    else:
+        # Render images from memory while the garment is being saved
+        # NOTE: Host copy of the vertices is made here, before the threads use it
+        garment_arrays = garment.render_arrays()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            saved = pool.submit(_save_frame, garment, save_v_norms)
+            s_time = time.time()
+            with garment.timer.span('render'):
+                render_images(
+                    paths, garment.v_body, garment.f_body, render_props['config'], 
+                    garment_arrays=garment_arrays)
+            render_image_time = time.time() - s_time
+            save_time = saved.result()
+        render_props['stats']['render_time'][cloth_name] = render_image_time  
+        print(f"Rendering {cloth_name} took {render_image_time}s")
+
+    if optimize_storage:
+        s_time = time.time()
+        with garment.timer.span('optimize_storage'):
+            optimize_garment_storage(paths, storage_format=storage_format)
+        save_time += time.time() - s_time
+
+    # NOTE: Recorded only after the results are stored: 
+    # marks the sample as completed when the processing is resumed after a crash (see init_sim_props())
+    sim_props['stats'].setdefault('save_time', {})[cloth_name] = save_time
+
+    # Stage profile, in addition to the box mesh generation stages
+    stage_time = sim_props['stats'].setdefault('stage_time', {})
+    stage_time.setdefault(cloth_name, {}).update(garment.timer.as_stats('sim.'))
+
+
 def run_sim(
         cloth_name, props, paths: PathCofig, 
         save_v_norms=False, store_usd=False, 
         optimize_storage=False,
+        storage_format='ply',
         verbose=False): 
     """Initialize and run the simulation
     !! Important !! 
         'store_usd' parameter slows down the simulation to CPU rates because of required CPU-GPU copies and file writes. Use only for debugging
     """
     sim_props = props['sim']
-    render_props = props['render']
 
+    init_warp()
     start_time = time.time()
 
     config = SimConfig(sim_props['config'])   # Why separate class at all? 
     garment = Cloth(cloth_name, config, paths, caching=store_usd)
+    telemetry = SimTelemetry() if config.record_telemetry else None
+    capture = None
+    if is_captured(cloth_name, config.frame_capture_rate):
+        capture = FrameCapture(
+            paths.g_sim_capture, garment.f_cloth, garment.f_body, 
+            precision=config.frame_capture_precision)
 
     try:
         print("Simulation..")
-        sim_frame_sequence(garment, config, store_usd, verbose=verbose)
+        with garment.timer.span('frames'):
+            sim_frame_sequence(
+                garment, config, store_usd, verbose=verbose, 
+                telemetry=telemetry, capture=capture)
     
     except FrameTimeOutError:
         print(f"FrameTimeOutError at frame {garment.frame}")
@@ -204,55 +421,108 @@ def run_sim(
         traceback.print_exc()
         props.add_fail('sim', 'crashes', cloth_name)
     else:  # Other quality checks
-        if garment.frame == config.max_sim_steps - 1:
-            _, non_st_count = garment.is_static()
-            print('\nFailed to achieve static equilibrium for {} with {} non-static vertices out of {}'.format(
-                cloth_name, non_st_count, len(garment.current_verts)))
-            props.add_fail('sim', 'static_equilibrium', cloth_name)
-
-        if time.time() - start_time < 0.5:  # 0.5 sec  -- finished suspiciously fast
-            props.add_fail('sim', 'fast_finish', cloth_name)
-
-        # 3D penetrations
-        num_body_collisions = garment.count_body_intersections()
-        print("BODY CLOTH INTERSECTIONS: ", num_body_collisions)
-        num_self_collisions = garment.count_self_intersections()
-
-        sim_props['stats']['body_collisions'][cloth_name] = num_body_collisions
-        sim_props['stats']['self_collisions'][cloth_name] = num_self_collisions
-
-        if num_body_collisions > config.max_body_collisions:
-            props.add_fail('sim', 'cloth_body_intersection', cloth_name)
-        if num_self_collisions: 
-            print(f'Self-Intersecting with {num_self_collisions}, '
-                  f'is fail: {num_self_collisions > config.max_self_collisions}')
-            if num_self_collisions > config.max_self_collisions:
-                props.add_fail('sim', 'cloth_self_intersection', cloth_name)
-        else:
-            print('Not self-intersecting!!!')
+        with garment.timer.span('quality_checks'):
+            _quality_checks(garment, cloth_name, props, config, start_time)
 
     # ---- Postprocessing ----
     # NOTE: Attempt even on failures for accurate picture and post-analysis
-    frame = garment.frame
-    print(f"\nSimulation took #frames={frame + 1}")
+    if capture is not None:
+        capture.close()
+    if telemetry is not None:
+        telemetry.save(paths.g_sim_telemetry)
+    _store_results(
+        garment, cloth_name, props, paths, time.time() - start_time, 
+        save_v_norms=save_v_norms, 
+        optimize_storage=optimize_storage, 
+        storage_format=storage_format)
 
-    sim_props['stats']['sim_time'][cloth_name] = sim_time = time.time() - start_time
-    sim_props['stats']['spf'][cloth_name] = sim_time / frame if frame else sim_time
-    sim_props['stats']['fin_frame'][cloth_name] = frame
+    # Final info output
+    sec = round(time.time() - start_time, 3)
+    min = int(sec / 60)
+    print(f"\nSimulation pipeline took: {min} m {sec - min * 60} s")
 
-    garment.save_frame(save_v_norms=save_v_norms) #saving after stats
 
-    # Render images
-    s_time = time.time()
-    render_images(paths, garment.v_body, garment.f_body, render_props['config'])
-    render_image_time = time.time() - s_time
-    render_props['stats']['render_time'][cloth_name] = render_image_time  
-    print(f"Rendering {cloth_name} took {render_image_time}s")
+def run_sim_batch(
+        cloth_names, props, paths_list, 
+        save_v_norms=False, 
+        optimize_storage=False,
+        storage_format='ply',
+        spacing=300.,
+        verbose=False):
+    """Simulate several garments in a single model (see ClothBatch) 
+        and store the results of each of them as if simulated separately
+    """
+    sim_props = props['sim']
 
-    if optimize_storage:
-        optimize_garment_storage(paths)
+    config = SimConfig(sim_props['config'])
+    unsupported = ClothBatch.unsupported(config)
+    if unsupported:
+        print(f'Sim::WARNING::Batched simulation does not support {unsupported}. Simulating individually')
+        for cloth_name, paths in zip(cloth_names, paths_list):
+            run_sim(
+                cloth_name, props, paths, 
+                save_v_norms=save_v_norms, 
+                optimize_storage=optimize_storage, 
+                storage_format=storage_format,
+                verbose=verbose)
+        return
+
+    init_warp()
+    start_time = time.time()
+
+    if config.record_telemetry or config.frame_capture_rate:
+        print('Sim::WARNING::Telemetry and frame capture are not supported for batched simulation')
+    batch = ClothBatch(cloth_names, config, paths_list, spacing=spacing)
+    finish_times = {}
+    failure = None
+
+    try:
+        print(f"Simulation of {len(cloth_names)} garments..")
+        with batch.timer.span('frames'):
+            sim_batch_frame_sequence(batch, config, finish_times, verbose=verbose)
+    except FrameTimeOutError:
+        print(f"FrameTimeOutError at frame {batch.frame}")
+        failure = 'frame_timeout'
+    except SimTimeOutError:
+        print("SimTimeOutError")
+        failure = 'simulation_timeout'
+    except SimulationError:
+        print("Simulation failed")
+        failure = 'gt_edges_creation'
+    except BaseException as e:
+        print(f'Sim::{batch.name}::crashed with {e}')
+
+        if isinstance(e, KeyboardInterrupt):
+            # It's not a real crash, so don't write down the failure
+            raise e
+
+        traceback.print_exc()
+        failure = 'crashes'
+
+    batch.finish()
+    # NOTE: Garments that reached equilibrium before the failure are not affected by it
+    non_static = batch.members_static() if failure is None else None
+
+    for i, member in enumerate(batch.members):
+        print(f'\n------ {member.name} ------')
+        if failure is not None and not batch.frozen[i]:
+            props.add_fail('sim', failure, member.name)
+        else:
+            with member.timer.span('quality_checks'):
+                _quality_checks(
+                    member, member.name, props, member.config, start_time, 
+                    non_static_count=non_static[i][1] if non_static is not None else None)
+
+        _store_results(
+            member, member.name, props, member.paths, 
+            finish_times.get(i, time.time()) - start_time, 
+            save_v_norms=save_v_norms, 
+            optimize_storage=optimize_storage, 
+            storage_format=storage_format)
+        # NOTE: Stages of the whole batch are shared by its members
+        sim_props['stats']['stage_time'][member.name].update(batch.timer.as_stats('sim.batch.'))
 
     # Final info output
     sec = round(time.time() - start_time, 3)
     min = int(sec / 60)
-    print(f"\nSimulation pipeline took: {min} m {sec - min * 60} s")
+    print(f"\nSimulation pipeline of {len(cloth_names)} garments took: {min} m {sec - min * 60} s")
@@ -0,0 +1,39 @@
+"""Lightweight span profiler of the processing stages of a sample"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+
+class StageTimer:
+    """Accumulates wall-clock time of named processing stages.
+        Nested spans are named with the path of the enclosing spans, e.g. 'build_stage.panel_assignment'.
+        Spans could be recorded from several threads, each thread has its own nesting
+    """
+    def __init__(self):
+        self.times = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name):
+        stack = self._stack
+        stack.append(name)
+        full_name = '.'.join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.times[full_name] = self.times.get(full_name, 0.) + time.perf_counter() - start
+            stack.pop()
+
+    def as_stats(self, prefix=''):
+        """Stage times to be stored in sample stats"""
+        return {f'{prefix}{name}': value for name, value in self.times.items()}
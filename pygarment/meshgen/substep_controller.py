@@ -0,0 +1,60 @@
+"""Adaptive control of the number of XPBD substeps per simulation frame"""
+import math
+
+
+class SubstepController:
+    """Chooses the number of substeps for the next frame based on the
+        max particle displacement observed in the last frame.
+
+        * Displacement per substep above the upper bound -- the frame was too violent,
+            substeps are increased right away
+        * Displacement per substep below the lower bound for a number of consecutive frames --
+            the garment is calm, substeps are gradually reduced
+        * Known perturbations of the scene (gravity activation, attachment release, body shape updates)
+            switch to the max number of substeps in advance
+    """
+    def __init__(self, min_substeps, max_substeps, displacement_bounds, calm_frames=10):
+        """
+            * min_substeps, max_substeps -- bounds on the number of substeps
+            * displacement_bounds -- (lower, upper) bounds of max particle displacement per substep (in sim units)
+            * calm_frames -- number of consecutive calm frames required to reduce substeps
+        """
+        if min_substeps < 1 or max_substeps < min_substeps:
+            raise ValueError(
+                f'{self.__class__.__name__}::ERROR::Invalid substep bounds: [{min_substeps}, {max_substeps}]')
+        self.min_substeps = int(min_substeps)
+        self.max_substeps = int(max_substeps)
+        self.low_displacement, self.high_displacement = displacement_bounds
+        self.calm_frames = calm_frames
+
+        self._calm_count = 0
+
+    def clamp(self, substeps):
+        return min(max(int(substeps), self.min_substeps), self.max_substeps)
+
+    def perturbed(self):
+        """Substeps to use for a frame with a known perturbation of the scene"""
+        self._calm_count = 0
+        return self.max_substeps
+
+    def update(self, max_displacement, substeps):
+        """Number of substeps for the next frame given the max displacement
+            of particles in the last frame simulated with 'substeps'
+        """
+        step_displacement = max_displacement / substeps
+
+        if step_displacement > self.high_displacement:
+            self._calm_count = 0
+            # Scale to get the displacement per substep back within bounds
+            target = 0.5 * (self.low_displacement + self.high_displacement)
+            return self.clamp(math.ceil(max_displacement / target))
+
+        if step_displacement < self.low_displacement:
+            self._calm_count += 1
+            if self._calm_count >= self.calm_frames:
+                self._calm_count = 0
+                return self.clamp(math.floor(substeps * 0.75))
+        else:
+            self._calm_count = 0
+
+        return substeps
@@ -0,0 +1,91 @@
+"""Batched simulation (ClothBatch) against simulating the same garments one by one
+
+    Requires the warp fork with warp.sim and system.json with the paths to the default bodies
+
+    How to use:
+        python -m pytest test_batch_sim.py
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+import trimesh
+
+pytest.importorskip('warp.sim')
+if not Path('./system.json').exists():
+    pytest.skip('system.json is required for the body paths', allow_module_level=True)
+
+import pygarment.data_config as data_config
+from pygarment.meshgen.boxmeshgen import BoxMesh
+from pygarment.meshgen.sim_config import PathCofig
+from pygarment.meshgen.simulation import run_sim, run_sim_batch
+
+
+_patterns = ['shirt_mean', 'dress_pencil', 'js_mean_all']
+_patterns_path = Path('./assets/Patterns')
+
+# Tolerance of the final vertex positions (cm) and of the final frame
+_mean_tol, _p95_tol, _frame_tol = 0.5, 2., 5
+
+
+def _props():
+    props = data_config.Properties('./assets/Sim_props/default_sim_props.yaml')
+    sim_config = props['sim']['config']
+    # Options not supported for batches
+    sim_config['options']['enable_cloth_reference_drag'] = False
+    sim_config['options']['enable_global_collision_filter'] = False
+    sim_config['resolution_scale'] = 0.5   # Small garments
+    props['render']['config']['inline_render'] = False
+    props.set_section_stats(
+        'sim', fails={}, sim_time={}, spf={}, fin_frame={}, body_collisions={}, self_collisions={})
+    props.set_section_stats('render', render_time={})
+    return props
+
+
+def _box_meshes(props, out_path):
+    paths_list = []
+    for name in _patterns:
+        paths = PathCofig(_patterns_path, out_path, name, body_name='mean_all')
+        box_mesh = BoxMesh(paths.in_g_spec, props['sim']['config']['resolution_scale'])
+        box_mesh.load()
+        box_mesh.serialize(paths, store_panels=False, uv_config=props['render']['config']['uv_texture'])
+        paths_list.append(paths)
+    return paths_list
+
+
+def _sim_vertices(paths):
+    return np.asarray(trimesh.load(paths.g_sim, process=False).vertices)
+
+
+@pytest.fixture(scope='module')
+def simulated(tmp_path_factory):
+    out_path = tmp_path_factory.mktemp('batch_sim')
+
+    separate_props = _props()
+    separate_paths = _box_meshes(separate_props, out_path / 'separate')
+    for name, paths in zip(_patterns, separate_paths):
+        run_sim(name, separate_props, paths)
+
+    batch_props = _props()
+    batch_paths = _box_meshes(batch_props, out_path / 'batch')
+    run_sim_batch(_patterns, batch_props, batch_paths)
+
+    return separate_props, separate_paths, batch_props, batch_paths
+
+
+@pytest.mark.parametrize('garment_id', range(len(_patterns)))
+def test_same_result(simulated, garment_id):
+    separate_props, separate_paths, batch_props, batch_paths = simulated
+    name = _patterns[garment_id]
+
+    separate_stats, batch_stats = separate_props['sim']['stats'], batch_props['sim']['stats']
+    assert abs(separate_stats['fin_frame'][name] - batch_stats['fin_frame'][name]) <= _frame_tol
+    assert ([c for c, names in separate_stats['fails'].items() if name in names]
+            == [c for c, names in batch_stats['fails'].items() if name in names])
+
+    separate_v = _sim_vertices(separate_paths[garment_id])
+    batch_v = _sim_vertices(batch_paths[garment_id])
+    assert separate_v.shape == batch_v.shape
+    deviation = np.linalg.norm(separate_v - batch_v, axis=1)
+    assert deviation.mean() < _mean_tol
+    assert np.percentile(deviation, 95) < _p95_tol
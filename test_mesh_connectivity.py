@@ -0,0 +1,49 @@
+"""CSR mesh connectivity against the per-face list builder it replaces
+
+    How to use:
+        python -m pytest test_mesh_connectivity.py
+"""
+import numpy as np
+import pytest
+
+from pygarment.meshgen.mesh_connectivity import vertex_vertex_csr, vertex_vertex_lists, CSRAdjacency
+
+
+def _grid_mesh(rows, cols):
+    """Triangulated grid, similar in structure to the box meshes"""
+    ids = np.arange(rows * cols).reshape(rows, cols)
+    a, b, c, d = ids[:-1, :-1].ravel(), ids[:-1, 1:].ravel(), ids[1:, :-1].ravel(), ids[1:, 1:].ravel()
+    faces = np.concatenate([np.stack([a, b, c], axis=1), np.stack([b, d, c], axis=1)])
+    return rows * cols, faces
+
+
+def _random_mesh(num_verts, num_faces, seed):
+    """Arbitrary triangles, incl. isolated vertices and repeated edges"""
+    rng = np.random.default_rng(seed)
+    faces = np.stack([rng.choice(num_verts, 3, replace=False) for _ in range(num_faces)])
+    return num_verts, faces
+
+
+@pytest.mark.parametrize('num_verts, faces', [
+    _grid_mesh(2, 2), _grid_mesh(17, 33), _random_mesh(50, 120, 0), _random_mesh(300, 200, 1)])
+def test_same_as_lists(num_verts, faces):
+    expected = vertex_vertex_lists(faces, num_verts)
+
+    offsets, indices = vertex_vertex_csr(faces, num_verts, unique=False)
+    assert len(offsets) == num_verts + 1
+    assert [indices[offsets[i]:offsets[i + 1]].tolist() for i in range(num_verts)] == expected
+
+    # Flat vertex ids, as Cloth stores them
+    adjacency = CSRAdjacency(*vertex_vertex_csr(faces.ravel(), num_verts, unique=False))
+    assert len(adjacency) == num_verts
+    assert list(adjacency) == expected
+    assert adjacency[num_verts // 2] == expected[num_verts // 2]
+
+
+@pytest.mark.parametrize('num_verts, faces', [_grid_mesh(17, 33), _random_mesh(50, 120, 0)])
+def test_unique_neighbours(num_verts, faces):
+    expected = [sorted(set(neighbours)) for neighbours in vertex_vertex_lists(faces, num_verts)]
+
+    adjacency = CSRAdjacency(*vertex_vertex_csr(faces, num_verts, unique=True))
+
+    assert list(adjacency) == expected
@@ -0,0 +1,48 @@
+"""Positions storage format: the simulated garment is restored with its texture coordinates and vertex normals
+
+    How to use:
+        python -m pytest test_mesh_storage.py
+"""
+import numpy as np
+
+from pygarment.meshgen.mesh_storage import (
+    read_obj_topology, read_obj_normals, save_normals, to_trimesh)
+from pygarment.meshgen.render.texture_utils import save_obj
+
+
+# Two triangles sharing an edge that is a UV seam
+_vertices = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.], [1., 1., 0.5]])
+_uvs = np.array([[0., 0.], [1., 0.], [0., 1.], [2., 0.], [3., 0.], [2., 1.]])
+_faces_with_texture = np.array([[0, 0, 1, 1, 2, 2], [1, 3, 3, 4, 2, 5]])
+
+
+def _normals(vertices):
+    normals = vertices + np.array([0., 0., 1.])
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def test_restored_mesh(tmp_path):
+    obj_path = tmp_path / 'garment_sim.obj'
+    save_obj(obj_path, _vertices, _faces_with_texture, _uvs, vert_normals=_normals(_vertices))
+
+    topology = read_obj_topology(obj_path)
+    normals = read_obj_normals(obj_path)
+    save_normals(tmp_path / 'garment_sim_normals.npy', normals)
+    mesh = to_trimesh(topology['vertices'], topology, normals=np.load(tmp_path / 'garment_sim_normals.npy'))
+
+    # Vertices on the seam are split
+    assert len(mesh.vertices) == 6
+    assert len(mesh.faces) == 2
+    ids = [np.flatnonzero((np.asarray(mesh.vertices) == v).all(axis=1))[0] for v in _vertices]
+    assert np.allclose(mesh.vertex_normals[ids], _normals(_vertices), atol=1e-3)
+    assert np.allclose(mesh.visual.uv[ids], _uvs[[0, 1, 2, 4]])
+
+
+def test_no_normals(tmp_path):
+    obj_path = tmp_path / 'garment_sim.obj'
+    save_obj(obj_path, _vertices, _faces_with_texture, _uvs)
+
+    assert len(read_obj_normals(obj_path)) == 0
+    topology = read_obj_topology(obj_path)
+    mesh = to_trimesh(topology['vertices'], topology)
+    assert len(mesh.vertices) == 6
@@ -0,0 +1,47 @@
+"""Resuming the dataset processing: a sample is completed only once its results are saved
+
+    How to use:
+        python -m pytest test_resume_crash_check.py
+"""
+import pytest
+
+import pygarment.data_config as data_config
+from pygarment.meshgen.datasim_utils import init_sim_props
+
+
+def _props(inline_render, saved):
+    props = data_config.Properties()
+    props.set_section_config('sim', resolution_scale=1.0)
+    props.set_section_config('render', inline_render=inline_render)
+    init_sim_props(props)   # New run
+
+    sim_stats = props['sim']['stats']
+    sim_stats['processed'] = ['done', 'last']
+    sim_stats['stop_over'] = []
+    for name in ['done', 'last']:
+        # Sim stats are recorded before the results are saved
+        sim_stats['fin_frame'][name] = 100
+        props['render']['stats']['render_time'][name] = 1.
+    sim_stats['save_time']['done'] = 0.1
+    if saved:
+        sim_stats['save_time']['last'] = 0.1
+    return props
+
+
+@pytest.mark.parametrize('inline_render', [False, True])
+def test_crash_while_saving(inline_render):
+    props = _props(inline_render, saved=False)
+    assert init_sim_props(props, batch_run=True)
+
+    # Simulated again on resume
+    assert props['sim']['stats']['processed'] == ['done']
+    assert props['sim']['stats']['stop_over'] == ['last']
+
+
+@pytest.mark.parametrize('inline_render', [False, True])
+def test_saved_sample(inline_render):
+    props = _props(inline_render, saved=True)
+    assert init_sim_props(props, batch_run=True)
+
+    assert props['sim']['stats']['processed'] == ['done', 'last']
+    assert not props['sim']['stats']['fails']['crashes']
@@ -0,0 +1,133 @@
+"""Shard leases: takeover of stale leases by another node, the stop of the previous owner and shard files written only by the owner
+
+    How to use:
+        python -m pytest test_shard_lease.py
+"""
+import json
+import os
+import time
+
+from pygarment.meshgen.sharding import ShardLease
+
+
+def _age(path, seconds):
+    """Make the last heartbeat of the lease older"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_live_lease_is_exclusive(tmp_path):
+    first = ShardLease(tmp_path / 'shard_0.lease', 0, lease_timeout=100.)
+    second = ShardLease(tmp_path / 'shard_0.lease', 0, lease_timeout=100.)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert not (tmp_path / 'shard_0.lease').exists()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_takeover_of_stale_lease(tmp_path):
+    path = tmp_path / 'shard_0.lease'
+    old = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=0.05)
+    new = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=0.05)
+    assert old.try_acquire()
+    old._stop.set()   # Stalled node: no heartbeats
+    old._thread.join()
+    _age(path, 20.)
+
+    assert new.try_acquire()
+    with open(path) as f:
+        assert json.load(f)['token'] == new.token
+    assert not old.is_owned()
+
+    # The previous owner does not remove the lease of the new one
+    old.release()
+    assert path.exists() and new.is_owned()
+    new.release()
+    assert not path.exists()
+
+
+def test_previous_owner_stops_on_heartbeat(tmp_path):
+    path = tmp_path / 'shard_0.lease'
+    old = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=0.05)
+    new = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=0.05)
+    assert old.try_acquire()
+    # Stale from the point of view of another node, e.g. a long pause of the old one
+    os.rename(path, tmp_path / 'moved')
+    assert new.try_acquire()
+
+    assert old.lost.wait(2.)
+    assert not new.lost.is_set()
+    old.release()
+    assert new.is_owned()
+    new.release()
+
+
+def _late_node(path):
+    """Node that found the lease stale before it was taken over by another node"""
+    node = ShardLease(path, 0, lease_timeout=10.)
+    node._stale_owner = lambda path=None: {'host': 'dead', 'pid': 0, 'time': 0., 'token': 'stale'}
+    return node
+
+
+def test_moved_fresh_lease_is_given_back(tmp_path):
+    path = tmp_path / 'shard_0.lease'
+    owner = ShardLease(path, 0, lease_timeout=10.)
+    assert owner.try_acquire()
+
+    assert not _late_node(path).try_acquire()
+    assert owner.is_owned()
+    assert [p.name for p in tmp_path.iterdir()] == ['shard_0.lease']
+    owner.release()
+
+
+def test_give_back_does_not_overwrite(tmp_path):
+    path = tmp_path / 'shard_0.lease'
+    owner = ShardLease(path, 0, lease_timeout=10.)
+    assert owner.try_acquire()
+
+    # Yet another node creates a lease while the fresh one is moved away
+    other = ShardLease(path, 0, lease_timeout=10.)
+    node = _late_node(path)
+    read_owner = node._read_owner
+    def _read_and_acquire(lease_path):
+        assert other.try_acquire()
+        return read_owner(lease_path)
+    node._read_owner = _read_and_acquire
+
+    assert not node.try_acquire()
+    assert other.is_owned()
+    assert not owner.is_owned()   # Stops on the next heartbeat
+    assert [p.name for p in tmp_path.iterdir()] == ['shard_0.lease']
+    owner.release()
+    assert other.is_owned()
+    other.release()
+
+
+def test_shard_file_is_written_only_by_owner(tmp_path):
+    path = tmp_path / 'shard_0.lease'
+    props_path = tmp_path / 'dataset_properties_shard_0.yaml'
+    old = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=60.)
+    new = ShardLease(path, 0, lease_timeout=10., heartbeat_interval=60.)
+    assert old.try_acquire()
+
+    tmp_props = old.tmp_path(props_path)
+    tmp_props.write_text('old')
+    assert old.commit_file(tmp_props, props_path)
+    assert props_path.read_text() == 'old'
+
+    # Taken over while the old owner writes the next version, before its heartbeat
+    tmp_props.write_text('old, stale')
+    os.rename(path, tmp_path / 'moved')
+    assert new.try_acquire()
+    new_props = new.tmp_path(props_path)
+    new_props.write_text('new')
+    assert new.commit_file(new_props, props_path)
+
+    assert not old.commit_file(tmp_props, props_path)
+    assert old.lost.is_set()
+    assert not tmp_props.exists()
+    assert props_path.read_text() == 'new'
+    old.release()
+    new.release()
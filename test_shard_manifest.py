@@ -0,0 +1,32 @@
+"""Shard manifest: shards balanced by the predicted cost, costs predicted once and reused by the nodes
+
+    How to use:
+        python -m pytest test_shard_manifest.py
+"""
+from pygarment.meshgen.sharding import ShardManifest
+
+
+_costs = {'a': 10., 'b': 1., 'c': 4., 'd': 5., 'e': 2.}
+
+
+def test_costs_are_predicted_once(tmp_path):
+    calls = []
+
+    def predict_costs(names):
+        calls.append(list(names))
+        return [_costs[name] for name in names]
+
+    first = ShardManifest.load_or_create(tmp_path, 'default_body', list(_costs), 2, predict_costs=predict_costs)
+    second = ShardManifest.load_or_create(tmp_path, 'default_body', list(_costs), 2, predict_costs=predict_costs)
+
+    assert len(calls) == 1
+    assert first.costs == second.costs == _costs
+    assert second.shards == first.shards
+    assert sorted(sum(_costs[name] for name in shard) for shard in second.shards) == [11., 11.]
+
+
+def test_hash_shards_without_costs(tmp_path):
+    manifest = ShardManifest.load_or_create(tmp_path, 'default_body', list(_costs), 2)
+
+    assert manifest.costs is None
+    assert sorted(sum(manifest.shards, [])) == sorted(_costs)
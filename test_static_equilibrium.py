@@ -0,0 +1,108 @@
+"""Static equilibrium detection on device (Cloth.is_static) checked every K frames
+    against the previous host-side check after every frame
+
+    How to use:
+        python -m pytest test_static_equilibrium.py
+"""
+import types
+
+import numpy as np
+import pytest
+
+wp = pytest.importorskip('warp')
+
+from pygarment.meshgen.garment import Cloth
+from pygarment.meshgen.simulation import sim_frame_sequence
+
+
+def _config(static_check_interval=1, max_sim_steps=300):
+    return types.SimpleNamespace(
+        max_sim_steps=max_sim_steps,
+        max_frame_time=None,
+        max_sim_time=10000,
+        zero_gravity_steps=5,
+        min_sim_steps=20,
+        static_check_interval=static_check_interval,
+        static_threshold=0.01,
+        non_static_percent=5
+    )
+
+
+def _trajectory(frames=301, particles=500, seed=0):
+    """Particles settling with damped oscillations of different amplitudes and decay rates"""
+    rng = np.random.default_rng(seed)
+    rest = rng.uniform(-50., 50., size=(1, particles, 3))
+    amplitude = rng.uniform(0.5, 5., size=(1, particles, 3))
+    decay = rng.uniform(5., 30., size=(1, particles, 1))
+    phase = rng.uniform(0, 2 * np.pi, size=(1, particles, 3))
+    t = np.arange(frames, dtype=float).reshape(-1, 1, 1)
+    return (rest + amplitude * np.exp(-t / decay) * np.cos(0.3 * t + phase)).astype(np.float32)
+
+
+class _TrajectoryCloth:
+    """Replays the trajectory with the device state handling of Cloth.run_frame()"""
+    is_static = Cloth.is_static
+
+    def __init__(self, trajectory, config):
+        self.trajectory = trajectory
+        self.config = config
+        self.device = 'cpu'
+        self.model = types.SimpleNamespace(particle_count=trajectory.shape[1])
+        self.state_0 = types.SimpleNamespace(
+            particle_q=wp.array(trajectory[0], dtype=wp.vec3, device=self.device))
+        self.prev_particle_q = wp.zeros_like(self.state_0.particle_q)
+        self.non_static_count = wp.zeros(1, dtype=wp.int32, device=self.device)
+        self.has_prev_state = False
+        self.frame = 0
+        self.smoothing_stage = 0
+
+    def run_frame(self):
+        wp.copy(self.prev_particle_q, self.state_0.particle_q)
+        self.has_prev_state = True
+        wp.copy(
+            self.state_0.particle_q,
+            wp.array(self.trajectory[self.frame + 1], dtype=wp.vec3, device=self.device))
+
+
+def _host_stop_frame(trajectory, config):
+    """Stop frame of the previous implementation: host-side L1 check after every frame"""
+    for frame in range(config.max_sim_steps):
+        if frame >= config.zero_gravity_steps and frame >= config.min_sim_steps:
+            diff_L1 = np.sum(np.abs(trajectory[frame + 1] - trajectory[frame]), axis=1)
+            non_static_len = len(diff_L1[diff_L1 > config.static_threshold])
+            if non_static_len == 0 or (
+                    non_static_len < trajectory.shape[1] * 0.01 * config.non_static_percent):
+                return frame
+    return None
+
+
+@pytest.fixture(scope='module', autouse=True)
+def _warp_cpu():
+    wp.init()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_same_stop_frame_every_frame(seed):
+    trajectory = _trajectory(seed=seed)
+    config = _config(static_check_interval=1)
+    expected = _host_stop_frame(trajectory, config)
+    assert expected is not None
+
+    garment = _TrajectoryCloth(trajectory, config)
+    sim_frame_sequence(garment, config)
+
+    assert garment.frame == expected
+
+
+@pytest.mark.parametrize('interval', [2, 5])
+def test_stop_frame_with_interval(interval):
+    trajectory = _trajectory()
+    expected = _host_stop_frame(trajectory, _config(static_check_interval=1))
+
+    config = _config(static_check_interval=interval)
+    garment = _TrajectoryCloth(trajectory, config)
+    sim_frame_sequence(garment, config)
+
+    # Checked only on the frames divisible by the interval, not later than one interval after
+    assert garment.frame % interval == 0
+    assert expected <= garment.frame < expected + interval
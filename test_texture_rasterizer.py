@@ -0,0 +1,49 @@
+"""UV island textures: the PIL rasterizer matches the matplotlib one within pixel tolerance
+
+    How to use:
+        python -m pytest test_texture_rasterizer.py
+"""
+import numpy as np
+import pytest
+import matplotlib
+matplotlib.use('Agg')
+from PIL import Image, ImageFilter
+
+from pygarment.meshgen.render.texture_utils import create_UV_island_texture
+
+
+# Islands of a UV layout of 200 x 120 units: panels of different shapes, a narrow one
+_islands = [
+    [(10, 10), (90, 10), (90, 100), (10, 100)],
+    [(110, 20), (190, 20), (150, 110)],
+    [(20, 105), (60, 105), (60, 115), (20, 115)],
+    [(100, 112), (130, 104), (160, 112), (130, 118)],
+]
+
+
+def _texture(path, rasterizer, dpi, preserve_alpha):
+    create_UV_island_texture(
+        _islands, 200, 120, path, dpi=dpi, preserve_alpha=preserve_alpha, rasterizer=rasterizer)
+    return Image.open(path).convert('RGBA')
+
+
+def _blurred(image):
+    """Color over white and opacity, blurred to ignore the anti-aliasing differences of the edges.
+        NOTE: Colors of the transparent pixels are arbitrary
+    """
+    over_white = Image.alpha_composite(Image.new('RGBA', image.size, (255, 255, 255, 255)), image)
+    channels = np.dstack([np.asarray(over_white.convert('RGB')), np.asarray(image.getchannel('A'))])
+    return np.asarray(Image.fromarray(channels, 'RGBA').filter(ImageFilter.GaussianBlur(2)), dtype=float)
+
+
+@pytest.mark.parametrize('dpi', [200, 400])
+@pytest.mark.parametrize('preserve_alpha', [False, True])
+def test_same_texture(tmp_path, dpi, preserve_alpha):
+    pil = _texture(tmp_path / 'pil.png', 'pil', dpi, preserve_alpha)
+    plotted = _texture(tmp_path / 'matplotlib.png', 'matplotlib', dpi, preserve_alpha)
+
+    assert pil.size == plotted.size
+
+    diff = np.abs(_blurred(pil) - _blurred(plotted))
+    assert diff.mean() < 2.
+    assert np.percentile(diff, 99) < 20.